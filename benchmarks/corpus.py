@@ -0,0 +1,192 @@
+import argparse
+import io
+import json
+import os
+import random
+import struct
+import sys
+
+import piexif
+from PIL import Image
+
+FORMATS = ('JPEG', 'PNG', 'WEBP', 'TIFF')
+
+#(width, height) and how often each size is picked
+SIZES = {
+  'small': ((640, 480), 6),
+  'medium': ((1920, 1080), 3),
+  'large': ((4032, 3024), 1),
+}
+
+#none: no Exif; light: a few camera tags; heavy: a full camera block with
+#GPS, a MakerNote and a thumbnail; mistyped: Orientation stored as ASCII, the
+#kind of tag piexif refuses to dump (safe_dump's retry case); truncated: the
+#Exif IFD pointer runs past the end of the block.
+DENSITIES = ('none', 'light', 'heavy', 'mistyped', 'truncated')
+
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'TIFF': '.tif'}
+
+MANIFEST = 'corpus.json'
+
+
+def _random_bytes(rng, size):
+  #random.randbytes needs Python 3.9
+  return rng.getrandbits(8 * size).to_bytes(size, 'little')
+
+
+def _pixels(rng, size):
+  """A smooth, photo-like image scaled up from a small tile of seeded noise."""
+  tile = Image.frombytes('RGB', (64, 48), _random_bytes(rng, 64 * 48 * 3))
+  return tile.resize(size, Image.BICUBIC)
+
+
+def _thumbnail(rng):
+  out = io.BytesIO()
+  _pixels(rng, (160, 120)).save(out, format='JPEG', quality=75)
+  return out.getvalue()
+
+
+def _rational(value, denominator=100):
+  return (int(value * denominator), denominator)
+
+
+def _exif_dict(rng, density):
+  """Returns the piexif dictionary of a density (None for 'none')."""
+  if density == 'none':
+    return None
+  zeroth = {
+    piexif.ImageIFD.Make: b'Benchcam',
+    piexif.ImageIFD.Model: f"BC-{rng.randint(100, 999)}".encode(),
+    piexif.ImageIFD.Orientation: 1,
+    piexif.ImageIFD.Software: b'benchmarks 1.0',
+    piexif.ImageIFD.DateTime: b'2024:05:17 10:21:07',
+  }
+  exif_dict = {'0th': zeroth, 'Exif': {}, 'GPS': {}, '1st': {}, 'thumbnail': None}
+  if density in ('light', 'mistyped'):
+    return exif_dict
+
+  zeroth.update({
+    piexif.ImageIFD.Artist: b'Jane Doe',
+    piexif.ImageIFD.Copyright: b'(c) Jane Doe',
+    piexif.ImageIFD.ImageDescription: b'Synthetic benchmark image',
+  })
+  exif_dict['Exif'] = {
+    piexif.ExifIFD.DateTimeOriginal: b'2024:05:17 10:21:07',
+    piexif.ExifIFD.DateTimeDigitized: b'2024:05:17 10:21:07',
+    piexif.ExifIFD.ExposureTime: (1, rng.choice((60, 125, 250, 500))),
+    piexif.ExifIFD.FNumber: _rational(rng.choice((1.8, 2.8, 4.0, 8.0)), 10),
+    piexif.ExifIFD.ISOSpeedRatings: rng.choice((100, 200, 400, 1600)),
+    piexif.ExifIFD.FocalLength: _rational(rng.uniform(18, 200), 10),
+    piexif.ExifIFD.LensModel: b'Bench 24-70mm',
+    piexif.ExifIFD.BodySerialNumber: str(rng.randint(10 ** 7, 10 ** 8)).encode(),
+    piexif.ExifIFD.UserComment: b'ASCII\x00\x00\x00' + b'benchmark ' * 20,
+    #maker notes are opaque vendor blobs, often tens of KB
+    piexif.ExifIFD.MakerNote: _random_bytes(rng, rng.randint(4, 32) * 1024),
+  }
+  exif_dict['GPS'] = {
+    piexif.GPSIFD.GPSLatitudeRef: b'N',
+    piexif.GPSIFD.GPSLatitude: ((rng.randint(0, 89), 1), (rng.randint(0, 59), 1), (rng.randint(0, 5999), 100)),
+    piexif.GPSIFD.GPSLongitudeRef: b'E',
+    piexif.GPSIFD.GPSLongitude: ((rng.randint(0, 179), 1), (rng.randint(0, 59), 1), (rng.randint(0, 5999), 100)),
+    piexif.GPSIFD.GPSAltitude: _rational(rng.uniform(0, 3000)),
+    piexif.GPSIFD.GPSDateStamp: b'2024:05:17',
+  }
+  exif_dict['1st'] = {piexif.ImageIFD.JPEGInterchangeFormat: 0, piexif.ImageIFD.JPEGInterchangeFormatLength: 0}
+  exif_dict['thumbnail'] = _thumbnail(rng)
+  return exif_dict
+
+
+def _break(data, density, tiff_start):
+  """Applies a density's damage to the Exif block starting at `tiff_start` in `data`."""
+  endian = '<' if data[tiff_start:tiff_start + 2] == b'II' else '>'
+  if density == 'mistyped':
+    #Orientation from SHORT (3) to ASCII (2)
+    entry = struct.pack(endian + 'HH', 0x0112, 3)
+    return data.replace(entry, struct.pack(endian + 'HH', 0x0112, 2), 1)
+  if density == 'truncated':
+    #the ExifOffset pointer (LONG, count 1) moved far past the block
+    entry = struct.pack(endian + 'HHI', 0x8769, 4, 1)
+    pos = data.find(entry, tiff_start)
+    if pos != -1:
+      pos += len(entry)
+      return data[:pos] + struct.pack(endian + 'I', 0x7FFFFFF0) + data[pos + 4:]
+  return data
+
+
+def make_image(rng, img_format, size_name, density):
+  """Returns the bytes of one synthetic image."""
+  size = SIZES[size_name][0]
+  img = _pixels(rng, size)
+  exif_dict = _exif_dict(rng, density)
+  options = {}
+  if exif_dict is not None:
+    options['exif'] = piexif.dump(exif_dict)
+    #Pillow re-serializes a TIFF's tags, so its damage is done to the written file
+    if img_format != 'TIFF':
+      options['exif'] = _break(options['exif'], density, len(b'Exif\x00\x00'))
+  if img_format in ('JPEG', 'WEBP'):
+    options['quality'] = 85
+  out = io.BytesIO()
+  img.save(out, format=img_format, **options)
+  data = out.getvalue()
+  if img_format == 'TIFF':
+    data = _break(data, density, 0)
+  return data
+
+
+def spec(files, seed, formats=FORMATS):
+  """Describes a corpus; a corpus on disk is reused only when its spec matches."""
+  return {'files': files, 'seed': seed, 'formats': list(formats), 'version': 1}
+
+
+def build_corpus(root, files=200, seed=0, formats=FORMATS):
+  """
+  Writes `files` synthetic images under `root`, mixing formats, sizes and Exif
+  densities. The same seed always gives the same files. A corpus already
+  built there with the same spec is reused as is.
+  Returns the manifest: the spec and, per file, its path and properties.
+  """
+  corpus_spec = spec(files, seed, formats)
+  manifest_path = os.path.join(root, MANIFEST)
+  if os.path.exists(manifest_path):
+    with open(manifest_path) as f:
+      manifest = json.load(f)
+    if manifest.get('spec') == corpus_spec:
+      return manifest
+
+  os.makedirs(root, exist_ok=True)
+  rng = random.Random(seed)
+  size_names = list(SIZES)
+  weights = [SIZES[name][1] for name in size_names]
+  entries = []
+  for index in range(files):
+    img_format = formats[index % len(formats)]
+    density = DENSITIES[(index // len(formats)) % len(DENSITIES)]
+    size_name = rng.choices(size_names, weights)[0]
+    name = f"{index:05d}_{size_name}_{density}{EXTENSIONS[img_format]}"
+    data = make_image(rng, img_format, size_name, density)
+    with open(os.path.join(root, name), 'wb') as f:
+      f.write(data)
+    entries.append({'name': name, 'format': img_format, 'size': size_name, 'density': density, 'bytes': len(data)})
+
+  manifest = {'spec': corpus_spec, 'files': entries}
+  with open(manifest_path, 'w') as f:
+    json.dump(manifest, f, indent=1)
+  return manifest
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog="python -m benchmarks.corpus", description="Builds a synthetic benchmark corpus.")
+  parser.add_argument("root", metavar="DIR", help="directory to build the corpus in")
+  parser.add_argument("--files", type=int, default=200, help="number of files (default: 200)")
+  parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+  parser.add_argument("--formats", default=",".join(FORMATS), help="comma-separated formats")
+  args = parser.parse_args(argv)
+  formats = tuple(name.strip().upper() for name in args.formats.split(','))
+  manifest = build_corpus(args.root, files=args.files, seed=args.seed, formats=formats)
+  print(f"{len(manifest['files'])} file(s) in {args.root}", file=sys.stderr)
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
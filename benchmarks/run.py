@@ -0,0 +1,304 @@
+#benchmarks scrub throughput, per-file latency, peak memory and audit-log cost:
+#  python -m benchmarks.run                          (every mode, 1 and N workers)
+#  python -m benchmarks.run --files 1000 --workers 1,2,8 --output after.json
+#  python -m benchmarks.run --baseline before.json   (compares against an earlier run)
+#each case runs in a fresh process on its own copy of the corpus and its own
+#scratch database, so peak RSS and database cost are not carried between cases.
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+  import resource
+except ImportError:
+  #not available on Windows; RSS is then left out
+  resource = None
+
+from .corpus import FORMATS, MANIFEST, spec
+
+#scrub options of each mode; tag lists are what the selective and profile runs remove
+MODES = {
+  'remove_all': {'remove_all': True},
+  'selective': {'tags': ['GPSInfo', 'Make', 'Model', 'DateTime*']},
+  'profile': {'profile': ['all GPS', 'all camera', 'all serials', 'all author']},
+  'in_place': {'remove_all': True, 'in_place': True},
+}
+
+DEFAULT_CORPUS = os.path.join(tempfile.gettempdir(), 'privacy_guard_bench_corpus')
+
+#a case counts as a regression when it is this much slower than the baseline
+DEFAULT_THRESHOLD = 10.0
+
+
+def timed_scrub(file_path, tags_to_remove, remove_all, in_place):
+  """Scrubs one file in a worker. Returns the ScrubResult and the seconds it took."""
+  from lib.batch import scrub_one
+  start = time.perf_counter()
+  result = scrub_one(file_path, tags_to_remove, remove_all, in_place)
+  return result, time.perf_counter() - start
+
+
+def percentile(values, q):
+  """Nearest-rank percentile of a list of numbers (q between 0 and 100)."""
+  if not values:
+    return None
+  ordered = sorted(values)
+  rank = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+  return ordered[rank]
+
+
+def _peak_rss_mb(who):
+  if resource is None:
+    return None
+  peak = resource.getrusage(who).ru_maxrss
+  #kilobytes on Linux, bytes on macOS
+  return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_case(corpus_dir, mode, workers):
+  """
+  Runs one mode over a private copy of the corpus, logging results the way the
+  CLI does (AuditWriter in this process, scrubbing in the pool). Meant to run
+  in a fresh process with PRIVACY_GUARD_DB set. Returns the measurements.
+  """
+  from lib.batch import map_files
+  from lib.db.audit import AuditWriter
+  from lib.db.database import get_db_session
+  from lib.db.models import Profile
+  from lib.matcher import compile_tags, matcher_for_profile
+
+  options = MODES[mode]
+  session = get_db_session()
+  profile_id = None
+  tags_to_remove = compile_tags(options.get('tags'))
+  if 'profile' in options:
+    profile = Profile.create(session, 'Benchmark', 'benchmark profile', options['profile'])
+    tags_to_remove = matcher_for_profile(profile)
+    profile_id = profile.id
+
+  with open(os.path.join(corpus_dir, MANIFEST)) as f:
+    names = [entry['name'] for entry in json.load(f)['files']]
+  work_dir = os.path.dirname(os.environ['PRIVACY_GUARD_DB'])
+  file_paths = []
+  for name in names:
+    file_path = os.path.join(work_dir, name)
+    shutil.copyfile(os.path.join(corpus_dir, name), file_path)
+    file_paths.append(file_path)
+  input_bytes = sum(os.path.getsize(file_path) for file_path in file_paths)
+
+  audit = AuditWriter(session)
+  latencies = []
+  statuses = {'scrubbed': 0, 'unchanged': 0, 'failed': 0}
+  db_seconds = 0.0
+  args = (tags_to_remove, options.get('remove_all', False), options.get('in_place', False))
+
+  start = time.perf_counter()
+  for result, seconds in map_files(timed_scrub, file_paths, args, workers):
+    latencies.append(seconds)
+    #files without metadata come back with a message but an empty dict
+    if result.removed_data is None:
+      statuses['failed'] += 1
+      continue
+    if not result.removed_data:
+      statuses['unchanged'] += 1
+      continue
+    statuses['scrubbed'] += 1
+    db_start = time.perf_counter()
+    audit.add(result.file_path, result.processed_path, result.removed_data, profile_id)
+    db_seconds += time.perf_counter() - db_start
+  db_start = time.perf_counter()
+  audit.flush()
+  db_seconds += time.perf_counter() - db_start
+  elapsed = time.perf_counter() - start
+
+  files = len(file_paths)
+  return {
+    'mode': mode,
+    'workers': workers,
+    'files': files,
+    'input_mb': round(input_bytes / (1024 * 1024), 1),
+    'seconds': round(elapsed, 3),
+    'files_per_sec': round(files / elapsed, 1) if elapsed else None,
+    'p50_ms': round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+    'p99_ms': round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+    'peak_rss_mb': _peak_rss_mb(resource.RUSAGE_SELF) if resource else None,
+    #a single worker scrubs inline, in this process
+    'peak_worker_rss_mb': _peak_rss_mb(resource.RUSAGE_CHILDREN) if resource and workers > 1 else None,
+    'db_seconds': round(db_seconds, 3),
+    'db_ms_per_file': round(db_seconds * 1000 / files, 3) if files else None,
+    'db_mb': round(os.path.getsize(os.environ['PRIVACY_GUARD_DB']) / (1024 * 1024), 2),
+    **statuses,
+  }
+
+
+def _run_module(args, env=None):
+  """Runs a module of this package in a fresh interpreter from the repository root. Returns its stdout."""
+  root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  completed = subprocess.run(
+    [sys.executable, '-m'] + args, cwd=root, env=env,
+    stdout=subprocess.PIPE, universal_newlines=True, check=True
+  )
+  return completed.stdout
+
+
+def load_corpus(corpus_dir, files, seed, formats):
+  """
+  Returns the manifest of the corpus, building it first if needed. Building
+  runs in its own process: decoding large images would otherwise raise the
+  peak RSS that every case inherits from this one.
+  """
+  _run_module([
+    'benchmarks.corpus', corpus_dir, '--files', str(files), '--seed', str(seed), '--formats', ','.join(formats)
+  ])
+  with open(os.path.join(corpus_dir, MANIFEST)) as f:
+    manifest = json.load(f)
+  if manifest['spec'] != spec(files, seed, formats):
+    raise RuntimeError(f"Corpus in {corpus_dir} does not match the requested spec.")
+  return manifest
+
+
+def spawn_case(corpus_dir, mode, workers):
+  """Runs a case in a fresh interpreter with a scratch database. Returns its measurements."""
+  work_dir = tempfile.mkdtemp(prefix='privacy_guard_bench_')
+  try:
+    env = dict(os.environ, PRIVACY_GUARD_DB=os.path.join(work_dir, 'bench.db'), PYTHONWARNINGS='ignore')
+    output = _run_module(['benchmarks.run', '--case', mode, str(workers), corpus_dir], env=env)
+    return json.loads(output.strip().splitlines()[-1])
+  finally:
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _git_commit():
+  try:
+    return subprocess.run(
+      ['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+      universal_newlines=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    ).stdout.strip() or None
+  except OSError:
+    return None
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+  """
+  Matches cases by mode and workers against a baseline run.
+  Returns a row per case with the relative changes, and whether any case
+  lost more than `threshold` percent of its throughput.
+  """
+  before = {(case['mode'], case['workers']): case for case in baseline['results']}
+  rows = []
+  regressed = False
+  for case in results:
+    old = before.get((case['mode'], case['workers']))
+    if old is None:
+      continue
+    row = {'mode': case['mode'], 'workers': case['workers']}
+    for key in ('files_per_sec', 'p50_ms', 'p99_ms', 'peak_rss_mb', 'db_ms_per_file'):
+      if old.get(key) and case.get(key) is not None:
+        row[key] = round((case[key] - old[key]) * 100 / old[key], 1)
+    if row.get('files_per_sec') is not None and row['files_per_sec'] < -threshold:
+      regressed = True
+    rows.append(row)
+  return rows, regressed
+
+
+def _print_results(results, changes=None):
+  from rich.console import Console
+  from rich.table import Table
+
+  changes = {(row['mode'], row['workers']): row for row in (changes or [])}
+
+  def cell(case, key):
+    value = case.get(key)
+    text = '-' if value is None else str(value)
+    change = changes.get((case['mode'], case['workers']), {}).get(key)
+    return text if change is None else f"{text} ({change:+}%)"
+
+  table = Table(title="Scrub Benchmarks", show_header=True, header_style="bold magenta")
+  columns = {
+    'files_per_sec': "Files/s",
+    'p50_ms': "p50 ms",
+    'p99_ms': "p99 ms",
+    'peak_rss_mb': "RSS MB",
+    'peak_worker_rss_mb': "Worker RSS MB",
+    'db_ms_per_file': "DB ms/file",
+    'failed': "Failed",
+  }
+  table.add_column("Mode")
+  table.add_column("Workers", justify="right")
+  for title in columns.values():
+    table.add_column(title, justify="right")
+  for case in results:
+    table.add_row(case['mode'], str(case['workers']), *(cell(case, column) for column in columns))
+  Console(stderr=True).print(table)
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description="Benchmarks the scrubber.")
+  parser.add_argument("--files", type=int, default=200, help="number of files in the synthetic corpus (default: 200)")
+  parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic corpus (default: 0)")
+  parser.add_argument("--formats", default=",".join(FORMATS), help="comma-separated formats of the corpus")
+  parser.add_argument("--corpus", default=DEFAULT_CORPUS, metavar="DIR", help="where the corpus is built and reused")
+  parser.add_argument("--modes", default=",".join(MODES), help="comma-separated modes to run")
+  parser.add_argument("--workers", default=f"1,{os.cpu_count() or 1}", help="comma-separated pool sizes (default: 1 and CPU count)")
+  parser.add_argument("--output", "-o", default="benchmark-results.json", metavar="FILE", help="where to save the results")
+  parser.add_argument("--baseline", metavar="FILE", help="results of an earlier run to compare against")
+  parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, metavar="PCT",
+                      help="exit 1 if a case's throughput drops more than PCT percent below the baseline")
+  parser.add_argument("--case", nargs=3, metavar=("MODE", "WORKERS", "CORPUS"), help=argparse.SUPPRESS)
+  args = parser.parse_args(argv)
+
+  if args.case:
+    mode, workers, corpus_dir = args.case
+    print(json.dumps(run_case(corpus_dir, mode, int(workers))))
+    return 0
+
+  formats = tuple(name.strip().upper() for name in args.formats.split(','))
+  manifest = load_corpus(args.corpus, args.files, args.seed, formats)
+  modes = [mode.strip() for mode in args.modes.split(',')]
+  unknown = [mode for mode in modes if mode not in MODES]
+  if unknown:
+    parser.error(f"unknown mode(s): {', '.join(unknown)}")
+  pool_sizes = sorted({int(size) for size in args.workers.split(',')})
+
+  results = []
+  for mode in modes:
+    for workers in pool_sizes:
+      print(f"{mode} with {workers} worker(s)...", file=sys.stderr)
+      results.append(spawn_case(args.corpus, mode, workers))
+
+  report = {
+    'meta': {
+      'date': datetime.datetime.now().isoformat(timespec='seconds'),
+      'commit': _git_commit(),
+      'python': platform.python_version(),
+      'platform': platform.platform(),
+      'cpu_count': os.cpu_count(),
+      'corpus': manifest['spec'],
+      'corpus_mb': round(sum(entry['bytes'] for entry in manifest['files']) / (1024 * 1024), 1),
+    },
+    'results': results,
+  }
+  with open(args.output, 'w') as f:
+    json.dump(report, f, indent=2)
+
+  changes, regressed = None, False
+  if args.baseline:
+    with open(args.baseline) as f:
+      changes, regressed = compare(results, json.load(f), args.threshold)
+    report['comparison'] = {'baseline': args.baseline, 'changes_pct': changes}
+    with open(args.output, 'w') as f:
+      json.dump(report, f, indent=2)
+  _print_results(results, changes)
+  print(f"Results saved to {args.output}", file=sys.stderr)
+  return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,82 @@
+#measures cold start: the wall time of a fresh `cli.py scrub` process scrubbing
+#one file, the way upload hooks invoke it, and fails when it is over budget:
+#  python -m benchmarks.startup
+#  python -m benchmarks.startup --runs 20 --budget 800 --output startup.json
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from .corpus import make_image
+
+#median milliseconds a one-file scrub may take from process start to exit
+DEFAULT_BUDGET_MS = 1000
+
+CLI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cli.py')
+
+
+def _time_process(args, env):
+  """Runs a Python process to completion. Returns its wall time in milliseconds."""
+  start = time.perf_counter()
+  subprocess.run([sys.executable] + args, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+  return (time.perf_counter() - start) * 1000
+
+
+def _summary(samples):
+  return {'median_ms': round(statistics.median(samples), 1), 'max_ms': round(max(samples), 1)}
+
+
+def measure(runs=10, seed=0):
+  """
+  Times, in fresh processes:
+  the bare interpreter; importing cli.py; a one-file scrub against a new database
+  (so including schema creation); and the same scrub against an existing one.
+  Returns the median and slowest run of each, in milliseconds.
+  """
+  work_dir = tempfile.mkdtemp(prefix='privacy_guard_startup_')
+  try:
+    image_path = os.path.join(work_dir, 'upload.jpg')
+    with open(image_path, 'wb') as f:
+      f.write(make_image(random.Random(seed), 'JPEG', 'medium', 'heavy'))
+    scrub = [CLI, 'scrub', '--all', '--no-cache', image_path]
+    env = dict(os.environ, PYTHONWARNINGS='ignore', PRIVACY_GUARD_DB=os.path.join(work_dir, 'startup.db'))
+
+    samples = {'interpreter': [], 'import': [], 'first_scrub': [], 'scrub': []}
+    for run in range(runs):
+      samples['interpreter'].append(_time_process(['-c', 'pass'], env))
+      samples['import'].append(_time_process(['-c', f"import sys; sys.path.insert(0, {os.path.dirname(CLI)!r}); import cli"], env))
+      fresh_env = dict(env, PRIVACY_GUARD_DB=os.path.join(work_dir, f'fresh-{run}.db'))
+      samples['first_scrub'].append(_time_process(scrub, fresh_env))
+      samples['scrub'].append(_time_process(scrub, env))
+    return {name: _summary(values) for name, values in samples.items()}
+  finally:
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog="python -m benchmarks.startup", description="Measures cold start of a one-file scrub.")
+  parser.add_argument("--runs", type=int, default=10, help="processes started per measurement (default: 10)")
+  parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_MS, metavar="MS",
+                      help=f"exit 1 if the median one-file scrub takes longer (default: {DEFAULT_BUDGET_MS})")
+  parser.add_argument("--output", "-o", metavar="FILE", help="also save the results as JSON")
+  args = parser.parse_args(argv)
+
+  results = measure(args.runs)
+  for name, timing in results.items():
+    print(f"{name:<12} median {timing['median_ms']:>7} ms   max {timing['max_ms']:>7} ms", file=sys.stderr)
+  over = results['scrub']['median_ms'] > args.budget
+  print(f"budget {args.budget:g} ms: {'over' if over else 'within'}", file=sys.stderr)
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump({'runs': args.runs, 'budget_ms': args.budget, 'results': results}, f, indent=2)
+  return 1 if over else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
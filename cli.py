@@ -1,22 +1,62 @@
+import argparse
+import atexit
+import itertools
+import json
 import os
 import sys
-from lib.db.database import get_db_session
-from lib.db.models import Profile, FileLog
 from lib.helpers import (
     console,
+    err_console,
+    emit_json,
+    to_jsonable,
     display_main_menu,
     display_profiles,
     get_path_input,
     display_metadata,
     display_logs,
-    display_log_details
+    display_log_details,
+    display_census,
+    display_metrics,
+    lazy_import
 )
 
-from lib.scrubber import get_metadata, scrub_file
+from lib import metrics, output
+from lib.scrubber import UNCHANGED, get_metadata, scrub_stream
+from lib.batch import default_workers, scrub_files, scrub_one
+from lib.census import run_census
+from lib.prefetch import DEFAULT_BUDGET, prefetch
+from lib.walker import iter_image_files
+from lib.matcher import compile_tags, matcher_for_profile
+
+#the database layer pulls in SQLAlchemy, so it is only loaded by commands that use it
+database = lazy_import('lib.db.database')
+models = lazy_import('lib.db.models')
+
+#files the interactive preview takes its census of; the walk beyond them stays lazy
+PREVIEW_LIMIT = 1000
 
 class Cli:
-  def __init__(self):
-    self.session = get_db_session()
+  def __init__(self, workers=None, durable_audit=False, json_output=False, metrics_path=None, show_stats=False,
+               prefetch_bytes=DEFAULT_BUDGET):
+    from lib.db.audit import AuditWriter
+    self.session = database.get_db_session()
+    #batch mode prints one JSON object per file instead of styled messages
+    self.json_output = json_output
+    #number of worker processes used for batch scrubbing
+    self.workers = workers or default_workers()
+    #audit rows are written in batches; durable_audit commits every file on its own
+    self.audit = AuditWriter(self.session, durable=durable_audit)
+    #directories scrubbed files went to under the `batch` fsync policy; they are
+    #synced before the logs and checkpoints of those files are committed
+    self.pending_dirs = set()
+    self.audit.before_flush = self.sync_output_dirs
+    #makes sure buffered logs reach the database on exit
+    atexit.register(self.audit.close)
+    #where batch metrics are written and whether they are printed; both need metrics enabled
+    self.metrics_path = metrics_path
+    self.show_stats = show_stats
+    #bytes of upcoming files read into the page cache while the workers scrub; 0 turns read-ahead off
+    self.prefetch_bytes = prefetch_bytes
 
   def run(self):
     """Main application loop."""
@@ -50,7 +90,7 @@ class Cli:
       if choice == "1":
         self.create_profile()
       elif choice == "2":
-        profiles = Profile.get_all(self.session)
+        profiles = models.Profile.get_all(self.session)
         display_profiles(profiles)
       elif choice == "3":
         self.delete_profile()
@@ -60,14 +100,14 @@ class Cli:
         console.print("[bold red]Invalid choice.[/bold red]")
   def select_profile(self):
     """Lists profiles and lets the user select one."""
-    profiles = Profile.get_all(self.session)
+    profiles = models.Profile.get_all(self.session)
     if not profiles:
       console.print("[yellow]No profiles exist. Please create one first.[/yellow]")
       return None
     display_profiles(profiles)
     try:
       profile_id = int(input("Enter the ID of the profile to use: "))
-      profile = Profile.find_by_id(self.session, profile_id)
+      profile = models.Profile.find_by_id(self.session, profile_id)
       if not profile:
         console.print("[bold red]Profile not found.[/bold red]")
         return None
@@ -85,7 +125,7 @@ class Cli:
       tags_input = input("> ")
       tags_list = [tag.strip() for tag in tags_input.split(',')]
       
-      profile = Profile.create(self.session, name, description, tags_list)
+      profile = models.Profile.create(self.session, name, description, tags_list)
       console.print(f"[green]Profile '{profile.name}' created successfully![/green]")
     except ValueError as e:
       console.print(f"[bold red]Error: {e}[/bold red]")
@@ -97,7 +137,7 @@ class Cli:
     """Handles deletion of a profile."""
     try:
       profile_id = int(input("Enter the ID of the profile to delete: "))
-      profile = Profile.find_by_id(self.session, profile_id)
+      profile = models.Profile.find_by_id(self.session, profile_id)
       if profile:
         profile_name = profile.name
         profile.delete(self.session)
@@ -112,6 +152,8 @@ class Cli:
 
   def handle_scrub_files(self):
     """Handles the file scrubbing workflow."""
+    if self.offer_resume():
+      return
     path = get_path_input()
     #user chose to exit back to main menu
     if path is None:
@@ -120,18 +162,19 @@ class Cli:
     
     #determines if path is a file or directory
     if os.path.isfile(path):
-      files_to_process = [path]
+      files_to_process = iter([path])
     else:
-      files_to_process = [os.path.join(path, f) for f in os.listdir(path) if os.path.isfile(os.path.join(path, f))]
+      #walks the directory lazily; only image files are picked up
+      files_to_process = iter_image_files(path)
 
-    if not files_to_process:
+    first_file = next(files_to_process, None)
+    if first_file is None:
       console.print("[yellow]No files found to process.[/yellow]")
       return
+    files_to_process = itertools.chain([first_file], files_to_process)
 
-    console.print(f"Found {len(files_to_process)} file(s) to process.")
-    
     #previews metadata of the first file if several
-    metadata, error = get_metadata(files_to_process[0])
+    metadata, error = get_metadata(first_file)
     if error and "No EXIF" not in error:
       console.print(f"[bold red]{error}[/bold red]")
       return
@@ -151,18 +194,34 @@ class Cli:
     if scrub_choice == "1":
       profile = self.select_profile()
       if not profile: return
-      tags_to_remove = [tag.tag_name for tag in profile.tags_to_remove]
+      #compiled once per profile and reused across runs
+      tags_to_remove = matcher_for_profile(profile)
       profile_id = profile.id
     elif scrub_choice == "2":
       remove_all = True
     elif scrub_choice == "3":
-      console.print("Enter tag names to remove, comma-separated (e.g., GPSInfo, Make, Model):")
+      console.print("Enter tag names to remove, comma-separated (e.g., GPSInfo, Make, Model, Date*, all camera):")
       tags_input = input("> ")
-      tags_to_remove = [tag.strip() for tag in tags_input.split(',')]
+      tags_to_remove = compile_tags(tags_input.split(','))
     else:
       console.print("[bold red]Invalid choice.[/bold red]")
       return
-      
+
+    #a directory can be previewed as a whole before anything is written
+    if not os.path.isfile(path):
+      preview_choice = input("Preview the changes across the files first? [y/n]: ").lower().strip()
+      if preview_choice == 'y':
+        #a bounded slice of the walk; it goes back in front of the files still to be walked
+        preview = list(itertools.islice(files_to_process, PREVIEW_LIMIT))
+        files_to_process = itertools.chain(preview, files_to_process)
+        census = run_census(preview, tags_to_remove, remove_all, workers=self.workers)
+        display_census(census)
+        if len(preview) == PREVIEW_LIMIT:
+          console.print(f"[cyan]The preview covers the first {PREVIEW_LIMIT} files only.[/cyan]")
+        if input("Proceed with the scrub? [y/n]: ").lower().strip() != 'y':
+          console.print("[cyan]Nothing was scrubbed.[/cyan]")
+          return
+
     #asks user to modify original files or create copies
     in_place_choice = input("Overwrite original files? (This is permanent!) [y/n]: ").lower().strip()
     in_place = in_place_choice == 'y'
@@ -171,47 +230,228 @@ class Cli:
     else:
       console.print("[green]A scrubbed copy of the files will be created.[/green]")
 
-    #process each file
-    for file_path in files_to_process:
-      self.process_single_file(file_path, tags_to_remove, remove_all, profile_id, in_place)
+    #a directory is run as a job, so it can be resumed if it is interrupted
+    job = None
+    if not os.path.isfile(path):
+      job = self.start_job([path], tags_to_remove, remove_all, in_place, profile_id)
+    counts = self.scrub_batch(files_to_process, tags_to_remove, remove_all, in_place, profile_id, job=job)
+    print_counts(counts)
+
+  def scrub_batch(self, files_to_process, tags_to_remove, remove_all, in_place, profile_id=None, use_cache=True, job=None):
+    """
+    Scrubs files through the scrub cache and the worker pool and logs every result.
+    With a `job`, files it already completed are passed over and every outcome is
+    checkpointed with the audit logs; the job is marked done once the batch completes.
+    Returns a dictionary counting the outcomes.
+    """
+    counts = {'scrubbed': 0, 'unchanged': 0, 'reused': 0, 'skipped': 0, 'failed': 0, 'resumed': 0}
+    metrics.registry.reset()
+
+    def count(file_path, status):
+      counts[status] += 1
+      #scrubbed and reused files are checkpointed together with their audit log
+      if status not in ('scrubbed', 'reused'):
+        self.audit.checkpoint(file_path, status)
+
+    if job is not None:
+      self.audit.job_id = job.id
+
+      def not_completed(file_paths):
+        #checked against the checkpoint a batch at a time as the walk streams,
+        #so a resumed job never loads every path it finished
+        file_paths = iter(file_paths)
+        while True:
+          batch = list(itertools.islice(file_paths, models.JobFile.LOOKUP_BATCH))
+          if not batch:
+            return
+          completed = models.JobFile.completed_among(self.session, job.id, batch)
+          for file_path in batch:
+            if file_path in completed:
+              counts['resumed'] += 1
+            else:
+              yield file_path
+
+      #checked before the cache, which has to stat or hash each file
+      if models.JobFile.has_completed(self.session, job.id):
+        files_to_process = not_completed(files_to_process)
+
+    #skips files that are unchanged since they were last scrubbed with these options
+    from lib.cache import ScrubCache
+    cache = ScrubCache(self.session, tags_to_remove, remove_all, in_place) if use_cache else None
+    #files left to scrub are read ahead of the workers, warming the page cache they map them from;
+    #with the cache on, that read is the content hash, so each file is read once
+    if cache:
+      files_to_process = cache.filter(
+        files_to_process,
+        on_reuse=lambda result: count(result.file_path, self.record_result(result, profile_id, reused=True)),
+        on_skip=lambda file_path: count(file_path, self.record_skip(file_path)),
+        prefetch_bytes=self.prefetch_bytes
+      )
+    else:
+      files_to_process = prefetch(files_to_process, self.prefetch_bytes)
+
+    #scrubs the files in parallel; results come back here so only this process writes logs
+    results = scrub_files(files_to_process, tags_to_remove, remove_all, in_place, workers=self.workers)
+    try:
+      with metrics.stage('batch'):
+        for result in results:
+          #timings taken in the workers travel back with each result
+          if result.metrics:
+            metrics.registry.merge(result.metrics)
+          count(result.file_path, self.record_result(result, profile_id))
+          if cache:
+            cache.remember(result)
+    finally:
+      #writes whatever is still buffered, even on Ctrl-C; an unfinished job keeps its checkpoint
+      self.flush_audit()
+      self.audit.job_id = None
+      if cache:
+        self.flush_cache(cache)
+
+    if job is not None:
+      try:
+        job.finish(self.session)
+      except Exception as e:
+        self.report_error(f"Could not mark job {job.id} as done: {e}")
+        self.session.rollback()
+    self.report_metrics()
+    return counts
+
+  def start_job(self, paths, tags_to_remove, remove_all, in_place, profile_id=None, walk=None):
+    """Records a batch as a job so it can be resumed if it is interrupted. Returns the Job."""
+    options = dict(walk or {}, tags=[str(tag) for tag in (tags_to_remove or [])], remove_all=bool(remove_all))
+    return models.Job.create(self.session, paths, options, profile_id=profile_id, in_place=in_place)
+
+  def resume_job(self, job, use_cache=True):
+    """Runs an interrupted job again with its recorded options. Returns the outcome counts."""
+    options = job.options
+    files_to_process = iter_input_paths(
+      options['paths'], options.get('include'), options.get('exclude'), options.get('recursive', True)
+    )
+    #the profile may have been deleted since; its tags were recorded with the job
+    profile_id = job.profile_used_id if job.profile_used else None
+    return self.scrub_batch(
+      files_to_process, compile_tags(options['tags']), options['remove_all'], job.in_place,
+      profile_id=profile_id, use_cache=use_cache, job=job
+    )
+
+  def offer_resume(self):
+    """Offers to resume the most recent interrupted job. Returns True if one was run."""
+    jobs = models.Job.get_unfinished(self.session)
+    if not jobs:
+      return False
+    job = jobs[0]
+    console.print(
+      f"\n[bold yellow]Job {job.id} on {job.root_path} was interrupted "
+      f"after {job.count_files(self.session)} file(s).[/bold yellow]"
+    )
+    if input("Resume it? [y/n]: ").lower().strip() != 'y':
+      return False
+    counts = self.resume_job(job)
+    print_counts(counts)
+    return True
 
   def process_single_file(self, file_path, tags_to_remove, remove_all, profile_id, in_place):
     """Processes a single file, scrubs it, and logs the action."""
+    result = scrub_one(file_path, tags_to_remove, remove_all, in_place)
+    self.record_result(result, profile_id)
+    self.flush_audit()
+
+  def record_result(self, result, profile_id, reused=False):
+    """Reports the outcome of a scrubbed file and logs the action. Returns the outcome."""
+    file_path = result.file_path
     try:
-      #determines the name of the final processed file for logging purposes
-      if in_place:
-        processed_path = file_path
-      else:
-        dir_name, file_name = os.path.split(file_path)
-        name, ext = os.path.splitext(file_name)
-        processed_path = os.path.join(dir_name, f"{name}_scrubbed{ext}")
-      
-      #calls the updated scrub_file function with the in_place argument
-      removed_data, error = scrub_file(
-        filepath=file_path, 
-        tags_to_remove=tags_to_remove, 
-        remove_all=remove_all, 
-        in_place=in_place
-      )
-      
-      if error:
-        console.print(f"[bold red]Could not process {os.path.basename(file_path)}: {error}[/bold red]")
-        return
+      #files copied without changes (no metadata, broken Exif) are not failures
+      if result.error and result.error not in UNCHANGED:
+        status = 'failed'
+        if self.json_output:
+          emit_json({'path': file_path, 'status': status, 'error': result.error})
+        else:
+          console.print(f"[bold red]Could not process {os.path.basename(file_path)}: {result.error}[/bold red]")
+        return status
+
+      #in place, unchanged files are left alone; everything else was renamed into place
+      if output.fsync_policy == 'batch' and (result.removed_data or result.processed_path != file_path):
+        self.pending_dirs.add(os.path.dirname(os.path.abspath(result.processed_path)))
 
-      if removed_data:
-        FileLog.create(
-          session=self.session,
+      if result.removed_data:
+        status = 'reused' if reused else 'scrubbed'
+        self.audit.add(
           original_path=file_path,
-          processed_path=processed_path,
-          scrubbed_tags_dict=removed_data,
-          profile_id=profile_id
+          processed_path=result.processed_path,
+          scrubbed_tags_dict=result.removed_data,
+          profile_id=profile_id,
+          status=status
         )
-        final_filename = os.path.basename(processed_path)
-        console.print(f"[green]Successfully scrubbed {os.path.basename(file_path)} -> {final_filename}[/green]")
+        final_filename = os.path.basename(result.processed_path)
+        message = f"[green]Successfully scrubbed {os.path.basename(file_path)} -> {final_filename}[/green]"
+      elif result.error:
+        status = 'unchanged'
+        message = f"[yellow]{os.path.basename(file_path)}: {result.error}[/yellow]"
+      else:
+        status = 'unchanged'
+        message = f"[yellow]No metadata removed from {os.path.basename(file_path)}. File processed.[/yellow]"
+
+      if self.json_output:
+        record = {
+          'path': file_path,
+          'status': status,
+          'output': result.processed_path,
+          'removed': [str(tag) for tag in (result.removed_data or {})],
+        }
+        if result.error:
+          record['note'] = result.error
+        emit_json(record)
       else:
-        console.print(f"[yellow]No metadata removed from {os.path.basename(file_path)}. File processed.[/yellow]")
+        console.print(message)
+      return status
     except Exception as e:
-      console.print(f"[bold red]An unexpected error occurred with {file_path}: {e}[/bold red]")
+      self.report_error(f"An unexpected error occurred with {file_path}: {e}")
+      self.session.rollback()
+      return 'failed'
+
+  def record_skip(self, file_path):
+    """Reports a file the scrub cache found up to date. Returns the outcome."""
+    if self.json_output:
+      emit_json({'path': file_path, 'status': 'skipped'})
+    return 'skipped'
+
+  def report_error(self, message):
+    """Prints an error; in JSON mode it goes to stderr so stdout stays machine-readable."""
+    target = err_console if self.json_output else console
+    target.print(f"[bold red]{message}[/bold red]")
+
+  def flush_audit(self):
+    """Writes buffered audit logs to the database."""
+    try:
+      self.audit.flush()
+    except Exception as e:
+      self.report_error(f"Could not save audit logs: {e}")
+
+  def sync_output_dirs(self):
+    """Fsyncs the directories written to since the last call, each once."""
+    dirs, self.pending_dirs = self.pending_dirs, set()
+    output.sync_dirs(dirs)
+
+  def report_metrics(self):
+    """Prints and writes the metrics of the last batch, as asked for."""
+    if not metrics.enabled:
+      return
+    if self.show_stats:
+      display_metrics(metrics.registry, err_console if self.json_output else console)
+    if self.metrics_path:
+      try:
+        metrics.write(self.metrics_path)
+      except OSError as e:
+        self.report_error(f"Could not write metrics to {self.metrics_path}: {e}")
+
+  def flush_cache(self, cache):
+    """Saves new scrub cache entries and keeps the cache within its bounds."""
+    try:
+      cache.flush()
+      cache.evict()
+    except Exception as e:
+      self.report_error(f"Could not update the scrub cache: {e}")
 
   def handle_view_audit_trail(self):
     """Sub-menu for viewing the audit trail."""
@@ -224,8 +464,7 @@ class Cli:
       choice = input("> ")
 
       if choice == "1":
-        logs = FileLog.get_all(self.session)
-        display_logs(logs)
+        self.browse_logs()
       elif choice == "2":
         self.find_log_details()
       elif choice == "3":
@@ -235,11 +474,43 @@ class Cli:
       else:
         console.print("[bold red]Invalid choice.[/bold red]")
 
+  def browse_logs(self, page_size=25):
+    """Pages through the audit trail, newest first."""
+    page = 1
+    logs = models.FileLog.get_page(self.session, limit=page_size)
+    if not logs:
+      display_logs(logs)
+      return
+
+    while True:
+      display_logs(logs, page=page)
+      choice = input("[n]ext page, [p]revious page, [b]ack: ").lower().strip()
+      if choice == "n":
+        last = logs[-1]
+        older = models.FileLog.get_page(self.session, limit=page_size, cursor=(last.timestamp, last.id))
+        if older:
+          logs = older
+          page += 1
+        else:
+          console.print("[yellow]This is the last page.[/yellow]")
+      elif choice == "p":
+        first = logs[0]
+        newer = models.FileLog.get_page(self.session, limit=page_size, cursor=(first.timestamp, first.id), newer=True)
+        if newer:
+          logs = newer
+          page -= 1
+        else:
+          console.print("[yellow]This is the first page.[/yellow]")
+      elif choice == "b":
+        break
+      else:
+        console.print("[bold red]Invalid choice.[/bold red]")
+
   def find_log_details(self):
     """Finds and displays details for a specific log."""
     try:
       log_id = int(input("Enter the Log ID to view details: "))
-      log = FileLog.find_by_id(self.session, log_id)
+      log = models.FileLog.find_by_id(self.session, log_id)
       if log:
         display_log_details(log)
       else:
@@ -251,7 +522,7 @@ class Cli:
     """Handles deletion of a log entry."""
     try:
       log_id = int(input("Enter the ID of the log entry to delete: "))
-      log = FileLog.find_by_id(self.session, log_id)
+      log = models.FileLog.find_by_id(self.session, log_id)
       if log:
         log.delete(self.session)
         console.print(f"[green]Log entry {log_id} deleted successfully.[/green]")
@@ -263,7 +534,439 @@ class Cli:
       console.print(f"[bold red]An error occurred: {e}[/bold red]")
       self.session.rollback()
 
-      
+
+def print_counts(counts):
+  """Prints the outcome counts of an interactive batch."""
+  message = (
+    f"Processed {counts['scrubbed'] + counts['unchanged'] + counts['failed']} file(s), "
+    f"reused {counts['reused']} duplicate(s), skipped {counts['skipped']} unchanged file(s)."
+  )
+  if counts['resumed']:
+    message += f" {counts['resumed']} file(s) were already done before the job was interrupted."
+  console.print(message)
+
+def iter_input_paths(paths, include=None, exclude=None, recursive=True):
+  """Yields the files named on the command line, walking directories for images."""
+  for path in paths:
+    if os.path.isdir(path):
+      yield from iter_image_files(path, include=include, exclude=exclude, recursive=recursive)
+    else:
+      yield path
+
+def find_profile(session, name_or_id):
+  """Finds a profile by its name, or by its id when given a number."""
+  if name_or_id.isdigit():
+    return models.Profile.find_by_id(session, int(name_or_id))
+  return models.Profile.find_by_name(session, name_or_id)
+
+def scrub_stdin(app, tags_to_remove, remove_all, profile_id):
+  """Scrubs an image piped on stdin to stdout; messages go to stderr."""
+  removed_data, error = scrub_stream(sys.stdin.buffer, sys.stdout.buffer, tags_to_remove, remove_all)
+  #an image with nothing to remove has already gone to stdout as it was
+  if error in UNCHANGED:
+    err_console.print(error)
+    return 0
+  if error:
+    app.report_error(error)
+    return 1
+  if removed_data:
+    app.audit.add("<stdin>", "<stdout>", removed_data, profile_id)
+    app.flush_audit()
+  err_console.print(f"Removed {len(removed_data)} tag(s).")
+  return 0
+
+def command_scrub(args):
+  """`scrub`: scrubs files and directories without prompting, one JSON line per file."""
+  if args.metrics or args.stats:
+    metrics.enable()
+  if args.fsync:
+    output.set_fsync_policy(args.fsync)
+  if not args.cprofile:
+    return run_scrub(args)
+  #worker processes are out of the profiler's sight, so the files are scrubbed inline
+  args.jobs = 1
+  import cProfile
+  profiler = cProfile.Profile()
+  try:
+    return profiler.runcall(run_scrub, args)
+  finally:
+    profiler.dump_stats(args.cprofile)
+    err_console.print(f"Profile written to {args.cprofile} (view with: python -m pstats {args.cprofile})")
+
+def run_scrub(args):
+  """Runs the `scrub` command once its metrics and profiling are set up."""
+  app = Cli(
+    workers=args.jobs, durable_audit=args.durable_audit, json_output=True,
+    metrics_path=args.metrics, show_stats=args.stats, prefetch_bytes=args.prefetch_mb * 1024 * 1024
+  )
+  if args.resume is not None:
+    return resume_command(app, args)
+  if not args.paths:
+    app.report_error("No paths given.")
+    return 2
+  use_stdin = '-' in args.paths
+  if use_stdin and (len(args.paths) > 1 or args.in_place or args.dry_run):
+    app.report_error("'-' reads one image from stdin and can't be combined with other paths, --in-place or --dry-run.")
+    return 2
+
+  missing = [path for path in args.paths if path != '-' and not os.path.exists(path)]
+  for path in missing:
+    emit_json({'path': path, 'status': 'failed', 'error': 'Path does not exist.'})
+
+  profile_id = None
+  tags_to_remove = []
+  if args.profile:
+    profile = find_profile(app.session, args.profile)
+    if not profile:
+      app.report_error(f"Profile not found: {args.profile}")
+      return 2
+    tags_to_remove = matcher_for_profile(profile)
+    profile_id = profile.id
+  elif args.tags:
+    tags_to_remove = compile_tags(args.tags.split(','))
+
+  if use_stdin:
+    return scrub_stdin(app, tags_to_remove, args.remove_all, profile_id)
+
+  paths = [path for path in args.paths if path not in missing]
+  files_to_process = iter_input_paths(paths, args.include, args.exclude, not args.no_recursive)
+  if args.dry_run:
+    census = census_paths(
+      files_to_process, tags_to_remove, args.remove_all, app.workers, per_file=True,
+      prefetch_bytes=app.prefetch_bytes
+    )
+    return 1 if census.errors or missing else 0
+
+  job = app.start_job(
+    paths, tags_to_remove, args.remove_all, args.in_place, profile_id,
+    walk={'include': args.include, 'exclude': args.exclude, 'recursive': not args.no_recursive}
+  )
+  err_console.print(f"Job {job.id}; resume with: cli.py scrub --resume {job.id}")
+  counts = app.scrub_batch(
+    files_to_process, tags_to_remove, args.remove_all, args.in_place,
+    profile_id=profile_id, use_cache=not args.no_cache, job=job
+  )
+  err_console.print(", ".join(f"{status}: {count}" for status, count in counts.items()))
+  return 1 if counts['failed'] or missing else 0
+
+def resume_command(app, args):
+  """`scrub --resume`: picks an interrupted job up from its checkpoint."""
+  if args.paths:
+    app.report_error("--resume reuses the job's paths and options; don't give any.")
+    return 2
+  job = models.Job.find_by_id(app.session, args.resume)
+  if not job:
+    app.report_error(f"Job not found: {args.resume}")
+    return 2
+  if job.status != 'running':
+    app.report_error(f"Job {job.id} already completed.")
+    return 2
+  counts = app.resume_job(job, use_cache=not args.no_cache)
+  err_console.print(", ".join(f"{status}: {count}" for status, count in counts.items()))
+  return 1 if counts['failed'] else 0
+
+def command_jobs(args):
+  """`jobs`: lists the interrupted jobs as JSON lines."""
+  session = database.get_db_session()
+  for job in models.Job.get_unfinished(session):
+    emit_json({
+      'id': job.id,
+      'root': job.root_path,
+      'started': job.created_at.isoformat(),
+      'profile': job.profile_used.name if job.profile_used else None,
+      'in_place': job.in_place,
+      'options': job.options,
+      'files_done': job.count_files(session),
+    })
+  return 0
+
+def census_entry_json(entry):
+  """Turns a CensusEntry into the JSON line printed for its file."""
+  if entry.error:
+    return {'path': entry.file_path, 'status': 'failed', 'error': entry.error}
+  record = {'path': entry.file_path, 'size': entry.size, 'tags': list(entry.tags)}
+  if entry.changed is not None:
+    record.update(changed=entry.changed, removed=list(entry.removed), bytes_saved=entry.bytes_saved)
+  return record
+
+def census_paths(files_to_process, tags_to_remove, remove_all, workers, per_file=False, prefetch_bytes=DEFAULT_BUDGET):
+  """Takes a census, optionally printing a JSON line per file, then prints the summary line."""
+  on_entry = (lambda entry: emit_json(census_entry_json(entry))) if per_file else None
+  census = run_census(
+    files_to_process, tags_to_remove, remove_all, workers=workers, on_entry=on_entry, prefetch_bytes=prefetch_bytes
+  )
+  emit_json({'census': census.to_dict()})
+  return census
+
+def command_census(args):
+  """`census`: counts the tags across files and, given a method, what a scrub would change. Writes nothing."""
+  tags_to_remove = []
+  if args.profile:
+    profile = find_profile(database.get_db_session(), args.profile)
+    if not profile:
+      err_console.print(f"[bold red]Profile not found: {args.profile}[/bold red]")
+      return 2
+    tags_to_remove = matcher_for_profile(profile)
+  elif args.tags:
+    tags_to_remove = compile_tags(args.tags.split(','))
+
+  files_to_process = iter_input_paths(args.paths, args.include, args.exclude, not args.no_recursive)
+  census = census_paths(
+    files_to_process, tags_to_remove, args.remove_all, args.jobs, per_file=args.files,
+    prefetch_bytes=args.prefetch_mb * 1024 * 1024
+  )
+  return 1 if census.errors else 0
+
+def command_inspect(args):
+  """`inspect`: prints the metadata of files and directories as JSON lines."""
+  failed = False
+  for file_path in iter_input_paths(args.paths, args.include, args.exclude, not args.no_recursive):
+    metadata, error = get_metadata(file_path)
+    if error and "No EXIF" not in error:
+      failed = True
+      emit_json({'path': file_path, 'error': error})
+    else:
+      emit_json({'path': file_path, 'metadata': to_jsonable(metadata or {})})
+  return 1 if failed else 0
+
+def command_audit_export(args):
+  """`audit export`: streams the audit trail as JSON lines, newest first."""
+  from lib.db.retention import log_record
+  session = database.get_db_session()
+  out = open(args.output, 'w') if args.output != '-' else sys.stdout
+  try:
+    cursor = None
+    while True:
+      logs = models.FileLog.get_page(session, limit=1000, cursor=cursor, with_tags=True)
+      if not logs:
+        break
+      for log in logs:
+        out.write(json.dumps(log_record(log)) + "\n")
+      cursor = (logs[-1].timestamp, logs[-1].id)
+      #keeps memory flat on long trails
+      session.expunge_all()
+  finally:
+    if out is not sys.stdout:
+      out.close()
+  return 0
+
+def command_audit_prune(args):
+  """`audit prune`: archives and deletes the logs outside a retention policy, then frees the space."""
+  import datetime
+  from lib.db.retention import RetentionPolicy, prune, vacuum
+  if args.max_age is None and args.max_logs is None and args.max_mb is None:
+    err_console.print("[bold red]Give at least one of --max-age, --max-logs and --max-mb.[/bold red]")
+    return 2
+  policy = RetentionPolicy(
+    max_age=datetime.timedelta(days=args.max_age) if args.max_age is not None else None,
+    max_logs=args.max_logs,
+    max_bytes=int(args.max_mb * 1024 * 1024) if args.max_mb is not None else None,
+  )
+  archive_dir = None
+  if not args.no_archive:
+    archive_dir = args.archive or os.path.join(os.path.dirname(os.path.abspath(database.database_path)), "audit-archive")
+
+  session = database.get_db_session()
+  try:
+    result = prune(session, policy, archive_dir=archive_dir, dry_run=args.dry_run)
+  except Exception as e:
+    session.rollback()
+    err_console.print(f"[bold red]Could not prune the audit trail: {e}[/bold red]")
+    return 1
+  finally:
+    session.close()
+  vacuumed = None
+  size_before = os.path.getsize(database.database_path)
+  if not args.dry_run and (result.deleted or args.vacuum):
+    vacuumed = vacuum(database.engine, full=True if args.vacuum else None)
+  emit_json({
+    'expired': result.expired,
+    'deleted': result.deleted,
+    'archives': result.archives,
+    'vacuum': vacuumed,
+    'freed_bytes': size_before - os.path.getsize(database.database_path),
+    'dry_run': args.dry_run,
+  })
+  return 0
+
+def parse_when(value, end=False):
+  """
+  Parses a --since/--until value: an ISO date or date and time, or `Nd` for N
+  days ago. A bare date given as the `end` of a range includes that whole day.
+  """
+  import datetime
+  if value[:-1].isdigit() and value[-1:] == 'd':
+    return models.get_current_time_eat() - datetime.timedelta(days=int(value[:-1]))
+  when = datetime.datetime.fromisoformat(value)
+  if end and len(value) == 10:
+    when += datetime.timedelta(days=1)
+  return when
+
+def command_audit_search(args):
+  """`audit search`: prints the matching logs as JSON lines, newest first, then the totals and facets."""
+  import time
+  from lib.db.retention import log_record
+  from lib.db.search import SearchQuery, search_logs
+  try:
+    since = parse_when(args.since) if args.since else None
+    until = parse_when(args.until, end=True) if args.until else None
+  except ValueError as e:
+    err_console.print(f"[bold red]Invalid date: {e}[/bold red]")
+    return 2
+  query = SearchQuery(
+    text=" ".join(args.text) or None, under=args.under, since=since, until=until,
+    profile=args.profile, manual=args.manual, with_tags=args.tag, without_tags=args.without_tag,
+  )
+
+  session = database.get_db_session()
+  try:
+    start = time.perf_counter()
+    result = search_logs(session, query, limit=args.limit or None, with_facets=not args.no_facets)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    for log in result.logs:
+      emit_json(log_record(log))
+  finally:
+    session.close()
+  summary = {'total': result.total, 'shown': len(result.logs), 'ms': round(elapsed_ms, 1)}
+  if result.facets is not None:
+    summary['facets'] = result.facets
+  emit_json({'search': summary})
+  return 0
+
+def command_serve(args):
+  """`serve`: runs the scrub service until interrupted."""
+  #imported here so the other commands don't pay for asyncio
+  import asyncio
+  from lib.service import serve
+
+  #set before the pool starts, so the workers inherit it
+  if args.fsync:
+    output.set_fsync_policy(args.fsync)
+  where = args.unix or f"http://{args.host}:{args.port}"
+  err_console.print(f"Serving on {where} with {args.jobs or default_workers()} worker(s). Press Ctrl-C to stop.")
+  if not args.roots:
+    err_console.print("No --root given: POST /scrub is refused, only uploads are scrubbed.")
+  try:
+    asyncio.run(serve(
+      host=args.host, port=args.port, unix_path=args.unix, workers=args.jobs,
+      queue_size=args.queue_size, max_body=args.max_upload_mb * 1024 * 1024, roots=args.roots
+    ))
+  except KeyboardInterrupt:
+    pass
+  return 0
+
+def build_parser():
+  """Builds the command-line interface for headless use."""
+  parser = argparse.ArgumentParser(
+    prog="cli.py",
+    description="Privacy Guard Pro. Run without a command for the interactive menu."
+  )
+  commands = parser.add_subparsers(dest="command")
+
+  def add_walk_options(command, nargs="+"):
+    command.add_argument("paths", nargs=nargs, metavar="PATH", help="files or directories ('-' for stdin to stdout with scrub)")
+    command.add_argument("--include", action="append", metavar="GLOB", help="only pick up files matching GLOB when walking directories")
+    command.add_argument("--exclude", action="append", metavar="GLOB", help="skip files and directories matching GLOB")
+    command.add_argument("--no-recursive", action="store_true", help="do not descend into subdirectories")
+
+  scrub = commands.add_parser("scrub", help="scrub metadata from files")
+  add_walk_options(scrub, nargs="*")
+  method = scrub.add_mutually_exclusive_group(required=True)
+  method.add_argument("--profile", metavar="NAME", help="name or id of a saved profile")
+  method.add_argument("--all", dest="remove_all", action="store_true", help="remove all metadata")
+  method.add_argument("--tags", metavar="TAGS", help="comma-separated tag names, wildcards or groups")
+  method.add_argument("--resume", type=int, metavar="JOB", help="resume an interrupted job with its own paths and options")
+  scrub.add_argument("--in-place", action="store_true", help="overwrite the original files")
+  scrub.add_argument("--jobs", "-j", type=int, metavar="N", help="number of worker processes (default: CPU count)")
+  scrub.add_argument("--no-cache", action="store_true", help="scrub every file even if it is unchanged since the last run")
+  scrub.add_argument("--durable-audit", action="store_true", help="commit the audit log after every file")
+  scrub.add_argument("--fsync", choices=output.FSYNC_POLICIES,
+                      help="how outputs are made durable: none; file (fsync each file before it replaces the target); "
+                           "batch (also fsync each directory once, before the logs are committed; the default); full (also after every rename)")
+  scrub.add_argument("--prefetch-mb", type=int, default=DEFAULT_BUDGET // (1024 * 1024), metavar="MB",
+                      help="read upcoming files into the OS page cache ahead of the workers, up to MB megabytes of files "
+                           "not yet handed on; this bounds page cache, not this process's memory (default: %(default)s; 0 turns it off)")
+  scrub.add_argument("--dry-run", action="store_true", help="report what would be removed and saved per file without writing anything")
+  scrub.add_argument("--metrics", metavar="FILE", help="write per-stage timings and counters to FILE (JSON for *.json, Prometheus text otherwise)")
+  scrub.add_argument("--stats", action="store_true", help="print per-stage timings and counters to stderr when done")
+  scrub.add_argument("--cprofile", metavar="FILE", help="profile the run with cProfile and write the stats to FILE (scrubs with one process)")
+  scrub.set_defaults(handler=command_scrub)
+
+  census = commands.add_parser("census", help="count the tags across files and what a scrub would change, without writing anything")
+  add_walk_options(census)
+  method = census.add_mutually_exclusive_group()
+  method.add_argument("--profile", metavar="NAME", help="plan a scrub with a saved profile")
+  method.add_argument("--all", dest="remove_all", action="store_true", help="plan a full scrub")
+  method.add_argument("--tags", metavar="TAGS", help="plan a scrub of comma-separated tag names, wildcards or groups")
+  census.add_argument("--files", action="store_true", help="print a JSON line per file before the summary")
+  census.add_argument("--jobs", "-j", type=int, metavar="N", help="number of worker processes (default: CPU count)")
+  census.add_argument("--prefetch-mb", type=int, default=DEFAULT_BUDGET // (1024 * 1024), metavar="MB",
+                      help="read upcoming files into the OS page cache ahead of the workers, up to MB megabytes of files "
+                           "not yet handed on; this bounds page cache, not this process's memory (default: %(default)s; 0 turns it off)")
+  census.set_defaults(handler=command_census)
+
+  jobs = commands.add_parser("jobs", help="list interrupted scrub jobs")
+  jobs.set_defaults(handler=command_jobs)
+
+  inspect = commands.add_parser("inspect", help="print the metadata of files")
+  add_walk_options(inspect)
+  inspect.set_defaults(handler=command_inspect)
+
+  audit = commands.add_parser("audit", help="work with the audit trail")
+  audit_commands = audit.add_subparsers(dest="audit_command", required=True)
+  export = audit_commands.add_parser("export", help="export the audit trail as JSON lines")
+  export.add_argument("--output", "-o", default="-", metavar="FILE", help="output file (default: stdout)")
+  export.set_defaults(handler=command_audit_export)
+  prune = audit_commands.add_parser("prune", help="archive and delete logs outside a retention policy")
+  prune.add_argument("--max-age", type=float, metavar="DAYS", help="delete logs older than DAYS")
+  prune.add_argument("--max-logs", type=int, metavar="N", help="keep only the newest N logs")
+  prune.add_argument("--max-mb", type=float, metavar="MB", help="keep only the newest logs that fit in MB")
+  prune.add_argument("--archive", metavar="DIR", help="where expired logs are archived as .jsonl.gz (default: audit-archive next to the database)")
+  prune.add_argument("--no-archive", action="store_true", help="delete expired logs without archiving them")
+  prune.add_argument("--vacuum", action="store_true", help="rebuild the database with a full VACUUM afterwards")
+  prune.add_argument("--dry-run", action="store_true", help="only count the logs that would be deleted")
+  prune.set_defaults(handler=command_audit_prune)
+  search = audit_commands.add_parser("search", help="search the audit trail, with counts per profile, tag and day")
+  search.add_argument("text", nargs="*", help="words the paths or removed tag names contain (as word prefixes)")
+  search.add_argument("--under", metavar="DIR", help="only files that were inside DIR")
+  search.add_argument("--since", metavar="DATE", help="only logs from DATE on (YYYY-MM-DD[THH:MM], or Nd for N days ago)")
+  search.add_argument("--until", metavar="DATE", help="only logs up to and including DATE")
+  who = search.add_mutually_exclusive_group()
+  who.add_argument("--profile", metavar="NAME", help="only logs scrubbed with this profile")
+  who.add_argument("--manual", action="store_true", help="only logs scrubbed without a profile")
+  search.add_argument("--tag", action="append", default=[], metavar="NAME",
+                      help="only logs that removed this tag; GLOB patterns such as 'GPS*' work (repeatable)")
+  search.add_argument("--without-tag", action="append", default=[], metavar="NAME",
+                      help="only logs that didn't remove this tag (repeatable)")
+  search.add_argument("--limit", type=int, default=50, metavar="N", help="logs to print, 0 for all (default: 50)")
+  search.add_argument("--no-facets", action="store_true", help="skip the counts per profile, tag and day")
+  search.set_defaults(handler=command_audit_search)
+
+  serve = commands.add_parser("serve", help="run the scrub service (HTTP on localhost or a Unix socket)")
+  serve.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+  serve.add_argument("--port", type=int, default=8765, help="TCP port to listen on (default: 8765)")
+  serve.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead of TCP")
+  serve.add_argument("--jobs", "-j", type=int, metavar="N", help="number of worker processes (default: CPU count)")
+  serve.add_argument("--queue-size", type=int, default=64, metavar="N", help="jobs allowed to wait before requests are refused (default: 64)")
+  serve.add_argument("--root", dest="roots", action="append", default=[], metavar="DIR",
+                     help="directory POST /scrub may scrub files in; repeat for several (default: none)")
+  serve.add_argument("--fsync", choices=output.FSYNC_POLICIES,
+                      help="how files scrubbed on disk are made durable, as for scrub; under batch (the default) "
+                           "each request's directory is fsynced before the response")
+  serve.add_argument("--max-upload-mb", type=int, default=64, metavar="MB", help="largest accepted request body (default: 64)")
+  serve.set_defaults(handler=command_serve)
+
+  return parser
+
+def main(argv=None):
+  """Runs a command from the command line, or the interactive menu without one."""
+  args = build_parser().parse_args(argv)
+  if args.command is None:
+    #PRIVACY_GUARD_METRICS=1 prints the timings after every batch
+    app = Cli(show_stats=metrics.enabled)
+    app.run()
+    return 0
+  return args.handler(args)
+
 if __name__ == "__main__":
-  app = Cli()
-  app.run()
\ No newline at end of file
+  sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,96 @@
+import itertools
+import os
+from collections import deque, namedtuple
+
+from . import metrics
+from .scrubber import scrub_file, scrubbed_path
+
+#outcome of scrubbing one file, sent back from the worker processes; `metrics`
+#carries the worker's stage timings for the file when metrics are on
+ScrubResult = namedtuple('ScrubResult', ['file_path', 'processed_path', 'removed_data', 'error', 'metrics'], defaults=(None,))
+
+
+def default_workers():
+  """Returns the default size of the worker pool (one per CPU)."""
+  return os.cpu_count() or 1
+
+
+def scrub_one(file_path, tags_to_remove=None, remove_all=False, in_place=False):
+  """Scrubs a single file and wraps the outcome in a ScrubResult."""
+  processed_path = file_path if in_place else scrubbed_path(file_path)
+  try:
+    with metrics.stage('scrub'):
+      removed_data, error = scrub_file(
+        filepath=file_path,
+        tags_to_remove=tags_to_remove,
+        remove_all=remove_all,
+        in_place=in_place
+      )
+  except Exception as e:
+    removed_data, error = None, f"Error processing file: {e}"
+  return ScrubResult(file_path, processed_path, removed_data, error, metrics.collect())
+
+
+def _worker_failed(file_path, in_place, error):
+  """Turns a worker failure (e.g. a crashed process) into a per-file error."""
+  processed_path = file_path if in_place else scrubbed_path(file_path)
+  return ScrubResult(file_path, processed_path, None, f"Worker failed: {error}")
+
+
+def map_files(func, file_paths, args=(), workers=None, on_error=None):
+  """
+  Runs `func(file_path, *args)` for many files across a pool of worker processes.
+  Yields the results in the order the paths were given, as soon as each one is
+  ready. Only a bounded number of jobs is in flight at a time so `file_paths`
+  can be a lazy iterator. A job that fails in the pool itself is turned into a
+  result by `on_error(file_path, exception)`, or re-raised without one.
+  """
+  workers = workers or default_workers()
+  #a single file is done inline: starting a pool would cost more than the file
+  file_paths = iter(file_paths)
+  head = list(itertools.islice(file_paths, 2))
+  if workers == 1 or len(head) < 2:
+    for file_path in itertools.chain(head, file_paths):
+      yield func(file_path, *args)
+    return
+  file_paths = itertools.chain(head, file_paths)
+
+  #imported on first use; it pulls in multiprocessing
+  from concurrent.futures import ProcessPoolExecutor
+
+  def collect(file_path, future):
+    try:
+      return future.result()
+    except Exception as e:
+      if on_error is None:
+        raise
+      return on_error(file_path, e)
+
+  window = workers * 4
+  pending = deque()
+  with ProcessPoolExecutor(max_workers=workers) as pool:
+    try:
+      for file_path in file_paths:
+        pending.append((file_path, pool.submit(func, file_path, *args)))
+        if len(pending) >= window:
+          done_path, done_future = pending.popleft()
+          yield collect(done_path, done_future)
+      while pending:
+        file_path, future = pending.popleft()
+        yield collect(file_path, future)
+    finally:
+      #stops queued jobs if the caller gives up early (e.g. Ctrl-C)
+      for file_path, future in pending:
+        future.cancel()
+
+
+def scrub_files(file_paths, tags_to_remove=None, remove_all=False, in_place=False, workers=None):
+  """
+  Scrubs many files across a pool of worker processes.
+  Yields a ScrubResult per file, in the order the paths were given (see map_files).
+  Database writes are left to the caller.
+  """
+  return map_files(
+    scrub_one, file_paths, (tags_to_remove, remove_all, in_place), workers,
+    on_error=lambda file_path, error: _worker_failed(file_path, in_place, error)
+  )
@@ -0,0 +1,215 @@
+import datetime
+import hashlib
+import json
+import os
+from collections import deque
+
+from . import metrics, output
+from .batch import ScrubResult
+from .db.packing import decode_value, encode_value
+from .prefetch import read_ahead
+from .scrubber import UNCHANGED, scrubbed_path
+from .db.models import ScrubCacheEntry, get_current_time_eat
+
+#bump when a scrubber change should invalidate earlier cache entries
+#(2: removed values are stored with their types, as the audit trail packs them)
+CACHE_VERSION = 2
+
+#default bounds applied at the end of each batch
+MAX_ENTRIES = 500000
+MAX_AGE = datetime.timedelta(days=180)
+
+
+def settings_key(tags_to_remove=None, remove_all=False, in_place=False):
+  """Returns a stable hash of the options a file was scrubbed with."""
+  settings = {
+    'version': CACHE_VERSION,
+    'remove_all': bool(remove_all),
+    'tags': sorted(set(tags_to_remove or [])),
+    'in_place': bool(in_place),
+  }
+  return hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+
+def content_hash(filepath, chunk_size=1024 * 1024):
+  """Returns the BLAKE2b hash of a file's contents."""
+  digest = hashlib.blake2b(digest_size=20)
+  with open(filepath, 'rb') as f:
+    for chunk in iter(lambda: f.read(chunk_size), b''):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+
+def _stat(filepath):
+  """Returns (size, mtime_ns, inode) of a file, or None if it is gone."""
+  try:
+    st = os.stat(filepath)
+  except OSError:
+    return None
+  return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+class ScrubCache:
+  """
+  Decides which files of a batch actually need scrubbing.
+  A file is skipped when its size, mtime and inode (and those of its output)
+  match what was recorded the last time it was scrubbed with the same options.
+  Otherwise its content is hashed, and a file whose contents were already
+  scrubbed under another path gets a copy of that earlier output instead.
+  New entries are buffered and written when the batch is flushed.
+  """
+
+  def __init__(self, session, tags_to_remove=None, remove_all=False, in_place=False, batch_size=1000):
+    self.session = session
+    self.batch_size = batch_size
+    self.in_place = in_place
+    self.key = settings_key(tags_to_remove, remove_all, in_place)
+    self.skipped = 0
+    self.reused = 0
+    #content hashes of files handed to the scrubber, keyed by path
+    self._hashes = {}
+    self._rows = []
+    self._touched = []
+
+  def _output_path(self, filepath):
+    return filepath if self.in_place else scrubbed_path(filepath)
+
+  def _is_fresh(self, entry, source_stat):
+    """Checks a cache entry against the current state of the file and its output."""
+    output_stat = _stat(entry.output_path)
+    if output_stat is None or output_stat[:2] != (entry.output_size, entry.output_mtime_ns):
+      return False
+    if self.in_place:
+      #the file itself is the output of the last run
+      return True
+    return source_stat == (entry.source_size, entry.source_mtime_ns, entry.source_inode)
+
+  def filter(self, file_paths, on_reuse=None, on_skip=None, prefetch_bytes=0):
+    """
+    Yields the paths that still need scrubbing. Up-to-date files are counted
+    in `skipped` and passed to `on_skip`; duplicates get the earlier output
+    copied and their ScrubResult passed to `on_reuse`. The other files are
+    hashed by read-ahead threads, up to `prefetch_bytes` ahead (see
+    prefetch.read_ahead), which leaves them in the page cache for the workers;
+    with 0 they are hashed here, one at a time.
+    """
+    #stats of the files handed to the read-ahead, in the same order; a path given twice is there twice
+    source_stats = deque()
+
+    def stale(file_paths):
+      #runs in this thread as the read-ahead asks for more files; only the hashing is handed off
+      for filepath in file_paths:
+        source_stat = _stat(filepath)
+        if source_stat is not None:
+          entry = ScrubCacheEntry.find_by_path(self.session, filepath, self.key)
+          if entry is not None and self._is_fresh(entry, source_stat):
+            self.skipped += 1
+            if on_skip:
+              on_skip(filepath)
+            self._touched.append(entry.id)
+            if len(self._touched) >= self.batch_size:
+              self.flush()
+            continue
+        source_stats.append(source_stat)
+        yield filepath
+
+    for filepath, future in read_ahead(stale(file_paths), content_hash, prefetch_bytes):
+      source_stat = source_stats.popleft()
+      if source_stat is None:
+        yield filepath
+        continue
+
+      try:
+        #with read-ahead this is the time spent waiting on a hash still running
+        with metrics.stage('cache.hash'):
+          digest = content_hash(filepath) if future is None else future.result()
+      except OSError:
+        yield filepath
+        continue
+
+      result = self._reuse(filepath, digest, source_stat)
+      if result is not None:
+        self.reused += 1
+        if on_reuse:
+          on_reuse(result)
+        continue
+
+      self._hashes[filepath] = digest
+      yield filepath
+
+  def _reuse(self, filepath, digest, source_stat):
+    """Copies the output of an earlier scrub of identical contents. Returns a ScrubResult or None."""
+    for entry in ScrubCacheEntry.find_by_hash(self.session, digest, self.key):
+      if entry.source_path == filepath:
+        continue
+      output_stat = _stat(entry.output_path)
+      if output_stat is None or output_stat[:2] != (entry.output_size, entry.output_mtime_ns):
+        continue
+
+      removed_data = {name: decode_value(value) for name, value in json.loads(entry.removed_json or '{}').items()}
+      output_path = self._output_path(filepath)
+      #in place, a file whose twin came out unchanged already is its own output
+      if not (self.in_place and not removed_data):
+        try:
+          #a clone where the file system supports it, so duplicates share their blocks
+          output.copy_file(entry.output_path, output_path, like=filepath)
+        except OSError:
+          continue
+
+      self._touched.append(entry.id)
+      self._record(filepath, digest, source_stat, output_path, removed_data)
+      return ScrubResult(filepath, output_path, removed_data, None)
+    return None
+
+  def _record(self, filepath, digest, source_stat, output_path, removed_data):
+    output_stat = _stat(output_path)
+    if output_stat is None:
+      return
+    self._rows.append({
+      'source_path': filepath,
+      'settings_key': self.key,
+      'source_size': source_stat[0],
+      'source_mtime_ns': source_stat[1],
+      'source_inode': source_stat[2],
+      'content_hash': digest,
+      'output_path': output_path,
+      'output_size': output_stat[0],
+      'output_mtime_ns': output_stat[1],
+      'removed_json': json.dumps({str(k): encode_value(v) for k, v in (removed_data or {}).items()}),
+      'last_used': get_current_time_eat(),
+    })
+
+  def remember(self, result):
+    """
+    Records a scrubbed file, or one copied without changes, so later runs can
+    skip or reuse it. Files that failed are left to be tried again.
+    """
+    digest = self._hashes.pop(result.file_path, None)
+    if digest is None or (result.error and result.error not in UNCHANGED):
+      return
+    source_stat = _stat(result.file_path)
+    if source_stat is None:
+      return
+    self._record(result.file_path, digest, source_stat, result.processed_path, result.removed_data)
+    if len(self._rows) >= self.batch_size:
+      self.flush()
+
+  def flush(self):
+    """Writes buffered entries and usage updates in one transaction."""
+    rows, self._rows = self._rows, []
+    touched, self._touched = self._touched, []
+    if not rows and not touched:
+      return
+    try:
+      ScrubCacheEntry.upsert_many(self.session, rows)
+      #keeps each IN (...) list well under SQLite's bound-parameter limit
+      for start in range(0, len(touched), 500):
+        ScrubCacheEntry.touch_many(self.session, touched[start:start + 500])
+      self.session.commit()
+    except Exception:
+      self.session.rollback()
+      raise
+
+  def evict(self, max_entries=MAX_ENTRIES, max_age=MAX_AGE):
+    """Applies the size and age bounds to the cache."""
+    return ScrubCacheEntry.evict(self.session, max_entries=max_entries, max_age=max_age)
@@ -0,0 +1,151 @@
+import os
+from collections import Counter, namedtuple
+
+from . import formats, reader
+from .batch import map_files
+from .matcher import GROUPS, compile_tags
+from .prefetch import DEFAULT_BUDGET, HEAD_BYTES, prefetch
+from .scrubber import _unmap, get_metadata
+
+#what a dry run found for one file. `changed` and `bytes_saved` are None when
+#no scrub method was given or the format has no backend to plan the scrub with.
+CensusEntry = namedtuple('CensusEntry', ['file_path', 'size', 'tags', 'removed', 'changed', 'bytes_saved', 'error'])
+
+
+def _plan(data, matcher, remove_all):
+  """
+  Runs a backend over a mapped file without writing anything.
+  Returns the removed tag names, whether the file would change and the bytes saved,
+  or None when the format has no backend.
+  """
+  backend = formats.backend_for(data[:16])
+  if backend is None:
+    return None
+  if remove_all:
+    chunks, removed_data, error = backend.strip(data)
+  else:
+    chunks, removed_data, error = backend.scrub_tags(data, matcher)
+  changed = not error and bool(removed_data)
+  saved = len(data) - sum(len(chunk) for chunk in chunks) if changed else 0
+  #the chunks are views of the mapping; they must go before it is closed
+  for chunk in chunks:
+    if isinstance(chunk, memoryview):
+      chunk.release()
+  removed = tuple(str(name) for name in removed_data) if changed else ()
+  return removed, changed, saved
+
+
+def census_one(file_path, tags_to_remove=None, remove_all=False):
+  """
+  Reads the tags of one file from its header and, given a scrub method, works
+  out what the scrub would remove and how many bytes it would save.
+  Nothing is written. Returns a CensusEntry.
+  """
+  try:
+    size = os.path.getsize(file_path)
+    metadata, error = get_metadata(file_path)
+    if metadata is None:
+      return CensusEntry(file_path, size, (), (), None, None, error)
+    tags = tuple(str(name) for name in metadata)
+
+    matcher = compile_tags(tags_to_remove)
+    if not (remove_all or matcher) or size == 0:
+      return CensusEntry(file_path, size, tags, (), None, None, None)
+
+    with open(file_path, 'rb') as f:
+      data = reader.map_file(f)
+      try:
+        plan = _plan(data, matcher, remove_all)
+      except formats.FormatError:
+        #the real scrub would fall back to Pillow here
+        plan = None
+      finally:
+        _unmap(data)
+    if plan is None:
+      return CensusEntry(file_path, size, tags, (), None, None, None)
+    removed, changed, saved = plan
+    return CensusEntry(file_path, size, tags, removed, changed, saved, None)
+  except Exception as e:
+    return CensusEntry(file_path, None, (), (), None, None, f"Error reading file: {e}")
+
+
+def _entry_failed(file_path, error):
+  return CensusEntry(file_path, None, (), (), None, None, f"Worker failed: {error}")
+
+
+class Census:
+  """
+  Running totals of a census: how many files carry each tag and what a scrub would do.
+  `planned` is False for a census taken without a scrub method.
+  """
+
+  def __init__(self, planned=True):
+    self.planned = planned
+    self.files = 0
+    self.errors = 0
+    self.with_metadata = 0
+    self.would_change = 0
+    #files whose outcome can't be planned without running the scrub
+    self.unknown = 0
+    self.bytes_total = 0
+    self.bytes_saved = 0
+    self.tag_counts = Counter()
+    self.removed_counts = Counter()
+    self.group_counts = Counter()
+
+  def add(self, entry):
+    """Adds a CensusEntry to the totals."""
+    self.files += 1
+    if entry.error:
+      self.errors += 1
+      return
+    self.bytes_total += entry.size or 0
+    if entry.tags:
+      self.with_metadata += 1
+      self.tag_counts.update(entry.tags)
+      tags = set(entry.tags)
+      for group, members in GROUPS.items():
+        if tags.intersection(members):
+          self.group_counts[group] += 1
+    if entry.changed is None:
+      if self.planned:
+        self.unknown += 1
+    elif entry.changed:
+      self.would_change += 1
+      self.bytes_saved += entry.bytes_saved
+      self.removed_counts.update(entry.removed)
+
+  def to_dict(self):
+    """Returns the totals as a JSON-friendly dictionary, tags most common first."""
+    return {
+      'planned': self.planned,
+      'files': self.files,
+      'errors': self.errors,
+      'with_metadata': self.with_metadata,
+      'would_change': self.would_change,
+      'unknown': self.unknown,
+      'bytes_total': self.bytes_total,
+      'bytes_saved': self.bytes_saved,
+      'groups': dict(self.group_counts.most_common()),
+      'tags': dict(self.tag_counts.most_common()),
+      'removed': dict(self.removed_counts.most_common()),
+    }
+
+
+def run_census(file_paths, tags_to_remove=None, remove_all=False, workers=None, on_entry=None,
+               prefetch_bytes=DEFAULT_BUDGET):
+  """
+  Takes a census of many files across the worker pool (see batch.map_files),
+  reading up to `prefetch_bytes` of the upcoming files ahead (see prefetch).
+  `on_entry(entry)` is called with each CensusEntry in path order.
+  Returns the Census.
+  """
+  census = Census(planned=bool(remove_all or compile_tags(tags_to_remove)))
+  #without a scrub method only the headers are read, so only they are read ahead
+  file_paths = prefetch(file_paths, prefetch_bytes, head=None if census.planned else HEAD_BYTES)
+  entries = map_files(census_one, file_paths, (tags_to_remove, remove_all), workers, on_error=_entry_failed)
+  for entry in entries:
+    census.add(entry)
+    if on_entry:
+      on_entry(entry)
+  return census
@@ -0,0 +1,119 @@
+import time
+
+from .. import metrics
+from .models import FileLog, FileLogTag, JobFile, SearchIndex, TagName, get_current_time_eat
+from .packing import pack_tags
+
+
+class AuditWriter:
+  """
+  Buffers audit-trail rows and writes them to the database in batches.
+  Logs are flushed with bulk inserts in a single transaction once `batch_size`
+  files have been buffered or `flush_interval` seconds have passed since the
+  last flush. With `durable=True` every file is committed as soon as it is added.
+  While `job_id` is set, job checkpoints are buffered alongside and committed in
+  the same transaction, so a file's log and its checkpoint are written together.
+  """
+
+  def __init__(self, session, batch_size=500, flush_interval=5.0, durable=False):
+    self.session = session
+    self.batch_size = 1 if durable else batch_size
+    self.flush_interval = flush_interval
+    self.durable = durable
+    self.job_id = None
+    #called at the start of every flush, e.g. to make the files the logs describe durable first
+    self.before_flush = None
+    self._pending = []
+    self._checkpoints = []
+    self._last_flush = time.monotonic()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    self.flush()
+
+  def __len__(self):
+    return len(self._pending) + len(self._checkpoints)
+
+  def _flush_if_due(self):
+    if len(self) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+      self.flush()
+
+  def checkpoint(self, file_path, status):
+    """Queues the outcome of a file for the current job; flushes when the batch is full or due."""
+    if self.job_id is None:
+      return
+    self._checkpoints.append({'job_id': self.job_id, 'file_path': file_path, 'status': status})
+    self._flush_if_due()
+
+  def add(self, original_path, processed_path, scrubbed_tags_dict, profile_id=None, status='scrubbed'):
+    """
+    Queues a FileLog with its removed tags, and the file's checkpoint with `status`
+    when a job is set; flushes when the batch is full or due.
+    """
+    log_row = {
+      'original_filepath': original_path,
+      'processed_filepath': processed_path,
+      'profile_used_id': profile_id,
+      #stamped now so the log records when the file was scrubbed, not when it was flushed
+      'timestamp': get_current_time_eat(),
+    }
+    #values keep their types; they are packed once the names have ids
+    tags = {str(tag_name): tag_value for tag_name, tag_value in scrubbed_tags_dict.items()}
+    self._pending.append((log_row, tags))
+    if self.job_id is not None:
+      self._checkpoints.append({'job_id': self.job_id, 'file_path': original_path, 'status': status})
+    self._flush_if_due()
+
+  def flush(self):
+    """
+    Writes every buffered row in one transaction. Returns the number of logs written.
+    If the write fails the rows stay buffered.
+    """
+    if self.before_flush is not None:
+      self.before_flush()
+    pending, self._pending = self._pending, []
+    checkpoints, self._checkpoints = self._checkpoints, []
+    self._last_flush = time.monotonic()
+    if not pending and not checkpoints:
+      return 0
+
+    try:
+      with metrics.stage('audit.flush'):
+        tag_ids = TagName.intern_many(self.session, {name for log_row, tags in pending for name in tags})
+        for log_row, tags in pending:
+          log_row['tags_blob'] = pack_tags([(tag_ids[name], value) for name, value in tags.items()])
+        log_rows = [log_row for log_row, tags in pending]
+        if log_rows:
+          #return_defaults hands back the new primary keys for the tag links
+          self.session.bulk_insert_mappings(FileLog, log_rows, return_defaults=True)
+
+        links = [
+          {'file_log_id': log_row['id'], 'tag_name_id': tag_ids[name]}
+          for log_row, tags in pending
+          for name in tags
+        ]
+        if links:
+          self.session.bulk_insert_mappings(FileLogTag, links)
+        SearchIndex.add_many(self.session, [
+          SearchIndex.row(log_row['id'], log_row['original_filepath'], log_row['processed_filepath'], tags)
+          for log_row, tags in pending
+        ])
+        JobFile.upsert_many(self.session, checkpoints)
+
+        self.session.commit()
+      metrics.count('audit.logs', len(pending))
+    except BaseException:
+      #keeps the rows for the next flush, e.g. the one after a Ctrl-C lands mid-write
+      self.session.rollback()
+      for log_row, tags in pending:
+        log_row.pop('id', None)
+      self._pending = pending + self._pending
+      self._checkpoints = checkpoints + self._checkpoints
+      raise
+    return len(pending)
+
+  def close(self):
+    """Flushes anything still buffered."""
+    self.flush()
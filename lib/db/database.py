@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -8,16 +8,55 @@ from sqlalchemy.ext.declarative import declarative_base
 
 #absolute path for the database file to avoid location issues
 project_dir = os.path.dirname(os.path.abspath(__file__))
-database_path = os.path.join(project_dir, "../..", "privacy_guard.db")
+#PRIVACY_GUARD_DB points a process at another database (e.g. the benchmarks' scratch one)
+database_path = os.environ.get("PRIVACY_GUARD_DB") or os.path.join(project_dir, "../..", "privacy_guard.db")
 DATABASE_URL = f'sqlite:///{database_path}'
 
+#SQLite tuning applied to every new connection:
+#WAL lets readers run alongside the writer, synchronous=NORMAL only fsyncs at
+#checkpoints (safe with WAL), and the page cache / mmap keep hot pages in memory.
+#incremental auto-vacuum lets pruning hand free pages back without a full VACUUM;
+#it takes effect in new databases and in old ones after their next VACUUM
+SQLITE_PRAGMAS = {
+    'auto_vacuum': 'INCREMENTAL',
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,
+}
+
 #SQLAlchemy engine and session factory setup
 engine = create_engine(DATABASE_URL)
+
+@event.listens_for(engine, "connect")
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Applies SQLITE_PRAGMAS to a freshly opened connection."""
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
 Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 #Base class for declarative models
 Base = declarative_base()
 
+#set once this process has checked the schema
+_schema_checked = False
+
+def init_db():
+    """Creates or upgrades the schema if the database is behind the models (see migrations)."""
+    global _schema_checked
+    #the models register their tables on Base when imported
+    from . import models
+    from .migrations import ensure_schema
+    ensure_schema(engine, Base.metadata)
+    _schema_checked = True
+
 def get_db_session():
-    """Provides a new database session."""
-    return Session()
\ No newline at end of file
+    """Provides a new database session, setting up the schema on first use."""
+    if not _schema_checked:
+        init_db()
+    return Session()
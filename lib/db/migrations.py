@@ -0,0 +1,146 @@
+from itertools import groupby
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import OperationalError
+
+from .packing import pack_tags
+
+#bump whenever the models gain a table, column or index, so existing
+#databases are brought up to date the next time they are opened
+SCHEMA_VERSION = 3
+
+#logs converted per round by the scrubbed_tags migration
+MIGRATION_BATCH = 500
+
+
+def schema_version(connection):
+  """Reads the schema version stamped into the database file (0 for a new one)."""
+  return connection.execute(text("PRAGMA user_version")).scalar()
+
+
+def ensure_schema(engine, metadata):
+  """
+  Creates the tables and indexes once per schema version. The version is kept
+  in SQLite's `user_version`, so an up-to-date database costs a single pragma
+  instead of reflecting every table on each start.
+  Returns True when the schema had to be created or upgraded.
+  """
+  with engine.connect() as connection:
+    version = schema_version(connection)
+  if version >= SCHEMA_VERSION:
+    return False
+  metadata.create_all(engine)
+  ensure_indexes(engine, metadata)
+  with engine.begin() as connection:
+    for step_version, step in MIGRATIONS:
+      if version < step_version:
+        step(connection)
+    connection.execute(text(f"PRAGMA user_version={SCHEMA_VERSION}"))
+  return True
+
+
+def _table_exists(connection, name):
+  return connection.execute(
+    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': name}
+  ).first() is not None
+
+
+def _intern_tag_names(connection, names, tag_ids):
+  """Adds tag names missing from `tag_ids` ({name: id}) to tag_names and to `tag_ids`."""
+  missing = [name for name in set(names) if name not in tag_ids]
+  if not missing:
+    return
+  connection.execute(text("INSERT OR IGNORE INTO tag_names (name) VALUES (:name)"), [{'name': name} for name in missing])
+  for start in range(0, len(missing), MIGRATION_BATCH):
+    rows = connection.execute(
+      text("SELECT name, id FROM tag_names WHERE name IN :names").bindparams(bindparam('names', expanding=True)),
+      {'names': missing[start:start + MIGRATION_BATCH]}
+    )
+    tag_ids.update(rows.all())
+
+
+def pack_scrubbed_tags(connection):
+  """
+  Version 2: moves the rows of scrubbed_tags, one per removed tag, into a packed
+  record per log (file_logs.tags_blob) with interned names, then drops the table.
+  The old values were saved as str(), so they are carried over as strings.
+  """
+  columns = {row[1] for row in connection.execute(text("PRAGMA table_info(file_logs)"))}
+  if 'tags_blob' not in columns:
+    connection.execute(text("ALTER TABLE file_logs ADD COLUMN tags_blob BLOB"))
+  if not _table_exists(connection, 'scrubbed_tags'):
+    return
+
+  tag_ids = {name: tag_id for tag_id, name in connection.execute(text("SELECT id, name FROM tag_names"))}
+  last_id = 0
+  while True:
+    log_ids = connection.execute(
+      text("SELECT id FROM file_logs WHERE id > :last_id ORDER BY id LIMIT :limit"),
+      {'last_id': last_id, 'limit': MIGRATION_BATCH}
+    ).scalars().all()
+    if not log_ids:
+      break
+    last_id = log_ids[-1]
+    rows = connection.execute(
+      text(
+        "SELECT file_log_id, tag_name, tag_value FROM scrubbed_tags "
+        "WHERE file_log_id IN :log_ids AND tag_name IS NOT NULL ORDER BY file_log_id, id"
+      ).bindparams(bindparam('log_ids', expanding=True)),
+      {'log_ids': log_ids}
+    ).all()
+    _intern_tag_names(connection, [row.tag_name for row in rows], tag_ids)
+
+    updates, links = [], []
+    for log_id, log_rows in groupby(rows, key=lambda row: row.file_log_id):
+      tags = {row.tag_name: row.tag_value for row in log_rows}
+      updates.append({'id': log_id, 'blob': pack_tags([(tag_ids[name], value) for name, value in tags.items()])})
+      links.extend({'log_id': log_id, 'tag_id': tag_ids[name]} for name in tags)
+    if updates:
+      connection.execute(text("UPDATE file_logs SET tags_blob = :blob WHERE id = :id"), updates)
+      connection.execute(text("INSERT OR IGNORE INTO file_log_tags (file_log_id, tag_name_id) VALUES (:log_id, :tag_id)"), links)
+
+  connection.execute(text("DROP TABLE scrubbed_tags"))
+
+
+def create_search_index(connection):
+  """
+  Version 3: creates the FTS5 table over log paths and tag names (see
+  models.SearchIndex) and indexes the logs already there in one statement.
+  Skipped when this SQLite was built without FTS5; search then does without it.
+  """
+  try:
+    connection.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS file_log_search USING fts5(paths, tags)"))
+  except OperationalError:
+    return
+  connection.execute(text(
+    "INSERT INTO file_log_search (rowid, paths, tags) "
+    "SELECT l.id, l.original_filepath || ' ' || l.processed_filepath, "
+    "coalesce((SELECT group_concat(n.name, ' ') FROM file_log_tags t JOIN tag_names n ON n.id = t.tag_name_id "
+    "WHERE t.file_log_id = l.id), '') "
+    "FROM file_logs l WHERE l.id NOT IN (SELECT rowid FROM file_log_search)"
+  ))
+
+
+def drop_tag_name_index(connection):
+  """Version 3: the (tag_name_id, file_log_id) index on file_log_tags replaces the one on tag_name_id alone."""
+  connection.execute(text("DROP INDEX IF EXISTS ix_file_log_tags_tag_name_id"))
+
+
+#(schema version, step) in order; each step upgrades a database from the version before it
+MIGRATIONS = [
+  (2, pack_scrubbed_tags),
+  (3, create_search_index),
+  (3, drop_tag_name_index),
+]
+
+
+def ensure_indexes(engine, metadata):
+  """
+  Creates every index declared on the models that the database is missing.
+  create_all only builds indexes together with new tables, so databases
+  created before an index was added need this to catch up.
+  """
+  with engine.begin() as connection:
+    for table in metadata.sorted_tables:
+      for index in table.indexes:
+        index.create(connection, checkfirst=True)
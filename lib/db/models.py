@@ -1,18 +1,34 @@
 import datetime
+import json
 from datetime import timezone, timedelta
 from sqlalchemy import (
     create_engine,
     Column,
     Integer,
+    BigInteger,
     String,
+    Boolean,
+    Text,
+    LargeBinary,
     DateTime,
     ForeignKey,
+    Index,
+    UniqueConstraint,
+    and_,
+    or_,
+    func,
+    delete,
+    exists,
+    select,
+    text,
 )
-
-from sqlalchemy.orm import relationship, sessionmaker, validates
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import deferred, joinedload, object_session, relationship, sessionmaker, undefer, validates
 from sqlalchemy.ext.hybrid import hybrid_property
 
-from .database import Base, engine, Session
+from .database import Base, Session
+from .packing import pack_tags, unpack_tags
+from ..matcher import invalidate_profile
 
 #gets the current time(UTC+3 timezone)
 EAT_TIMEZONE = timezone(timedelta(hours=3))
@@ -85,8 +101,11 @@ class Profile(Base):
 
   def delete(self, session):
     """method to delete this specific profile object from the database."""
+    profile_id = self.id
     session.delete(self)
     session.commit()
+    #forgets the compiled tag matcher of the deleted profile
+    invalidate_profile(profile_id)
 
 class ProfileTag(Base):
   """
@@ -97,7 +116,7 @@ class ProfileTag(Base):
 
   id = Column(Integer, primary_key=True)
   tag_name = Column(String, nullable=False)
-  profile_id = Column(Integer, ForeignKey('profiles.id'))
+  profile_id = Column(Integer, ForeignKey('profiles.id'), index=True)
 
   #Relationships
   profile = relationship('Profile', back_populates='tags_to_remove')
@@ -110,30 +129,46 @@ class FileLog(Base):
   __tablename__ = 'file_logs'
 
   id = Column(Integer, primary_key=True)
-  original_filepath = Column(String, nullable=False)
+  original_filepath = Column(String, nullable=False, index=True)
   processed_filepath = Column(String, nullable=False)
-  timestamp = Column(DateTime(timezone=True), default=get_current_time_eat)
-  profile_used_id = Column(Integer, ForeignKey('profiles.id'), nullable=True)
+  timestamp = Column(DateTime(timezone=True), default=get_current_time_eat, index=True)
+  profile_used_id = Column(Integer, ForeignKey('profiles.id'), nullable=True, index=True)
+  #the removed tags and their values as one packed record (see packing.py);
+  #only loaded when asked for, since listing logs never needs it
+  tags_blob = deferred(Column(LargeBinary))
 
   #Relationships
-  scrubbed_tags = relationship('ScrubbedTag', back_populates='file_log', cascade="all, delete-orphan")
+  #which tags were removed, for finding logs by tag name
+  tag_links = relationship('FileLogTag', cascade="all, delete-orphan")
   profile_used = relationship('Profile', back_populates='logs')
 
   def __repr__(self):
     return f"<FileLog(id={self.id}, original='{self.original_filepath}', time='{self.timestamp}')>"
 
+  @property
+  def removed_tags(self):
+    """The removed tags as {tag_name: value}, with the values' original types."""
+    pairs = unpack_tags(self.tags_blob)
+    names = TagName.names_for(object_session(self), [tag_id for tag_id, value in pairs])
+    return {names[tag_id]: value for tag_id, value in pairs}
+
   @classmethod
   def create(cls, session, original_path, processed_path, scrubbed_tags_dict, profile_id=None):
-    """A class method to create a new FileLog and its associated ScrubbedTags."""
+    """A class method to create a new FileLog with its packed tags."""
+    tag_ids = TagName.intern_many(session, [str(tag_name) for tag_name in scrubbed_tags_dict])
+    pairs = [(tag_ids[str(tag_name)], tag_value) for tag_name, tag_value in scrubbed_tags_dict.items()]
     log = cls(
         original_filepath=original_path,
         processed_filepath=processed_path,
-        profile_used_id=profile_id
+        profile_used_id=profile_id,
+        tags_blob=pack_tags(pairs)
     )
-    for tag_name, tag_value in scrubbed_tags_dict.items():
-        log.scrubbed_tags.append(ScrubbedTag(tag_name=str(tag_name), tag_value=str(tag_value)))
-    
+    for tag_id in set(tag_ids.values()):
+        log.tag_links.append(FileLogTag(tag_name_id=tag_id))
+
     session.add(log)
+    session.flush()
+    SearchIndex.add_many(session, [SearchIndex.row(log.id, original_path, processed_path, tag_ids)])
     session.commit()
     return log
 
@@ -142,30 +177,346 @@ class FileLog(Base):
     """A class method to retrieve all logs, ordered from newest to oldest."""
     return session.query(cls).order_by(cls.timestamp.desc()).all()
 
+  @classmethod
+  def get_page(cls, session, limit=25, cursor=None, newer=False, with_tags=False):
+    """
+    A class method to retrieve one page of logs, ordered from newest to oldest.
+    Uses keyset pagination: `cursor` is the (timestamp, id) of the last row of the
+    previous page (or the first row when paging back with `newer=True`), so each
+    page is an index range scan no matter how deep into the trail it is.
+    The profile of every log is loaded in the same query; `with_tags` also
+    loads the packed tags in it.
+    """
+    query = session.query(cls).options(joinedload(cls.profile_used))
+    if with_tags:
+      query = query.options(undefer(cls.tags_blob))
+    if cursor is not None:
+      timestamp, log_id = cursor
+      if newer:
+        query = query.filter(or_(cls.timestamp > timestamp, and_(cls.timestamp == timestamp, cls.id > log_id)))
+      else:
+        query = query.filter(or_(cls.timestamp < timestamp, and_(cls.timestamp == timestamp, cls.id < log_id)))
+
+    #the timestamp index also holds the rowid (id), so both orderings use it
+    if newer:
+      logs = query.order_by(cls.timestamp.asc(), cls.id.asc()).limit(limit).all()
+      logs.reverse()
+    else:
+      logs = query.order_by(cls.timestamp.desc(), cls.id.desc()).limit(limit).all()
+    return logs
+
   @classmethod
   def find_by_id(cls, session, log_id):
     """A class method to find a single log by its primary key (id)."""
     return session.query(cls).get(log_id)
-      
+
+  @classmethod
+  def find_by_tag(cls, session, tag_name, limit=25):
+    """
+    A class method to find the newest logs that removed a tag, by exact name.
+    Walks the tag's index in file_log_tags; no packed record is opened.
+    """
+    return (
+      session.query(cls)
+      .join(FileLogTag, FileLogTag.file_log_id == cls.id)
+      .join(TagName, TagName.id == FileLogTag.tag_name_id)
+      .filter(TagName.name == tag_name)
+      .options(joinedload(cls.profile_used))
+      .order_by(cls.timestamp.desc(), cls.id.desc())
+      .limit(limit)
+      .all()
+    )
+
+
   def delete(self, session):
     """An instance method to delete this specific log object from the database."""
-    session.delete(self)
+    FileLog.delete_many(session, [self.id])
+    session.commit()
+
+  @classmethod
+  def delete_many(cls, session, log_ids):
+    """
+    A class method to delete logs and their tag links by id with two set-based
+    statements, without loading them (no commit). Returns the number of logs deleted.
+    """
+    if not log_ids:
+      return 0
+    SearchIndex.remove_many(session, log_ids)
+    session.execute(delete(FileLogTag).where(FileLogTag.file_log_id.in_(log_ids)))
+    return session.execute(delete(cls).where(cls.id.in_(log_ids))).rowcount
+
+class TagName(Base):
+  """
+  A tag name stored once and referred to by id from packed records and
+  file_log_tags, instead of repeating the string for every file.
+  """
+  __tablename__ = 'tag_names'
+
+  id = Column(Integer, primary_key=True)
+  name = Column(String, nullable=False, unique=True)
+
+  #names by id, shared by the whole process; ids never change once committed
+  _names = {}
+
+  def __repr__(self):
+    return f"<TagName(id={self.id}, name='{self.name}')>"
+
+  @classmethod
+  def intern_many(cls, session, names):
+    """
+    A class method to return {name: id} for tag names, adding the ones not
+    stored yet (no commit).
+    """
+    names = set(names)
+    if not names:
+      return {}
+    session.execute(sqlite_insert(cls).on_conflict_do_nothing(index_elements=['name']), [{'name': name} for name in names])
+    return dict(session.query(cls.name, cls.id).filter(cls.name.in_(names)).all())
+
+  @classmethod
+  def names_for(cls, session, tag_ids):
+    """A class method to return {id: name} for tag name ids, from memory where possible."""
+    missing = set(tag_ids) - cls._names.keys()
+    if missing:
+      cls._names.update(session.query(cls.id, cls.name).filter(cls.id.in_(missing)).all())
+    return {tag_id: cls._names[tag_id] for tag_id in tag_ids}
+
+class FileLogTag(Base):
+  """
+  Links a log to the name of each tag it removed. The values live in the log's
+  packed record; these rows only keep lookups by tag name on an index.
+  """
+  __tablename__ = 'file_log_tags'
+  __table_args__ = (
+    #covers the logs of a tag, so tag filters and facets never read the table
+    Index('ix_file_log_tags_tag', 'tag_name_id', 'file_log_id'),
+  )
+
+  file_log_id = Column(Integer, ForeignKey('file_logs.id'), primary_key=True)
+  tag_name_id = Column(Integer, ForeignKey('tag_names.id'), primary_key=True)
+
+  def __repr__(self):
+    return f"<FileLogTag(file_log_id={self.file_log_id}, tag_name_id={self.tag_name_id})>"
+
+class SearchIndex:
+  """
+  The FTS5 table `file_log_search` over each log's paths and removed tag names,
+  keyed by the log id (its rowid). SQLAlchemy can't declare virtual tables, so
+  it is created by a migration and kept up to date through these class methods.
+  On SQLite builds without FTS5 the table doesn't exist and they do nothing.
+  """
+  TABLE = 'file_log_search'
+
+  #whether the table exists, checked once per process
+  _available = None
+
+  @classmethod
+  def available(cls, session):
+    if cls._available is None:
+      cls._available = session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': cls.TABLE}
+      ).first() is not None
+    return cls._available
+
+  @staticmethod
+  def row(log_id, original_path, processed_path, tag_names):
+    """The index row of a log."""
+    return {'rowid': log_id, 'paths': f"{original_path} {processed_path}", 'tags': " ".join(tag_names)}
+
+  @classmethod
+  def add_many(cls, session, rows):
+    """A class method to index logs (no commit)."""
+    if rows and cls.available(session):
+      session.execute(text(f"INSERT INTO {cls.TABLE} (rowid, paths, tags) VALUES (:rowid, :paths, :tags)"), rows)
+
+  @classmethod
+  def remove_many(cls, session, log_ids):
+    """A class method to drop logs from the index (no commit)."""
+    if log_ids and cls.available(session):
+      session.execute(text(f"DELETE FROM {cls.TABLE} WHERE rowid IN ({', '.join(str(int(log_id)) for log_id in log_ids)})"))
+
+class ScrubCacheEntry(Base):
+  """
+  Remembers the outcome of scrubbing a file with a given set of options, so
+  unchanged files can be skipped and duplicates can reuse an earlier output.
+  """
+  __tablename__ = 'scrub_cache'
+  __table_args__ = (
+    UniqueConstraint('source_path', 'settings_key'),
+    Index('ix_scrub_cache_content_hash', 'content_hash', 'settings_key'),
+  )
+
+  id = Column(Integer, primary_key=True)
+  source_path = Column(String, nullable=False)
+  #hash of the scrub options (tags, remove_all, in_place)
+  settings_key = Column(String, nullable=False)
+  source_size = Column(BigInteger)
+  source_mtime_ns = Column(BigInteger)
+  source_inode = Column(BigInteger)
+  #hash of the file contents before scrubbing
+  content_hash = Column(String, nullable=False)
+  output_path = Column(String, nullable=False)
+  output_size = Column(BigInteger)
+  output_mtime_ns = Column(BigInteger)
+  #removed tags as a JSON object of encoded values (see packing.encode_value), replayed into the audit trail on reuse
+  removed_json = Column(Text)
+  last_used = Column(DateTime(timezone=True), default=get_current_time_eat, index=True)
+
+  def __repr__(self):
+    return f"<ScrubCacheEntry(source='{self.source_path}', output='{self.output_path}')>"
+
+  @classmethod
+  def find_by_path(cls, session, source_path, settings_key):
+    """A class method to find the entry for a file scrubbed with the given options."""
+    return session.query(cls).filter_by(source_path=source_path, settings_key=settings_key).first()
+
+  @classmethod
+  def find_by_hash(cls, session, content_hash, settings_key):
+    """A class method to find entries for files with the same contents and options."""
+    return session.query(cls).filter_by(content_hash=content_hash, settings_key=settings_key).all()
+
+  @classmethod
+  def upsert_many(cls, session, rows):
+    """A class method to insert or replace many entries in one statement (no commit)."""
+    if not rows:
+      return
+    stmt = sqlite_insert(cls)
+    update_cols = {col: stmt.excluded[col] for col in rows[0] if col not in ('source_path', 'settings_key')}
+    session.execute(stmt.on_conflict_do_update(index_elements=['source_path', 'settings_key'], set_=update_cols), rows)
+
+  @classmethod
+  def touch_many(cls, session, entry_ids):
+    """A class method to mark entries as recently used (no commit)."""
+    if entry_ids:
+      session.query(cls).filter(cls.id.in_(entry_ids)).update({cls.last_used: get_current_time_eat()}, synchronize_session=False)
+
+  @classmethod
+  def evict(cls, session, max_entries=None, max_age=None):
+    """
+    A class method to bound the cache: drops entries unused for longer than
+    `max_age` (a timedelta) and then the least recently used ones beyond `max_entries`.
+    Returns the number of entries removed.
+    """
+    removed = 0
+    if max_age is not None:
+      cutoff = get_current_time_eat() - max_age
+      removed += session.execute(delete(cls).where(cls.last_used < cutoff)).rowcount
+    if max_entries is not None:
+      excess = session.query(func.count(cls.id)).scalar() - max_entries
+      if excess > 0:
+        oldest = select(cls.id).order_by(cls.last_used.asc()).limit(excess)
+        removed += session.execute(delete(cls).where(cls.id.in_(oldest))).rowcount
+    session.commit()
+    return removed
+
+class Job(Base):
+  """
+  A batch scrub, recorded so an interrupted run can be resumed.
+  Holds the options the batch was started with; its JobFiles are the checkpoint.
+  """
+  __tablename__ = 'jobs'
+
+  id = Column(Integer, primary_key=True)
+  root_path = Column(String, nullable=False)
+  #paths, walk options, tag names and remove_all as a JSON object
+  options_json = Column(Text, nullable=False)
+  profile_used_id = Column(Integer, ForeignKey('profiles.id'), nullable=True)
+  in_place = Column(Boolean, nullable=False, default=False)
+  #running until the batch completes; a running job nobody is working on was interrupted
+  status = Column(String, nullable=False, default='running', index=True)
+  created_at = Column(DateTime(timezone=True), default=get_current_time_eat)
+  finished_at = Column(DateTime(timezone=True), nullable=True)
+
+  #Relationships
+  profile_used = relationship('Profile')
+
+  def __repr__(self):
+    return f"<Job(id={self.id}, root='{self.root_path}', status='{self.status}')>"
+
+  @property
+  def options(self):
+    return json.loads(self.options_json)
+
+  @classmethod
+  def create(cls, session, paths, options, profile_id=None, in_place=False):
+    """A class method to record a new running job."""
+    job = cls(
+      root_path=paths[0] if paths else '',
+      options_json=json.dumps(dict(options, paths=list(paths))),
+      profile_used_id=profile_id,
+      in_place=in_place
+    )
+    session.add(job)
     session.commit()
+    return job
 
-class ScrubbedTag(Base):
-  """Represents a single key-value pair of metadata that was scrubbed from a file."""
-  __tablename__ = 'scrubbed_tags'
+  @classmethod
+  def find_by_id(cls, session, job_id):
+    """A class method to find a job by its ID."""
+    return session.query(cls).get(job_id)
+
+  @classmethod
+  def get_unfinished(cls, session):
+    """A class method to retrieve the jobs that never completed, newest first."""
+    return session.query(cls).filter_by(status='running').order_by(cls.id.desc()).all()
+
+  def count_files(self, session):
+    """Returns the number of files checkpointed so far."""
+    return session.query(func.count(JobFile.id)).filter(JobFile.job_id == self.id).scalar()
+
+  def finish(self, session):
+    """Marks the job as done and drops its checkpoint rows, which are no longer needed."""
+    session.execute(delete(JobFile).where(JobFile.job_id == self.id))
+    self.status = 'done'
+    self.finished_at = get_current_time_eat()
+    session.commit()
+
+class JobFile(Base):
+  """The checkpoint of one file of a Job: the outcome it reached."""
+  __tablename__ = 'job_files'
+  __table_args__ = (
+    UniqueConstraint('job_id', 'file_path'),
+  )
 
   id = Column(Integer, primary_key=True)
-  tag_name = Column(String)
-  tag_value = Column(String)
-  file_log_id = Column(Integer, ForeignKey('file_logs.id'))
+  job_id = Column(Integer, ForeignKey('jobs.id'), nullable=False)
+  file_path = Column(String, nullable=False)
+  #scrubbed, unchanged, reused, skipped or failed
+  status = Column(String, nullable=False)
+
+  #outcomes a resumed job passes over; files copied without changes (no
+  #metadata, broken Exif) are unchanged, so only real errors are retried
+  DONE = ('scrubbed', 'unchanged', 'reused', 'skipped')
 
-  #relationship
-  file_log = relationship('FileLog', back_populates='scrubbed_tags')
+  #paths looked up per query when a resumed job checks its walk against the checkpoint
+  LOOKUP_BATCH = 500
 
   def __repr__(self):
-    return f"<ScrubbedTag(tag_name='{self.tag_name}')>"
+    return f"<JobFile(job_id={self.job_id}, path='{self.file_path}', status='{self.status}')>"
 
-#creates all tables in the database.
-Base.metadata.create_all(engine)
\ No newline at end of file
+  @classmethod
+  def has_completed(cls, session, job_id):
+    """A class method to check whether a job has any file it no longer needs to process."""
+    return session.query(exists().where(cls.job_id == job_id, cls.status.in_(cls.DONE))).scalar()
+
+  @classmethod
+  def completed_among(cls, session, job_id, file_paths):
+    """
+    A class method to return which of `file_paths` a job no longer needs to process;
+    failed files are retried. One lookup on the (job_id, file_path) key per path,
+    so only the batch asked about is ever held in memory.
+    """
+    if not file_paths:
+      return set()
+    rows = session.query(cls.file_path).filter(
+      cls.job_id == job_id, cls.file_path.in_(set(file_paths)), cls.status.in_(cls.DONE)
+    )
+    return {file_path for (file_path,) in rows}
+
+  @classmethod
+  def upsert_many(cls, session, rows):
+    """A class method to insert or update many checkpoints in one statement (no commit)."""
+    if not rows:
+      return
+    stmt = sqlite_insert(cls)
+    session.execute(stmt.on_conflict_do_update(index_elements=['job_id', 'file_path'], set_={'status': stmt.excluded.status}), rows)
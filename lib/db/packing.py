@@ -0,0 +1,69 @@
+import base64
+import json
+import math
+import numbers
+import zlib
+
+#first byte of every packed record, so the layout can change without guessing
+PACK_FORMAT = 1
+
+
+def encode_value(value):
+  """
+  Turns a metadata value into JSON-friendly data that decode_value restores
+  with its type: bytes, tuples and dicts (GPSInfo has int keys) are wrapped in
+  a one-key object, so a plain JSON object never appears on its own.
+  """
+  if value is None or isinstance(value, (bool, int, str)):
+    return value
+  if isinstance(value, float):
+    #0/0 rationals are stored as nan, which JSON can't represent
+    return value if math.isfinite(value) else {'f': repr(value)}
+  if isinstance(value, (bytes, bytearray, memoryview)):
+    return {'b': base64.b64encode(bytes(value)).decode('ascii')}
+  if isinstance(value, tuple):
+    return {'t': [encode_value(item) for item in value]}
+  if isinstance(value, list):
+    return [encode_value(item) for item in value]
+  if isinstance(value, dict):
+    return {'d': [[encode_value(key), encode_value(item)] for key, item in value.items()]}
+  if isinstance(value, numbers.Real):
+    #Pillow's IFDRational and friends
+    return encode_value(float(value))
+  return str(value)
+
+
+def decode_value(data):
+  """Restores a value encoded by encode_value."""
+  if isinstance(data, list):
+    return [decode_value(item) for item in data]
+  if not isinstance(data, dict):
+    return data
+  (kind, payload), = data.items()
+  if kind == 'b':
+    return base64.b64decode(payload)
+  if kind == 't':
+    return tuple(decode_value(item) for item in payload)
+  if kind == 'd':
+    return {decode_value(key): decode_value(item) for key, item in payload}
+  if kind == 'f':
+    return float(payload)
+  raise ValueError(f"Unknown packed value type: {kind!r}")
+
+
+def pack_tags(pairs):
+  """
+  Packs (tag name id, value) pairs into one compressed record: a format byte
+  followed by zlib-compressed compact JSON.
+  """
+  body = json.dumps([[tag_id, encode_value(value)] for tag_id, value in pairs], separators=(',', ':'))
+  return bytes([PACK_FORMAT]) + zlib.compress(body.encode('utf-8'))
+
+
+def unpack_tags(blob):
+  """Returns the (tag name id, value) pairs of a packed record; none for an empty one."""
+  if not blob:
+    return []
+  if blob[0] != PACK_FORMAT:
+    raise ValueError(f"Unknown packed record format: {blob[0]}")
+  return [(tag_id, decode_value(value)) for tag_id, value in json.loads(zlib.decompress(blob[1:]))]
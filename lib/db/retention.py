@@ -0,0 +1,215 @@
+import gzip
+import json
+import os
+from collections import namedtuple
+
+from sqlalchemy import and_, func, or_, text
+from sqlalchemy.orm import joinedload, undefer
+
+from ..helpers import to_jsonable
+from .models import FileLog, get_current_time_eat
+
+#how much history to keep: `max_age` a timedelta, `max_logs` a count and
+#`max_bytes` the stored size of the logs (paths and packed tags); None is no limit
+RetentionPolicy = namedtuple('RetentionPolicy', ['max_age', 'max_logs', 'max_bytes'], defaults=(None, None, None))
+
+#outcome of a prune; `archives` are the files the expired logs were written to
+PruneResult = namedtuple('PruneResult', ['expired', 'deleted', 'archives'])
+
+#logs archived and deleted per transaction
+BATCH_SIZE = 1000
+
+#an archive file is finished and the next one started after this many logs
+ARCHIVE_ROLL_LOGS = 100000
+
+#without incremental auto-vacuum, a full VACUUM runs once this share of the file is free pages
+VACUUM_FREE_RATIO = 0.25
+
+
+def log_record(log):
+  """Returns a log as a JSON-friendly dictionary, as `audit export` and the archives write it."""
+  return {
+    'id': log.id,
+    'timestamp': log.timestamp.isoformat(),
+    'original_path': log.original_filepath,
+    'processed_path': log.processed_filepath,
+    'profile': log.profile_used.name if log.profile_used else None,
+    'scrubbed_tags': to_jsonable(log.removed_tags),
+  }
+
+
+def _log_bytes():
+  """SQL for the bytes a log takes up in the database, give or take the row overhead."""
+  return (
+    func.coalesce(func.length(FileLog.tags_blob), 0)
+    + func.length(FileLog.original_filepath)
+    + func.length(FileLog.processed_filepath)
+  )
+
+
+def expiry_boundary(session, policy):
+  """
+  Returns the (timestamp, id) of the newest log outside the policy, or None.
+  Every limit keeps the newest logs, so that log and all older ones expire.
+  """
+  newest_first = (FileLog.timestamp.desc(), FileLog.id.desc())
+  keys = session.query(FileLog.timestamp, FileLog.id)
+  candidates = []
+  if policy.max_age is not None:
+    cutoff = get_current_time_eat() - policy.max_age
+    candidates.append(keys.filter(FileLog.timestamp < cutoff).order_by(*newest_first).first())
+  if policy.max_logs is not None:
+    candidates.append(keys.order_by(*newest_first).offset(policy.max_logs).first())
+  if policy.max_bytes is not None:
+    #running total of the stored bytes, newest log first
+    sizes = session.query(
+      FileLog.timestamp, FileLog.id, func.sum(_log_bytes()).over(order_by=newest_first).label('kept_bytes')
+    ).subquery()
+    candidates.append(
+      session.query(sizes.c.timestamp, sizes.c.id)
+      .filter(sizes.c.kept_bytes > policy.max_bytes)
+      .order_by(sizes.c.timestamp.desc(), sizes.c.id.desc())
+      .first()
+    )
+  candidates = [tuple(row) for row in candidates if row is not None]
+  return max(candidates) if candidates else None
+
+
+def _up_to(boundary):
+  timestamp, log_id = boundary
+  return or_(FileLog.timestamp < timestamp, and_(FileLog.timestamp == timestamp, FileLog.id <= log_id))
+
+
+def iter_expired(session, boundary, batch_size=BATCH_SIZE):
+  """
+  Yields the logs up to `boundary` in batches, oldest first, with their packed tags.
+  Each batch is read after the last one with a keyset cursor, so it is an index range scan.
+  """
+  after = None
+  while True:
+    query = (
+      session.query(FileLog)
+      .options(joinedload(FileLog.profile_used), undefer(FileLog.tags_blob))
+      .filter(_up_to(boundary))
+    )
+    if after is not None:
+      timestamp, log_id = after
+      query = query.filter(or_(FileLog.timestamp > timestamp, and_(FileLog.timestamp == timestamp, FileLog.id > log_id)))
+    logs = query.order_by(FileLog.timestamp.asc(), FileLog.id.asc()).limit(batch_size).all()
+    if not logs:
+      return
+    yield logs
+    after = (logs[-1].timestamp, logs[-1].id)
+
+
+class ArchiveWriter:
+  """
+  Writes log records to rolling gzip-compressed JSON-lines files in `directory`.
+  A file is written as `<name>.part` and renamed once it is complete; every
+  batch is flushed and fsynced before the caller deletes the logs it holds.
+  """
+
+  def __init__(self, directory, roll_logs=ARCHIVE_ROLL_LOGS):
+    self.directory = directory
+    self.roll_logs = roll_logs
+    self.paths = []
+    self._raw = None
+    self._gzip = None
+    self._count = 0
+
+  def _open(self):
+    os.makedirs(self.directory, exist_ok=True)
+    stamp = get_current_time_eat().strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(self.directory, f"audit-{stamp}-{len(self.paths) + 1:03d}.jsonl.gz")
+    self._raw = open(path + '.part', 'wb')
+    self._gzip = gzip.GzipFile(filename='', mode='wb', fileobj=self._raw)
+    self._count = 0
+    self.paths.append(path)
+
+  def write(self, records):
+    """Appends records and makes them durable; rolls over to a new file when one is full."""
+    for record in records:
+      if self._gzip is None:
+        self._open()
+      self._gzip.write((json.dumps(record) + "\n").encode('utf-8'))
+      self._count += 1
+      if self._count >= self.roll_logs:
+        self._finish()
+    if self._gzip is not None:
+      #a sync flush leaves a readable stream even if the process dies before close()
+      self._gzip.flush()
+      self._raw.flush()
+      os.fsync(self._raw.fileno())
+
+  def _finish(self):
+    self._gzip.close()
+    self._raw.flush()
+    os.fsync(self._raw.fileno())
+    self._raw.close()
+    os.replace(self.paths[-1] + '.part', self.paths[-1])
+    self._gzip = self._raw = None
+
+  def close(self):
+    if self._gzip is not None:
+      self._finish()
+
+
+def prune(session, policy, archive_dir=None, batch_size=BATCH_SIZE, dry_run=False):
+  """
+  Deletes the logs outside `policy`, oldest first, in set-based batches of
+  `batch_size`, one transaction each. With `archive_dir` every batch is
+  archived (see ArchiveWriter) before it is deleted. `dry_run` only counts.
+  Returns a PruneResult.
+  """
+  boundary = expiry_boundary(session, policy)
+  if boundary is None:
+    return PruneResult(0, 0, [])
+  expired = session.query(func.count(FileLog.id)).filter(_up_to(boundary)).scalar()
+  if dry_run:
+    return PruneResult(expired, 0, [])
+
+  writer = ArchiveWriter(archive_dir) if archive_dir else None
+  deleted = 0
+  try:
+    for logs in iter_expired(session, boundary, batch_size):
+      if writer:
+        writer.write([log_record(log) for log in logs])
+      log_ids = [log.id for log in logs]
+      #the batch is done with; keeps memory flat on long trails
+      session.expunge_all()
+      deleted += FileLog.delete_many(session, log_ids)
+      session.commit()
+  finally:
+    if writer:
+      writer.close()
+  return PruneResult(expired, deleted, writer.paths if writer else [])
+
+
+def vacuum(engine, full=None):
+  """
+  Returns space freed by deleted rows to the file system. Databases in
+  incremental auto-vacuum mode give back their free pages; others are rebuilt
+  with VACUUM when at least VACUUM_FREE_RATIO of them is free, or when `full` is set.
+  Returns 'full', 'incremental' or None for nothing done.
+  """
+  with engine.connect() as connection:
+    mode = connection.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+    free_pages = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+    pages = connection.exec_driver_sql("PRAGMA page_count").scalar()
+  if full is None:
+    full = mode != 2 and pages and free_pages >= pages * VACUUM_FREE_RATIO
+  if not full and (mode != 2 or not free_pages):
+    return None
+
+  #VACUUM can't run inside a transaction
+  with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+    if full:
+      #also switches the database to incremental mode (see SQLITE_PRAGMAS)
+      connection.exec_driver_sql("VACUUM")
+    else:
+      #the sqlite3 module steps a statement once, which frees a single page;
+      #a script is stepped to the end
+      connection.connection.driver_connection.executescript("PRAGMA incremental_vacuum;")
+    #moves the freed pages out of the write-ahead log so the file itself shrinks
+    connection.execute(text("PRAGMA wal_checkpoint(TRUNCATE)")).fetchall()
+  return 'full' if full else 'incremental'
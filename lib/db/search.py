@@ -0,0 +1,197 @@
+import datetime
+import os
+import re
+from collections import namedtuple
+
+from sqlalchemy import Integer, exists, false, func, or_, select, text
+from sqlalchemy.orm import joinedload, undefer
+
+from .models import FileLog, FileLogTag, Profile, SearchIndex, TagName
+
+#what `audit search` looks for; every field left at None (or empty) doesn't filter.
+#`text` is matched as word prefixes against the paths and removed tag names,
+#`under` is a directory the original file was in, `since`/`until` are datetimes
+#(until exclusive), `profile` a profile name and `manual` the logs scrubbed without
+#one, and `with_tags`/`without_tags` are tag names or GLOB patterns such as 'GPS*'
+SearchQuery = namedtuple(
+  'SearchQuery',
+  ['text', 'under', 'since', 'until', 'profile', 'manual', 'with_tags', 'without_tags'],
+  defaults=(None, None, None, None, None, False, (), ()),
+)
+
+#matching logs newest first, how many there are in all, and the facets:
+#{'profiles': {name: count}, 'tags': {name: count}, 'days': {'YYYY-MM-DD': count}}
+SearchResult = namedtuple('SearchResult', ['total', 'logs', 'facets'])
+
+#the name the profiles facet gives logs scrubbed without a profile, as the log details do
+MANUAL = "Manual Scrub"
+
+#how many values each facet lists: the most frequent profiles and tags, and
+#the days up to the newest match
+FACET_LIMIT = 10
+
+#a tag removed from at most this many files drives the search from its index;
+#logs narrowed down by another filter are checked for commoner tags one by one
+TAG_INDEX_LIMIT = 50000
+
+#searches matching at most this many logs look them up once and count the
+#facets over their ids, rather than applying the filters again for each facet
+HIT_LIST_LIMIT = 5000
+
+
+def fts_query(words):
+  """
+  Turns free text into an FTS5 query where every word has to match as a word
+  prefix. Words are quoted, so FTS5 syntax in the input is taken literally.
+  """
+  #the same split as FTS5's default unicode61 tokenizer
+  terms = re.findall(r'[^\W_]+', words)
+  return " ".join(f'"{term}"*' for term in terms)
+
+
+def _text_condition(session, words):
+  """Logs whose paths or removed tag names contain every word."""
+  if SearchIndex.available(session):
+    query = fts_query(words)
+    if not query:
+      return None
+    matches = text(f"SELECT rowid FROM {SearchIndex.TABLE} WHERE {SearchIndex.TABLE} MATCH :query")
+    return FileLog.id.in_(matches.bindparams(query=query).columns(rowid=Integer))
+
+  #no FTS5 in this SQLite: substring scans, slow on big trails but the same answers
+  conditions = []
+  for term in re.findall(r'[^\W_]+', words):
+    pattern = f"%{term}%"
+    conditions.append(or_(
+      FileLog.original_filepath.like(pattern),
+      FileLog.processed_filepath.like(pattern),
+      FileLog.id.in_(_tag_logs(TagName.name.like(pattern))),
+    ))
+  return conditions
+
+
+def _tag_logs(name_condition):
+  """The ids of the logs that removed a tag whose name meets `name_condition`."""
+  return (
+    select(FileLogTag.file_log_id)
+    .join(TagName, TagName.id == FileLogTag.tag_name_id)
+    .where(name_condition)
+  )
+
+
+def _tag_condition(session, pattern, narrowed):
+  """
+  Logs that removed a tag matching `pattern`. The names are resolved to ids
+  first, so SQLite sees how the tag is stored; `narrowed` says whether another
+  filter already picks a smaller set of logs to check against the tag.
+  """
+  tag_ids = [tag_id for (tag_id,) in session.query(TagName.id).filter(TagName.name.op('GLOB')(pattern))]
+  if not tag_ids:
+    return false()
+  links = FileLogTag.tag_name_id.in_(tag_ids)
+  if narrowed and session.query(func.count()).select_from(FileLogTag).filter(links).scalar() > TAG_INDEX_LIMIT:
+    #a lookup on file_log_tags' primary key per candidate log
+    return exists().where(FileLogTag.file_log_id == FileLog.id, links)
+  return FileLog.id.in_(select(FileLogTag.file_log_id).where(links))
+
+
+def _under(directory):
+  """Original paths inside `directory`, as a range on their index rather than a LIKE."""
+  prefix = directory.rstrip(os.sep) + os.sep
+  #the smallest string after every string starting with the prefix
+  end = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+  return [FileLog.original_filepath >= prefix, FileLog.original_filepath < end]
+
+
+def conditions(session, query):
+  """Returns the SQL filters on FileLog for a SearchQuery."""
+  filters = []
+  if query.text:
+    condition = _text_condition(session, query.text)
+    if isinstance(condition, list):
+      filters += condition
+    elif condition is not None:
+      filters.append(condition)
+  if query.under:
+    filters += _under(query.under)
+  if query.since is not None:
+    filters.append(FileLog.timestamp >= query.since)
+  if query.until is not None:
+    filters.append(FileLog.timestamp < query.until)
+  if query.manual:
+    filters.append(FileLog.profile_used_id.is_(None))
+  elif query.profile is not None:
+    profile_id = select(Profile.id).where(Profile.name == query.profile).scalar_subquery()
+    filters.append(FileLog.profile_used_id == profile_id)
+  narrowed = bool(filters)
+  for pattern in query.with_tags:
+    filters.append(_tag_condition(session, pattern, narrowed))
+    narrowed = True
+  for pattern in query.without_tags:
+    tag_ids = select(TagName.id).where(TagName.name.op('GLOB')(pattern))
+    filters.append(~exists().where(FileLogTag.file_log_id == FileLog.id, FileLogTag.tag_name_id.in_(tag_ids)))
+  return filters
+
+
+def facets(session, filters, limit=FACET_LIMIT):
+  """
+  Counts the logs meeting `filters` per profile, per removed tag and per day
+  (the `limit` days up to the newest match). Each facet is one GROUP BY that,
+  unfiltered, reads only the index on profile_used_id, file_log_tags.tag_name_id
+  or timestamp.
+  """
+  count = func.count()
+  by_profile = (
+    session.query(FileLog.profile_used_id, count).filter(*filters)
+    .group_by(FileLog.profile_used_id).order_by(count.desc()).limit(limit).all()
+  )
+  profile_ids = [profile_id for profile_id, total in by_profile if profile_id is not None]
+  profile_names = dict(session.query(Profile.id, Profile.name).filter(Profile.id.in_(profile_ids))) if profile_ids else {}
+
+  tags = session.query(FileLogTag.tag_name_id, count)
+  if filters:
+    tags = tags.filter(FileLogTag.file_log_id.in_(select(FileLog.id).where(*filters)))
+  by_tag = tags.group_by(FileLogTag.tag_name_id).order_by(count.desc()).limit(limit).all()
+  tag_names = TagName.names_for(session, [tag_id for tag_id, total in by_tag])
+
+  by_day = []
+  newest = session.query(func.max(FileLog.timestamp)).filter(*filters).scalar()
+  if newest is not None:
+    #a range on the timestamp index instead of grouping the whole trail
+    first_day = datetime.datetime.combine(newest.date() - datetime.timedelta(days=limit - 1), datetime.time())
+    day = func.date(FileLog.timestamp)
+    by_day = (
+      session.query(day, count).filter(*filters).filter(FileLog.timestamp >= first_day)
+      .group_by(day).order_by(day.desc()).all()
+    )
+
+  return {
+    'profiles': {profile_names.get(profile_id, MANUAL): total for profile_id, total in by_profile},
+    'tags': {tag_names[tag_id]: total for tag_id, total in by_tag},
+    'days': {str(date): total for date, total in by_day},
+  }
+
+
+def search_logs(session, query, limit=50, with_facets=True, facet_limit=FACET_LIMIT):
+  """
+  Runs a SearchQuery. Returns a SearchResult with the newest `limit` matching
+  logs (all of them for None), their profiles and packed tags loaded, the total
+  count and, with `with_facets`, the facet counts.
+  """
+  filters = conditions(session, query)
+  total = None
+  if filters:
+    hits = [log_id for (log_id,) in session.query(FileLog.id).filter(*filters).limit(HIT_LIST_LIMIT + 1)]
+    if len(hits) <= HIT_LIST_LIMIT:
+      total, filters = len(hits), [FileLog.id.in_(hits)]
+  if total is None:
+    total = session.query(func.count(FileLog.id)).filter(*filters).scalar()
+  logs = (
+    session.query(FileLog)
+    .options(joinedload(FileLog.profile_used), undefer(FileLog.tags_blob))
+    .filter(*filters)
+    .order_by(FileLog.timestamp.desc(), FileLog.id.desc())
+    .limit(limit)
+    .all()
+  )
+  return SearchResult(total, logs, facets(session, filters, facet_limit) if with_facets else None)
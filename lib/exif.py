@@ -0,0 +1,208 @@
+import struct
+from collections import namedtuple
+
+#tags whose value is the offset of a sub-IFD
+EXIF_POINTER = 0x8769
+GPS_POINTER = 0x8825
+INTEROP_POINTER = 0xA005
+SUB_IFD_POINTERS = {EXIF_POINTER: 'Exif', GPS_POINTER: 'GPS', INTEROP_POINTER: 'Interop'}
+
+#byte size of a single value for each TIFF field type
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4}
+
+#struct codes for the numeric TIFF field types
+_NUMERIC_FORMATS = {3: 'H', 4: 'I', 6: 'b', 8: 'h', 9: 'i', 11: 'f', 12: 'd', 13: 'I'}
+
+#a single IFD entry, `pos` is where the 12-byte entry itself starts
+Entry = namedtuple('Entry', ['tag', 'type', 'count', 'value_offset', 'size', 'pos'])
+
+
+class Rational(float):
+  """
+  A TIFF rational that behaves like a float, like Pillow's IFDRational.
+  0/0 (common in the wild, e.g. DigitalZoomRatio) is stored as nan.
+  """
+
+  def __new__(cls, numerator, denominator):
+    value = numerator / denominator if denominator else float('nan')
+    obj = super().__new__(cls, value)
+    obj.numerator = numerator
+    obj.denominator = denominator
+    return obj
+
+  def __getnewargs__(self):
+    return self.numerator, self.denominator
+
+
+class ExifError(ValueError):
+  """Raised when a TIFF/Exif block cannot be parsed or edited safely."""
+
+
+class TiffBlock:
+  """
+  A writable view over a TIFF structure (the body of an Exif APP1 segment).
+  IFDs are addressed by the same names piexif uses: '0th', 'Exif', 'GPS', 'Interop', '1st'.
+  """
+
+  def __init__(self, buf):
+    self.buf = buf
+    byte_order = bytes(buf[:2])
+    if byte_order == b'II':
+      self.endian = '<'
+    elif byte_order == b'MM':
+      self.endian = '>'
+    else:
+      raise ExifError("Invalid TIFF byte order.")
+    if self._unpack('H', 2) != 42:
+      raise ExifError("Invalid TIFF magic number.")
+    self.ifds = self._locate_ifds()
+
+  def _unpack(self, fmt, offset):
+    size = struct.calcsize(fmt)
+    if offset < 0 or offset + size > len(self.buf):
+      raise ExifError(f"Offset {offset} is outside the Exif block.")
+    return struct.unpack(self.endian + fmt, self.buf[offset:offset + size])[0]
+
+  def _locate_ifds(self):
+    """Maps every IFD name to its offset inside the block."""
+    ifds = {}
+    first = self._unpack('I', 4)
+    ifds['0th'] = first
+    entries, next_ifd = self.read_ifd(first)
+    if next_ifd:
+      ifds['1st'] = next_ifd
+    for entry in entries:
+      if entry.tag in (EXIF_POINTER, GPS_POINTER):
+        ifds[SUB_IFD_POINTERS[entry.tag]] = self._pointer_value(entry)
+    if 'Exif' in ifds:
+      for entry in self.read_ifd(ifds['Exif'])[0]:
+        if entry.tag == INTEROP_POINTER:
+          ifds['Interop'] = self._pointer_value(entry)
+    return ifds
+
+  def _pointer_value(self, entry):
+    return self._unpack('I', entry.pos + 8)
+
+  def read_ifd(self, offset):
+    """Returns the entries of the IFD at `offset` and the offset of the next IFD."""
+    count = self._unpack('H', offset)
+    entries = []
+    for i in range(count):
+      pos = offset + 2 + i * 12
+      tag = self._unpack('H', pos)
+      field_type = self._unpack('H', pos + 2)
+      value_count = self._unpack('I', pos + 4)
+      size = TYPE_SIZES.get(field_type, 1) * value_count
+      #values of 4 bytes or less live inside the entry itself
+      value_offset = self._unpack('I', pos + 8) if size > 4 else None
+      entries.append(Entry(tag, field_type, value_count, value_offset, size, pos))
+    next_ifd = self._unpack('I', offset + 2 + count * 12)
+    return entries, next_ifd
+
+  def read_value(self, entry):
+    """
+    Decodes the value of an entry the way Pillow does: ASCII as str, BYTE and
+    UNDEFINED as bytes, rationals as Rational, single numbers unwrapped from their tuple.
+    Returns None when the value points outside the block.
+    """
+    if entry.value_offset is None:
+      start = entry.pos + 8
+    else:
+      start = entry.value_offset
+    if start + entry.size > len(self.buf):
+      return None
+    data = bytes(self.buf[start:start + entry.size])
+
+    if entry.type == 2:
+      if data.endswith(b'\x00'):
+        data = data[:-1]
+      return data.decode('latin-1', 'replace')
+    if entry.type in (5, 10):
+      values = struct.unpack(f"{self.endian}{entry.count * 2}{'I' if entry.type == 5 else 'i'}", data)
+      values = tuple(Rational(num, den) for num, den in zip(values[::2], values[1::2]))
+    elif entry.type in _NUMERIC_FORMATS:
+      values = struct.unpack(f"{self.endian}{entry.count}{_NUMERIC_FORMATS[entry.type]}", data)
+    else:
+      return data
+    return values[0] if len(values) == 1 else values
+
+  def read_ifd_values(self, ifd_name):
+    """Returns {tag_id: value} for every readable entry of an IFD."""
+    offset = self.ifds.get(ifd_name)
+    if offset is None:
+      return {}
+    values = {}
+    for entry in self.read_ifd(offset)[0]:
+      value = self.read_value(entry)
+      if value is not None:
+        values[entry.tag] = value
+    return values
+
+  def to_dict(self):
+    """Returns every IFD as {ifd_name: {tag_id: value}}, laid out like piexif.load."""
+    return {ifd_name: self.read_ifd_values(ifd_name) for ifd_name in ('0th', 'Exif', 'GPS', 'Interop', '1st')}
+
+  def merged_tags(self):
+    """
+    Returns IFD0 and the Exif IFD merged into one {tag_id: value} dictionary,
+    with the GPS IFD nested under the GPSInfo tag, matching Pillow's _getexif.
+    """
+    tags = self.read_ifd_values('0th')
+    tags.update(self.read_ifd_values('Exif'))
+    if 'GPS' in self.ifds:
+      tags[GPS_POINTER] = self.read_ifd_values('GPS')
+    return tags
+
+  def _blank(self, start, size):
+    """Zeroes `size` bytes at `start`, ignoring ranges that fall outside the block."""
+    end = min(start + size, len(self.buf))
+    if start < end:
+      self.buf[start:end] = bytes(end - start)
+
+  def _blank_ifd(self, offset):
+    """Zeroes an entire IFD, including the out-of-line values of its entries."""
+    entries, next_ifd = self.read_ifd(offset)
+    for entry in entries:
+      if entry.value_offset is not None:
+        self._blank(entry.value_offset, entry.size)
+    self._blank(offset, 2 + len(entries) * 12 + 4)
+
+  def _drop_sub_ifd(self, sub_name):
+    """Zeroes a sub-IFD and forgets it; the Interop IFD goes along with the Exif IFD."""
+    if sub_name == 'Exif' and 'Interop' in self.ifds:
+      self._blank_ifd(self.ifds.pop('Interop'))
+    if sub_name in self.ifds:
+      self._blank_ifd(self.ifds.pop(sub_name))
+
+  def remove_tags(self, ifd_name, tag_ids, drop_sub_ifds=False):
+    """
+    Removes entries from an IFD without moving any other data.
+    The remaining entries are packed together, the entry count and the
+    next-IFD pointer are updated, and the freed bytes and removed values
+    are zeroed. Removing the GPS pointer zeroes the whole GPS IFD; the Exif
+    and Interop pointers can only go with `drop_sub_ifds`, since their IFDs
+    hold tags a selective scrub keeps.
+    Returns the set of tag ids that were actually removed.
+    """
+    offset = self.ifds.get(ifd_name)
+    if offset is None:
+      return set()
+    entries, next_ifd = self.read_ifd(offset)
+    removed = [entry for entry in entries if entry.tag in tag_ids]
+    if not removed:
+      return set()
+
+    for entry in removed:
+      if entry.tag in SUB_IFD_POINTERS:
+        sub_name = SUB_IFD_POINTERS[entry.tag]
+        if sub_name != 'GPS' and not drop_sub_ifds:
+          raise ExifError(f"Cannot remove the {sub_name} IFD pointer in place.")
+        self._drop_sub_ifd(sub_name)
+      elif entry.value_offset is not None:
+        self._blank(entry.value_offset, entry.size)
+
+    kept = [bytes(self.buf[e.pos:e.pos + 12]) for e in entries if e.tag not in tag_ids]
+    end = offset + 2 + len(entries) * 12 + 4
+    packed = struct.pack(self.endian + 'H', len(kept)) + b''.join(kept) + struct.pack(self.endian + 'I', next_ifd)
+    self.buf[offset:end] = packed + bytes(end - offset - len(packed))
+    return {entry.tag for entry in removed}
@@ -0,0 +1,21 @@
+from .base import Backend, FormatError
+from . import heic, jpeg, png, tiff, webp
+
+#container backends, tried in order against the first bytes of a file
+BACKENDS = [jpeg.BACKEND, png.BACKEND, webp.BACKEND, heic.BACKEND, tiff.BACKEND]
+
+
+def register(backend, first=False):
+  """Adds a Backend to the registry; `first` lets it take precedence over the built-in ones."""
+  if first:
+    BACKENDS.insert(0, backend)
+  else:
+    BACKENDS.append(backend)
+
+
+def backend_for(head):
+  """Returns the Backend for a file starting with `head` (at least 16 bytes), or None."""
+  for backend in BACKENDS:
+    if backend.sniff(head):
+      return backend
+  return None
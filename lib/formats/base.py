@@ -0,0 +1,239 @@
+import re
+from collections import namedtuple
+
+from .. import exif, metrics
+from ..tagnames import TAGS
+
+#a container format whose metadata can be rewritten without touching pixel data.
+#`sniff(head)` checks the first 16 bytes of a file; `strip(data)` drops every
+#metadata block and `scrub_tags(data, matcher)` removes selected Exif tags. Both
+#return the byte chunks of the new file, a dictionary of the removed data and any error message.
+#`exif_block(data)` returns the TIFF bytes of the Exif block, or None, reading headers only.
+Backend = namedtuple('Backend', ['name', 'sniff', 'strip', 'scrub_tags', 'exif_block'])
+
+EXIF_HEADER = b'Exif\x00\x00'
+
+NO_METADATA = "No EXIF metadata found. File was copied without changes."
+INVALID_EXIF = "Image contains invalid EXIF data. File was copied without changes."
+
+
+class FormatError(ValueError):
+  """Raised when a container can't be parsed or edited; the scrubber then falls back to Pillow."""
+
+
+def strip_ranges(drop, end):
+  """
+  Returns the (start, end) byte ranges to copy so that the blocks in `drop`
+  (anything with `start`/`end` offsets, in file order) are left out.
+  Everything else is kept as is up to `end`.
+  """
+  ranges = []
+  pos = 0
+  for block in drop:
+    if block.start > pos:
+      ranges.append((pos, block.start))
+    pos = block.end
+  if end > pos:
+    ranges.append((pos, end))
+  return ranges
+
+
+def copy_ranges(data, ranges):
+  """Returns the ranges of a buffer as zero-copy chunks."""
+  view = memoryview(data)
+  return [view[start:stop] for start, stop in ranges]
+
+
+def unique_name(removed_data, name, offset):
+  """Keeps a second block of the same kind from overwriting the first in the removed data."""
+  return f"{name}_{offset}" if name in removed_data else name
+
+
+def tags_by_name(tags):
+  """Converts {tag_id: value} into {tag_name: value}, keeping unknown ids as ints."""
+  return {TAGS.get(tag_id, tag_id): value for tag_id, value in tags.items()}
+
+
+def metadata_from_tiff(tiff_bytes):
+  """Parses an Exif block into {tag_name: value}, in the same shape as Pillow's _getexif."""
+  return tags_by_name(exif.TiffBlock(tiff_bytes).merged_tags())
+
+
+def report_exif(tiff_bytes, removed_data):
+  """Adds the tags of an Exif block to the removed data, or the raw block if it can't be parsed."""
+  try:
+    metadata = metadata_from_tiff(tiff_bytes)
+  except exif.ExifError:
+    metadata = None
+  if metadata:
+    removed_data.update(metadata)
+  else:
+    removed_data['Exif'] = bytes(tiff_bytes)
+
+
+#ensures selective removal succeeds even on imperfect EXIF blocks.
+def safe_dump(edict, removed_data):
+  """
+  Retry loop - remove offending tag ids reported by piexif
+  until dump succeeds or nothing left to remove.
+  """
+  #only the fallbacks rebuild Exif blocks, so piexif loads when one of them runs
+  import piexif
+  attempts = 0
+  while True:
+    try:
+      return piexif.dump(edict)
+    except Exception as e:
+      attempts += 1
+      metrics.count('safe_dump.retries')
+      if attempts > 10:
+          raise
+
+      msg = str(e)
+      #finds the first integer in the error message; piexif
+      m = re.search(r"(\d+)", msg)
+      if not m:
+        #if couldn't parse tag id from message, re-raise
+        raise
+      bad_id = int(m.group(1))
+
+      removed_any = False
+      for ifd_nm in ('0th', 'Exif', 'GPS', '1st', 'thumbnail'):
+        #some IFD entries may be None instead of dicts
+        #record as removed due to invalid type
+        if ifd_nm in edict and isinstance(edict[ifd_nm], dict) and bad_id in edict[ifd_nm]:
+          name = TAGS.get(bad_id, bad_id)
+          if name not in removed_data:
+              removed_data[name] = 'removed_due_to_invalid_type'
+          edict[ifd_nm].pop(bad_id, None)
+          removed_any = True
+
+      if not removed_any:
+        # if nothing removed can't recover
+        raise
+
+
+def remove_exif_tags(buf, matcher, keep=None):
+  """
+  Cuts the matcher's tags out of a writable TIFF-structured buffer in place,
+  so the block keeps its size and no other offset moves. `keep` maps IFD
+  names to tag ids the matcher never sees, so they stay whatever it matches.
+  Returns the removed data and the removed tag ids by IFD.
+  Raises exif.ExifError when the block can't be edited in place.
+  """
+  #the block is parsed once: the same structure reports and removes the tags
+  block = exif.TiffBlock(buf)
+  tags = block.to_dict()
+  for ifd_name, tag_ids in (keep or {}).items():
+    ifd = tags.get(ifd_name)
+    if isinstance(ifd, dict):
+      for tag_id in tag_ids.intersection(ifd):
+        del ifd[tag_id]
+  removed_data, removed_ids = matcher.match(tags)
+  for ifd_name, tag_ids in removed_ids.items():
+    block.remove_tags(ifd_name, tag_ids)
+  return removed_data, removed_ids
+
+
+def scrub_exif_block(tiff_bytes, matcher):
+  """
+  Removes the matcher's tags from a standalone Exif block (TIFF bytes, no header).
+  The block is edited in place when possible and rebuilt with piexif otherwise,
+  in which case its size may change.
+  Returns the new block (None when nothing was removed), the removed data and any error message.
+  """
+  try:
+    buf = bytearray(tiff_bytes)
+    removed_data, removed_ids = remove_exif_tags(buf, matcher)
+    new_block = bytes(buf)
+  except exif.ExifError:
+    #falls back to rebuilding the whole block with piexif
+    import piexif
+    try:
+      exif_dict = piexif.load(bytes(tiff_bytes))
+    except Exception:
+      exif_dict = None
+    if exif_dict is None:
+      #if broken EXIF block; copy file without changes.
+      return None, {}, INVALID_EXIF
+    removed_data, removed_ids = matcher.match(exif_dict)
+    new_block = safe_dump(exif_dict, removed_data)[len(EXIF_HEADER):]
+
+  if not removed_ids:
+    return None, removed_data, None
+  return new_block, removed_data, None
+
+
+class PatchedBuffer:
+  """
+  A copy-on-write view over a read-only buffer such as a mapped file.
+  Writes go to private copies of the pages they touch, so editing a few IFDs
+  of a large TIFF copies kilobytes rather than the file. Writes must not
+  change the length of the buffer. `chunks()` returns the edited file as
+  slices of the original interleaved with the patched pages.
+  """
+  PAGE_SIZE = 4096
+
+  def __init__(self, base):
+    self.base = base
+    self.pages = {}
+
+  def __len__(self):
+    return len(self.base)
+
+  def _span(self, key):
+    start, stop, step = key.indices(len(self.base))
+    if step != 1:
+      raise ValueError("PatchedBuffer only supports contiguous slices.")
+    return start, max(start, stop)
+
+  def __getitem__(self, key):
+    if not isinstance(key, slice):
+      return self[key:key + 1][0]
+    start, stop = self._span(key)
+    first, last = start // self.PAGE_SIZE, (stop - 1) // self.PAGE_SIZE
+    if not any(index in self.pages for index in range(first, last + 1)):
+      return bytes(self.base[start:stop])
+
+    out = bytearray()
+    pos = start
+    while pos < stop:
+      index, offset = divmod(pos, self.PAGE_SIZE)
+      end = min(stop, (index + 1) * self.PAGE_SIZE)
+      page = self.pages.get(index)
+      out += page[offset:offset + end - pos] if page is not None else self.base[pos:end]
+      pos = end
+    return bytes(out)
+
+  def __setitem__(self, key, value):
+    start, stop = self._span(key)
+    value = bytes(value)
+    if len(value) != stop - start:
+      raise ValueError("PatchedBuffer writes must not change its length.")
+
+    pos = start
+    while pos < stop:
+      index, offset = divmod(pos, self.PAGE_SIZE)
+      end = min(stop, (index + 1) * self.PAGE_SIZE)
+      page = self.pages.get(index)
+      if page is None:
+        page_start = index * self.PAGE_SIZE
+        page = self.pages[index] = bytearray(self.base[page_start:page_start + self.PAGE_SIZE])
+      page[offset:offset + end - pos] = value[pos - start:end - start]
+      pos = end
+
+  def chunks(self):
+    """Returns the edited contents as a list of byte chunks, untouched ranges uncopied."""
+    view = memoryview(self.base)
+    chunks = []
+    pos = 0
+    for index in sorted(self.pages):
+      start = index * self.PAGE_SIZE
+      if start > pos:
+        chunks.append(view[pos:start])
+      page = self.pages[index]
+      chunks.append(bytes(page))
+      pos = start + len(page)
+    if pos < len(self.base):
+      chunks.append(view[pos:])
+    return chunks
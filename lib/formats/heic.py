@@ -0,0 +1,225 @@
+import struct
+from collections import namedtuple
+
+from . import base
+
+#major brands of HEIF-family files (HEIC, HEIF sequences, AVIF)
+BRANDS = {b'heic', b'heix', b'hevc', b'hevx', b'heim', b'heis', b'mif1', b'msf1', b'avif', b'avis'}
+
+XMP_CONTENT_TYPE = 'application/rdf+xml'
+
+#an empty XMP packet; written over removed XMP and padded with spaces as XMP allows
+EMPTY_XMP = b'<?xpacket begin="" id="W5M0MpCehiHzreSzNTczkc9d"?><?xpacket end="w"?>'
+
+#a box, payload is where its contents start (after size, type and any large size)
+Box = namedtuple('Box', ['type', 'start', 'payload', 'end'])
+
+#a metadata item stored as a single extent of the file
+Item = namedtuple('Item', ['item_id', 'item_type', 'content_type', 'offset', 'length'])
+
+
+def is_heif(buf):
+  """Checks for an ftyp box with a HEIF-family major brand."""
+  return buf[4:8] == b'ftyp' and buf[8:12] in BRANDS
+
+
+def iter_boxes(buf, start, end):
+  """Yields the Boxes between two offsets of an ISO-BMFF buffer."""
+  pos = start
+  while pos + 8 <= end:
+    size, box_type = struct.unpack('>I4s', buf[pos:pos + 8])
+    payload = pos + 8
+    if size == 1:
+      if pos + 16 > end:
+        raise base.FormatError("Truncated box header.")
+      size = struct.unpack('>Q', buf[pos + 8:pos + 16])[0]
+      payload = pos + 16
+    elif size == 0:
+      size = end - pos
+    if size < payload - pos or pos + size > end:
+      raise base.FormatError(f"Invalid size for box at offset {pos}.")
+    yield Box(box_type, pos, payload, pos + size)
+    pos += size
+
+
+def _find(buf, start, end, box_type):
+  return next((box for box in iter_boxes(buf, start, end) if box.type == box_type), None)
+
+
+def _uint(buf, pos, size):
+  """Reads a big-endian unsigned integer of 0, 2, 4 or 8 bytes."""
+  if size == 0:
+    return 0, pos
+  fmt = {2: '>H', 4: '>I', 8: '>Q'}.get(size)
+  if fmt is None:
+    raise base.FormatError(f"Unsupported field size {size}.")
+  return struct.unpack(fmt, buf[pos:pos + size])[0], pos + size
+
+
+def _item_infos(buf, iinf):
+  """Returns {item_id: (item_type, content_type)} from an iinf box."""
+  version = buf[iinf.payload]
+  pos = iinf.payload + 4 + (2 if version == 0 else 4)
+  infos = {}
+  for infe in iter_boxes(buf, pos, iinf.end):
+    if infe.type != b'infe':
+      continue
+    infe_version = buf[infe.payload]
+    if infe_version < 2:
+      continue
+    pos = infe.payload + 4
+    item_id, pos = _uint(buf, pos, 2 if infe_version == 2 else 4)
+    item_type = bytes(buf[pos + 2:pos + 6])
+    content_type = ''
+    if item_type == b'mime':
+      #item_name and content_type are null-terminated strings
+      strings = bytes(buf[pos + 6:infe.end]).split(b'\x00')
+      if len(strings) > 1:
+        content_type = strings[1].decode('utf-8', 'replace')
+    infos[item_id] = (item_type, content_type)
+  return infos
+
+
+def _item_locations(buf, iloc):
+  """Returns {item_id: [(offset, length), ...]} for items stored in the file itself."""
+  version = buf[iloc.payload]
+  pos = iloc.payload + 4
+  offset_size, length_size = buf[pos] >> 4, buf[pos] & 0x0F
+  base_offset_size, index_size = buf[pos + 1] >> 4, buf[pos + 1] & 0x0F
+  pos += 2
+  count, pos = _uint(buf, pos, 2 if version < 2 else 4)
+
+  locations = {}
+  for _ in range(count):
+    item_id, pos = _uint(buf, pos, 2 if version < 2 else 4)
+    construction_method = 0
+    if version in (1, 2):
+      construction_method = struct.unpack('>H', buf[pos:pos + 2])[0] & 0x0F
+      pos += 2
+    pos += 2  #data_reference_index
+    base_offset, pos = _uint(buf, pos, base_offset_size)
+    extent_count, pos = _uint(buf, pos, 2)
+    extents = []
+    for _ in range(extent_count):
+      if version in (1, 2) and index_size:
+        pos += index_size
+      offset, pos = _uint(buf, pos, offset_size)
+      length, pos = _uint(buf, pos, length_size)
+      extents.append((base_offset + offset, length))
+    #items inside idat or other items aren't addressed by file offset
+    if construction_method == 0:
+      locations[item_id] = extents
+  return locations
+
+
+def metadata_items(buf):
+  """Returns the Exif and XMP Items of a HEIF buffer."""
+  size = len(buf)
+  meta = _find(buf, 0, size, b'meta')
+  if meta is None:
+    return []
+  #meta is a full box: version and flags come before its children
+  iinf = _find(buf, meta.payload + 4, meta.end, b'iinf')
+  iloc = _find(buf, meta.payload + 4, meta.end, b'iloc')
+  if iinf is None or iloc is None:
+    return []
+
+  locations = _item_locations(buf, iloc)
+  items = []
+  for item_id, (item_type, content_type) in sorted(_item_infos(buf, iinf).items()):
+    if item_type != b'Exif' and content_type != XMP_CONTENT_TYPE:
+      continue
+    extents = locations.get(item_id)
+    if not extents:
+      continue
+    if len(extents) > 1:
+      raise base.FormatError("Metadata items split across extents are not supported.")
+    offset, length = extents[0]
+    #a length of 0 means the item runs to the end of the file
+    length = length or size - offset
+    if offset + length > size:
+      raise base.FormatError(f"Item {item_id} lies outside the file.")
+    items.append(Item(item_id, item_type, content_type, offset, length))
+  return items
+
+
+def _exif_span(buf, item):
+  """Returns the (start, end) of the TIFF block inside an Exif item."""
+  if item.length < 4:
+    raise base.FormatError("Exif item is too short.")
+  #the item starts with the offset of the TIFF header from the end of this field
+  header_offset = struct.unpack('>I', buf[item.offset:item.offset + 4])[0]
+  start = item.offset + 4 + header_offset
+  end = item.offset + item.length
+  if start >= end:
+    raise base.FormatError("Invalid Exif item header.")
+  return start, end
+
+
+def _empty_tiff(size):
+  """An Exif block with no tags, zero-padded to `size` bytes."""
+  empty = b'MM\x00*' + struct.pack('>I', 8) + b'\x00\x00' + b'\x00\x00\x00\x00'
+  if size < len(empty):
+    return b'\x00' * size
+  return empty + b'\x00' * (size - len(empty))
+
+
+def strip(data):
+  """
+  Blanks the Exif and XMP items of a HEIF file in place: the Exif block is
+  replaced by an empty one and the XMP packet by an empty, space-padded
+  packet of the same size, so no item offset changes and the coded image is copied untouched.
+  Returns the byte chunks of the scrubbed file, a dictionary of the removed data and any error message.
+  """
+  items = metadata_items(data)
+  if not items:
+    return [data], {}, base.NO_METADATA
+
+  buf = base.PatchedBuffer(data)
+  removed_data = {}
+  for item in items:
+    if item.item_type == b'Exif':
+      start, end = _exif_span(data, item)
+      base.report_exif(data[start:end], removed_data)
+      buf[start:end] = _empty_tiff(end - start)
+    else:
+      start, end = item.offset, item.offset + item.length
+      xmp = bytes(data[start:end])
+      removed_data[base.unique_name(removed_data, 'XMP', start)] = xmp.decode('utf-8', 'replace')
+      blank = EMPTY_XMP if len(EMPTY_XMP) <= len(xmp) else b''
+      buf[start:end] = blank + b' ' * (len(xmp) - len(blank))
+  return buf.chunks(), removed_data, None
+
+
+def scrub_tags(data, matcher):
+  """
+  Removes selected tags from the Exif item of a HEIF file in place.
+  Returns the byte chunks of the scrubbed file, a dictionary of the removed data and any error message.
+  """
+  item = next((item for item in metadata_items(data) if item.item_type == b'Exif'), None)
+  if item is None:
+    return [data], {}, base.NO_METADATA
+
+  start, end = _exif_span(data, item)
+  new_block, removed_data, error = base.scrub_exif_block(data[start:end], matcher)
+  if new_block is None:
+    return [data], removed_data, error
+  if len(new_block) > end - start:
+    #the item can't grow without rewriting iloc
+    raise base.FormatError("Rebuilt Exif block does not fit its item.")
+
+  buf = base.PatchedBuffer(data)
+  buf[start:end] = new_block + b'\x00' * (end - start - len(new_block))
+  return buf.chunks(), removed_data, None
+
+
+def exif_block(data):
+  """Returns the TIFF bytes of a HEIF file's Exif item, or None."""
+  item = next((item for item in metadata_items(data) if item.item_type == b'Exif'), None)
+  if item is None:
+    return None
+  start, end = _exif_span(data, item)
+  return bytes(data[start:end])
+
+
+BACKEND = base.Backend('HEIF', is_heif, strip, scrub_tags, exif_block)
@@ -0,0 +1,246 @@
+import io
+import mmap
+import struct
+from collections import namedtuple
+
+from . import base
+
+#JPEG markers the scrubber cares about
+SOI = 0xD8
+EOI = 0xD9
+SOS = 0xDA
+APP0 = 0xE0
+APP1 = 0xE1
+APP2 = 0xE2
+APP13 = 0xED
+APP14 = 0xEE
+COM = 0xFE
+
+#markers that stand alone without a length field
+_STANDALONE = {0x01} | set(range(0xD0, 0xD8))
+
+EXIF_HEADER = base.EXIF_HEADER
+XMP_HEADER = b'http://ns.adobe.com/xap/1.0/\x00'
+XMP_EXT_HEADER = b'http://ns.adobe.com/xmp/extension/\x00'
+IPTC_HEADER = b'Photoshop 3.0\x00'
+ICC_HEADER = b'ICC_PROFILE\x00'
+MPF_HEADER = b'MPF\x00'
+
+#a marker segment, start/end are byte offsets of the whole segment (marker included)
+Segment = namedtuple('Segment', ['marker', 'start', 'end'])
+
+
+class JPEGError(base.FormatError):
+  """Raised when a buffer is not a well-formed JPEG marker stream."""
+
+
+def is_jpeg(buf):
+  """Checks the SOI marker at the start of a buffer."""
+  return buf[:3] == b'\xff\xd8\xff'
+
+
+def parse_segments(buf):
+  """
+  Walks the marker stream of a JPEG buffer without decoding any pixels.
+  Returns a list of Segments (entropy-coded scan data is not included)
+  and the offset just past the EOI marker.
+  """
+  if not is_jpeg(buf):
+    raise JPEGError("Not a JPEG file.")
+
+  size = len(buf)
+  segments = [Segment(SOI, 0, 2)]
+  pos = 2
+  while True:
+    if pos >= size or buf[pos] != 0xFF:
+      raise JPEGError(f"Expected a marker at offset {pos}.")
+    #skips fill bytes in front of the marker
+    while pos + 1 < size and buf[pos + 1] == 0xFF:
+      pos += 1
+    if pos + 1 >= size:
+      raise JPEGError("Truncated marker.")
+    marker = buf[pos + 1]
+
+    if marker == EOI:
+      segments.append(Segment(EOI, pos, pos + 2))
+      return segments, pos + 2
+    if marker in _STANDALONE:
+      segments.append(Segment(marker, pos, pos + 2))
+      pos += 2
+      continue
+
+    if pos + 4 > size:
+      raise JPEGError("Truncated segment header.")
+    length = struct.unpack('>H', buf[pos + 2:pos + 4])[0]
+    end = pos + 2 + length
+    if length < 2 or end > size:
+      raise JPEGError(f"Invalid length for segment at offset {pos}.")
+    segments.append(Segment(marker, pos, end))
+    pos = end
+
+    if marker == SOS:
+      pos = _skip_entropy_data(buf, pos, size)
+
+
+def _skip_entropy_data(buf, pos, size):
+  """Returns the offset of the first real marker after a scan's entropy-coded data."""
+  while True:
+    pos = buf.find(b'\xff', pos)
+    if pos < 0 or pos + 1 >= size:
+      raise JPEGError("Missing EOI marker.")
+    nxt = buf[pos + 1]
+    #stuffed zero bytes and restart markers belong to the scan
+    if nxt == 0x00 or 0xD0 <= nxt <= 0xD7:
+      pos += 2
+    elif nxt == 0xFF:
+      pos += 1
+    else:
+      return pos
+
+
+def read_exif_payload(f):
+  """
+  Reads the Exif APP1 block from a JPEG file object positioned at its start.
+  Only the marker headers are read and every other segment is skipped with a
+  seek, stopping at the first scan. Returns the TIFF bytes after the Exif
+  header, or None if the file has no Exif segment.
+  """
+  if f.read(2) != b'\xff\xd8':
+    raise JPEGError("Not a JPEG file.")
+  while True:
+    head = f.read(2)
+    if len(head) < 2 or head[0] != 0xFF:
+      raise JPEGError("Expected a marker.")
+    marker = head[1]
+    #skips fill bytes in front of the marker
+    while marker == 0xFF:
+      byte = f.read(1)
+      if not byte:
+        raise JPEGError("Truncated marker.")
+      marker = byte[0]
+    if marker in (SOS, EOI):
+      return None
+    if marker in _STANDALONE:
+      continue
+
+    length_bytes = f.read(2)
+    if len(length_bytes) < 2:
+      raise JPEGError("Truncated segment header.")
+    length = struct.unpack('>H', length_bytes)[0]
+    if length < 2:
+      raise JPEGError("Invalid segment length.")
+    if marker == APP1:
+      payload = f.read(length - 2)
+      if payload.startswith(EXIF_HEADER):
+        return payload[len(EXIF_HEADER):]
+    else:
+      f.seek(length - 2, 1)
+
+
+def segment_payload(buf, segment):
+  """Returns the bytes of a segment after its marker and length field."""
+  return bytes(buf[segment.start + 4:segment.end])
+
+
+def is_metadata_segment(buf, segment):
+  """
+  Decides whether a segment carries metadata rather than image data.
+  JFIF (APP0), ICC profiles (APP2) and the Adobe colour transform (APP14)
+  are kept because decoders need them to render the image correctly.
+  """
+  marker = segment.marker
+  if marker == COM or marker == APP1 or marker == APP13:
+    return True
+  if marker == APP2:
+    return buf[segment.start + 4:segment.start + 4 + len(MPF_HEADER)] == MPF_HEADER
+  return APP0 < marker <= 0xEF and marker not in (APP2, APP14)
+
+
+def describe_segment(buf, segment):
+  """Returns a (name, value) pair describing a metadata segment for the audit trail."""
+  payload = segment_payload(buf, segment)
+  if segment.marker == APP1:
+    if payload.startswith(EXIF_HEADER):
+      return 'Exif', payload[len(EXIF_HEADER):]
+    if payload.startswith(XMP_HEADER):
+      return 'XMP', payload[len(XMP_HEADER):].decode('utf-8', 'replace')
+    if payload.startswith(XMP_EXT_HEADER):
+      return 'XMPExtension', payload
+  if segment.marker == APP13 and payload.startswith(IPTC_HEADER):
+    return 'IPTC', payload[len(IPTC_HEADER):]
+  if segment.marker == COM:
+    return 'Comment', payload.decode('utf-8', 'replace')
+  if segment.marker == APP2:
+    return 'MPF', payload
+  return f'APP{segment.marker - APP0}', payload
+
+
+def find_exif(buf, segments):
+  """Returns the first APP1 Exif segment, or None."""
+  for seg in segments:
+    if seg.marker == APP1 and buf[seg.start + 4:seg.start + 4 + len(EXIF_HEADER)] == EXIF_HEADER:
+      return seg
+  return None
+
+
+def build_segment(marker, payload):
+  """Builds a complete marker segment around a payload."""
+  if len(payload) + 2 > 0xFFFF:
+    raise JPEGError("Segment payload is too large.")
+  return struct.pack('>BBH', 0xFF, marker, len(payload) + 2) + payload
+
+
+
+def strip(data):
+  """
+  Drops every metadata segment from a JPEG buffer.
+  Returns the byte chunks of the scrubbed file, a dictionary of the removed data and any error message.
+  """
+  segments, end = parse_segments(data)
+  drop = [seg for seg in segments if is_metadata_segment(data, seg)]
+  if not drop:
+    return [data], {}, base.NO_METADATA
+
+  removed_data = {}
+  for seg in drop:
+    name, value = describe_segment(data, seg)
+    if name == 'Exif':
+      #reports the individual Exif tags rather than the raw block
+      base.report_exif(value, removed_data)
+      continue
+    removed_data[base.unique_name(removed_data, name, seg.start)] = value
+
+  #anything after EOI (MPF previews, embedded videos) is dropped as well.
+  return base.copy_ranges(data, base.strip_ranges(drop, end)), removed_data, None
+
+
+def scrub_tags(data, matcher):
+  """
+  Removes selected tags from a JPEG's Exif segment without re-encoding the image.
+  Tags are cut out of their IFDs in place so no other offset moves; if that is
+  not possible the segment is rebuilt with piexif and spliced back in.
+  Returns the byte chunks of the scrubbed file, a dictionary of the removed data and any error message.
+  """
+  segments, end = parse_segments(data)
+  seg = find_exif(data, segments)
+  if seg is None:
+    return [data], {}, base.NO_METADATA
+
+  tiff_start = seg.start + 4 + len(EXIF_HEADER)
+  new_block, removed_data, error = base.scrub_exif_block(data[tiff_start:seg.end], matcher)
+  if new_block is None:
+    return [data], removed_data, error
+
+  view = memoryview(data)
+  new_segment = build_segment(APP1, EXIF_HEADER + new_block)
+  return [view[:seg.start], new_segment, view[seg.end:]], removed_data, None
+
+
+def exif_block(data):
+  """Returns the TIFF bytes of a JPEG buffer's Exif segment, reading marker headers only, or None."""
+  f = data if isinstance(data, mmap.mmap) else io.BytesIO(data)
+  f.seek(0)
+  return read_exif_payload(f)
+
+
+BACKEND = base.Backend('JPEG', is_jpeg, strip, scrub_tags, exif_block)
@@ -0,0 +1,136 @@
+import struct
+import zlib
+from collections import namedtuple
+
+from . import base
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+#ancillary chunks that carry metadata; colour chunks (iCCP, sRGB, gAMA, cHRM)
+#and pHYs are kept because they change how the image is rendered
+METADATA_CHUNKS = {b'tEXt', b'zTXt', b'iTXt', b'eXIf', b'tIME'}
+
+#cap on decompressed text, so a crafted zTXt chunk can't balloon in memory
+MAX_TEXT_SIZE = 1024 * 1024
+
+#a chunk, start/end are byte offsets of the whole chunk (length field to CRC)
+Chunk = namedtuple('Chunk', ['type', 'start', 'end'])
+
+
+def is_png(buf):
+  """Checks the PNG signature at the start of a buffer."""
+  return buf[:8] == PNG_SIGNATURE
+
+
+def parse_chunks(buf):
+  """
+  Walks the chunks of a PNG buffer without decompressing any image data.
+  Returns the list of Chunks up to and including IEND.
+  """
+  if not is_png(buf):
+    raise base.FormatError("Not a PNG file.")
+  size = len(buf)
+  chunks = []
+  pos = len(PNG_SIGNATURE)
+  while True:
+    if pos + 12 > size:
+      raise base.FormatError("Missing IEND chunk.")
+    length, chunk_type = struct.unpack('>I4s', buf[pos:pos + 8])
+    end = pos + 12 + length
+    if end > size:
+      raise base.FormatError(f"Invalid length for chunk at offset {pos}.")
+    chunks.append(Chunk(chunk_type, pos, end))
+    if chunk_type == b'IEND':
+      return chunks
+    pos = end
+
+
+def chunk_payload(buf, chunk):
+  """Returns the data of a chunk, without its length, type and CRC."""
+  return bytes(buf[chunk.start + 8:chunk.end - 4])
+
+
+def build_chunk(chunk_type, payload):
+  """Builds a complete chunk, CRC included, around a payload."""
+  crc = zlib.crc32(chunk_type + payload) & 0xFFFFFFFF
+  return struct.pack('>I', len(payload)) + chunk_type + payload + struct.pack('>I', crc)
+
+
+def _inflate(data):
+  try:
+    return zlib.decompressobj().decompress(data, MAX_TEXT_SIZE)
+  except zlib.error:
+    return b''
+
+
+def describe_chunk(buf, chunk):
+  """Returns a (name, value) pair describing a metadata chunk for the audit trail."""
+  payload = chunk_payload(buf, chunk)
+  if chunk.type == b'eXIf':
+    return 'Exif', payload
+  if chunk.type == b'tIME' and len(payload) == 7:
+    year, month, day, hour, minute, second = struct.unpack('>HBBBBB', payload)
+    return 'tIME', f"{year:04}-{month:02}-{day:02} {hour:02}:{minute:02}:{second:02}"
+
+  keyword, _, rest = payload.partition(b'\x00')
+  keyword = keyword.decode('latin-1')
+  if chunk.type == b'tEXt':
+    return keyword, rest.decode('latin-1')
+  if chunk.type == b'zTXt':
+    return keyword, _inflate(rest[1:]).decode('latin-1')
+  if chunk.type == b'iTXt' and len(rest) >= 2:
+    compressed = rest[0]
+    #skips the language tag and the translated keyword
+    text = rest[2:].split(b'\x00', 2)[-1]
+    if compressed:
+      text = _inflate(text)
+    return keyword, text.decode('utf-8', 'replace')
+  return chunk.type.decode('latin-1'), payload
+
+
+def strip(data):
+  """
+  Drops every text, time and Exif chunk from a PNG buffer; IDAT is copied untouched.
+  Returns the byte chunks of the scrubbed file, a dictionary of the removed data and any error message.
+  """
+  chunks = parse_chunks(data)
+  drop = [chunk for chunk in chunks if chunk.type in METADATA_CHUNKS]
+  if not drop:
+    return [data], {}, base.NO_METADATA
+
+  removed_data = {}
+  for chunk in drop:
+    name, value = describe_chunk(data, chunk)
+    if name == 'Exif' and chunk.type == b'eXIf':
+      base.report_exif(value, removed_data)
+      continue
+    removed_data[base.unique_name(removed_data, name, chunk.start)] = value
+
+  #anything after IEND is dropped as well.
+  return base.copy_ranges(data, base.strip_ranges(drop, chunks[-1].end)), removed_data, None
+
+
+def scrub_tags(data, matcher):
+  """
+  Removes selected tags from a PNG's eXIf chunk; only that chunk is rewritten.
+  Returns the byte chunks of the scrubbed file, a dictionary of the removed data and any error message.
+  """
+  chunk = next((chunk for chunk in parse_chunks(data) if chunk.type == b'eXIf'), None)
+  if chunk is None:
+    return [data], {}, base.NO_METADATA
+
+  new_block, removed_data, error = base.scrub_exif_block(chunk_payload(data, chunk), matcher)
+  if new_block is None:
+    return [data], removed_data, error
+
+  view = memoryview(data)
+  return [view[:chunk.start], build_chunk(b'eXIf', new_block), view[chunk.end:]], removed_data, None
+
+
+def exif_block(data):
+  """Returns the contents of a PNG's eXIf chunk, or None; chunk bodies are skipped, not read."""
+  chunk = next((chunk for chunk in parse_chunks(data) if chunk.type == b'eXIf'), None)
+  return chunk_payload(data, chunk) if chunk else None
+
+
+BACKEND = base.Backend('PNG', is_png, strip, scrub_tags, exif_block)
@@ -0,0 +1,114 @@
+from .. import exif
+from . import base
+
+#descriptive tags dropped from the image IFDs by a full scrub. Structural tags
+#(dimensions, strips/tiles, compression, colour) stay since the image needs them.
+METADATA_TAGS = frozenset({
+  269,    #DocumentName
+  270,    #ImageDescription
+  271,    #Make
+  272,    #Model
+  285,    #PageName
+  305,    #Software
+  306,    #DateTime
+  315,    #Artist
+  316,    #HostComputer
+  700,    #XMP
+  33432,  #Copyright
+  33723,  #IPTC
+  34377,  #Photoshop
+  42016,  #ImageUniqueID
+  0x9C9B, 0x9C9C, 0x9C9D, 0x9C9E, 0x9C9F,  #XPTitle .. XPSubject
+  exif.EXIF_POINTER,
+  exif.GPS_POINTER,
+})
+
+#tags describing how the image data is laid out and decoded. In a bare TIFF
+#they share the image IFDs with the descriptive tags; selective scrubs never
+#remove them, whatever a tag list or wildcard matches, so the image stays readable.
+STRUCTURAL_TAGS = frozenset({
+  254, 255,            #NewSubfileType, SubfileType
+  256, 257,            #ImageWidth, ImageLength
+  258, 259,            #BitsPerSample, Compression
+  262, 266,            #PhotometricInterpretation, FillOrder
+  273, 277, 278, 279,  #StripOffsets, SamplesPerPixel, RowsPerStrip, StripByteCounts
+  284,                 #PlanarConfiguration
+  292, 293,            #T4Options, T6Options
+  317, 320,            #Predictor, ColorMap
+  322, 323, 324, 325,  #TileWidth, TileLength, TileOffsets, TileByteCounts
+  330, 332,            #SubIFDs, InkSet
+  338, 339, 340, 341,  #ExtraSamples, SampleFormat, SMinSampleValue, SMaxSampleValue
+  347,                 #JPEGTables
+  512, 513, 514,       #JPEGProc, JPEGInterchangeFormat, JPEGInterchangeFormatLength
+  529, 530, 531, 532,  #YCbCrCoefficients, YCbCrSubSampling, YCbCrPositioning, ReferenceBlackWhite
+})
+
+#the IFDs holding images; further pages of a multi-page file are left alone
+IMAGE_IFDS = ('0th', '1st')
+
+
+def is_tiff(buf):
+  """Checks for a (classic, not Big) TIFF byte-order mark and magic number."""
+  return buf[:4] in (b'II*\x00', b'MM\x00*')
+
+
+def _open(data):
+  """Returns a TiffBlock over a copy-on-write view of the file."""
+  try:
+    return exif.TiffBlock(base.PatchedBuffer(data))
+  except exif.ExifError as e:
+    raise base.FormatError(str(e))
+
+
+def strip(data):
+  """
+  Drops the Exif and GPS IFDs and the descriptive tags of a TIFF file in place.
+  Offsets stay put, so the image data is copied untouched; only the pages
+  holding the edited IFDs and values are rewritten.
+  Returns the byte chunks of the scrubbed file, a dictionary of the removed data and any error message.
+  """
+  block = _open(data)
+  try:
+    removed = {}
+    for ifd_name in IMAGE_IFDS:
+      for tag_id, value in block.read_ifd_values(ifd_name).items():
+        if tag_id in METADATA_TAGS:
+          removed.setdefault(tag_id, value)
+    removed.update(block.read_ifd_values('Exif'))
+    if 'GPS' in block.ifds:
+      removed[exif.GPS_POINTER] = block.read_ifd_values('GPS')
+    if not removed:
+      return [data], {}, base.NO_METADATA
+
+    for ifd_name in IMAGE_IFDS:
+      block.remove_tags(ifd_name, METADATA_TAGS, drop_sub_ifds=True)
+  except exif.ExifError as e:
+    raise base.FormatError(str(e))
+  return block.buf.chunks(), base.tags_by_name(removed), None
+
+
+def scrub_tags(data, matcher):
+  """
+  Removes selected tags from the IFDs of a TIFF file in place, leaving the
+  structural tags of the image IFDs alone.
+  Returns the byte chunks of the scrubbed file, a dictionary of the removed data and any error message.
+  """
+  buf = base.PatchedBuffer(data)
+  try:
+    removed_data, removed_ids = base.remove_exif_tags(
+      buf, matcher, keep={ifd_name: STRUCTURAL_TAGS for ifd_name in IMAGE_IFDS}
+    )
+  except exif.ExifError as e:
+    #a TIFF can't be rebuilt with piexif like a standalone Exif block
+    raise base.FormatError(str(e))
+  if not removed_ids:
+    return [data], removed_data, None
+  return buf.chunks(), removed_data, None
+
+
+def exif_block(data):
+  """A TIFF file is its own Exif block; only the pages holding IFDs are read when it is mapped."""
+  return data
+
+
+BACKEND = base.Backend('TIFF', is_tiff, strip, scrub_tags, exif_block)
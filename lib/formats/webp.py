@@ -0,0 +1,130 @@
+import struct
+from collections import namedtuple
+
+from . import base
+
+#chunks that carry metadata; ICCP is kept because it changes how the image is rendered
+METADATA_CHUNKS = {b'EXIF', b'XMP '}
+
+#VP8X feature flags announcing the metadata chunks
+EXIF_FLAG = 0x08
+XMP_FLAG = 0x04
+
+#a RIFF chunk, start/end are byte offsets of the whole chunk (header to padding)
+Chunk = namedtuple('Chunk', ['type', 'start', 'end'])
+
+
+def is_webp(buf):
+  """Checks the RIFF/WEBP header at the start of a buffer."""
+  return buf[:4] == b'RIFF' and buf[8:12] == b'WEBP'
+
+
+def parse_chunks(buf):
+  """
+  Walks the chunks of a WebP buffer without decoding any image data.
+  Returns the list of Chunks and the offset where the RIFF container ends.
+  """
+  if not is_webp(buf):
+    raise base.FormatError("Not a WebP file.")
+  riff_end = 8 + struct.unpack('<I', buf[4:8])[0]
+  if riff_end > len(buf):
+    raise base.FormatError("Truncated RIFF container.")
+  chunks = []
+  pos = 12
+  while pos + 8 <= riff_end:
+    chunk_type, length = struct.unpack('<4sI', buf[pos:pos + 8])
+    #chunks are padded to an even size
+    end = pos + 8 + length + (length & 1)
+    if end > riff_end:
+      raise base.FormatError(f"Invalid length for chunk at offset {pos}.")
+    chunks.append(Chunk(chunk_type, pos, end))
+    pos = end
+  return chunks, riff_end
+
+
+def chunk_payload(buf, chunk):
+  """Returns the data of a chunk, without its header and padding."""
+  length = struct.unpack('<I', buf[chunk.start + 4:chunk.start + 8])[0]
+  return bytes(buf[chunk.start + 8:chunk.start + 8 + length])
+
+
+def build_chunk(chunk_type, payload):
+  """Builds a complete chunk, padding included, around a payload."""
+  return struct.pack('<4sI', chunk_type, len(payload)) + payload + b'\x00' * (len(payload) & 1)
+
+
+def _riff_header(body_size):
+  return b'RIFF' + struct.pack('<I', 4 + body_size) + b'WEBP'
+
+
+def _split_exif(payload):
+  """Splits an EXIF chunk into its optional 'Exif\\0\\0' prefix and the TIFF block."""
+  if payload.startswith(base.EXIF_HEADER):
+    return base.EXIF_HEADER, payload[len(base.EXIF_HEADER):]
+  return b'', payload
+
+
+def strip(data):
+  """
+  Drops the EXIF and XMP chunks from a WebP buffer and clears their VP8X flags.
+  Returns the byte chunks of the scrubbed file, a dictionary of the removed data and any error message.
+  """
+  chunks, riff_end = parse_chunks(data)
+  drop = [chunk for chunk in chunks if chunk.type in METADATA_CHUNKS]
+  if not drop:
+    return [data], {}, base.NO_METADATA
+
+  removed_data = {}
+  for chunk in drop:
+    payload = chunk_payload(data, chunk)
+    if chunk.type == b'EXIF':
+      base.report_exif(_split_exif(payload)[1], removed_data)
+    else:
+      removed_data[base.unique_name(removed_data, 'XMP', chunk.start)] = payload.decode('utf-8', 'replace')
+
+  view = memoryview(data)
+  body = []
+  for chunk in chunks:
+    if chunk.type in METADATA_CHUNKS:
+      continue
+    if chunk.type == b'VP8X':
+      header = bytearray(data[chunk.start:chunk.end])
+      header[8] &= ~(EXIF_FLAG | XMP_FLAG) & 0xFF
+      body.append(bytes(header))
+    else:
+      body.append(view[chunk.start:chunk.end])
+  #anything after the RIFF container is dropped as well.
+  return [_riff_header(sum(len(part) for part in body))] + body, removed_data, None
+
+
+def scrub_tags(data, matcher):
+  """
+  Removes selected tags from a WebP's EXIF chunk; only that chunk and the RIFF size are rewritten.
+  Returns the byte chunks of the scrubbed file, a dictionary of the removed data and any error message.
+  """
+  chunks, riff_end = parse_chunks(data)
+  chunk = next((chunk for chunk in chunks if chunk.type == b'EXIF'), None)
+  if chunk is None:
+    return [data], {}, base.NO_METADATA
+
+  prefix, tiff_bytes = _split_exif(chunk_payload(data, chunk))
+  new_block, removed_data, error = base.scrub_exif_block(tiff_bytes, matcher)
+  if new_block is None:
+    return [data], removed_data, error
+
+  new_chunk = build_chunk(b'EXIF', prefix + new_block)
+  body_size = riff_end - 12 - (chunk.end - chunk.start) + len(new_chunk)
+  view = memoryview(data)
+  return [
+    _riff_header(body_size), view[12:chunk.start], new_chunk, view[chunk.end:]
+  ], removed_data, None
+
+
+def exif_block(data):
+  """Returns the TIFF bytes of a WebP's EXIF chunk, or None."""
+  chunks, riff_end = parse_chunks(data)
+  chunk = next((chunk for chunk in chunks if chunk.type == b'EXIF'), None)
+  return _split_exif(chunk_payload(data, chunk))[1] if chunk else None
+
+
+BACKEND = base.Backend('WEBP', is_webp, strip, scrub_tags, exif_block)
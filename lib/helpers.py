@@ -1,9 +1,68 @@
 #rich is responsible for styling
+import importlib.util
+import json
 import os
-from rich.console import Console
-from rich.table import Table
+import sys
 
-console = Console()
+class _LazyConsole:
+  """
+  Stands in for a rich Console and creates it on first use, so commands
+  that print nothing (or only JSON) never import rich.
+  """
+  def __init__(self, **options):
+    self._options = options
+    self._console = None
+
+  def __getattr__(self, name):
+    if self._console is None:
+      from rich.console import Console
+      self._console = Console(**self._options)
+    return getattr(self._console, name)
+
+console = _LazyConsole()
+#used for messages when stdout carries machine-readable output
+err_console = _LazyConsole(stderr=True)
+
+def _table(title):
+  """Returns an empty rich Table styled like every other table of the application."""
+  from rich.table import Table
+  return Table(title=title, show_header=True, header_style="bold magenta")
+
+def to_jsonable(value):
+  """Converts metadata values (bytes, rationals, nested IFDs) into JSON-friendly types."""
+  if isinstance(value, dict):
+    return {str(k): to_jsonable(v) for k, v in value.items()}
+  if isinstance(value, (list, tuple)):
+    return [to_jsonable(v) for v in value]
+  if isinstance(value, bytes):
+    return value.hex()
+  if isinstance(value, float):
+    #0/0 rationals are stored as nan, which JSON can't represent
+    return float(value) if value == value and value not in (float('inf'), float('-inf')) else None
+  if isinstance(value, (str, int)) or value is None:
+    return value
+  return str(value)
+
+def lazy_import(name):
+  """
+  Returns the module `name` without running it yet: it is imported on first
+  attribute access, so heavy dependencies only load on the paths that use them.
+  """
+  module = sys.modules.get(name)
+  if module is not None:
+    return module
+  spec = importlib.util.find_spec(name)
+  loader = importlib.util.LazyLoader(spec.loader)
+  spec.loader = loader
+  module = importlib.util.module_from_spec(spec)
+  sys.modules[name] = module
+  loader.exec_module(module)
+  return module
+
+def emit_json(record):
+  """Writes one JSON object as a line on stdout (JSON-lines output for scripts)."""
+  sys.stdout.write(json.dumps(record, default=str) + "\n")
+  sys.stdout.flush()
 
 def display_main_menu():
   """Prints the main menu of the application using rich for styling."""
@@ -29,7 +88,7 @@ def display_profiles(profiles):
     console.print("[yellow]No profiles found.[/yellow]")
     return
 
-  table = Table(title="Scrubbing Profiles", show_header=True, header_style="bold magenta")
+  table = _table("Scrubbing Profiles")
   table.add_column("ID", style="dim", width=5)
   table.add_column("Name")
   table.add_column("Description")
@@ -115,7 +174,7 @@ def display_metadata(metadata_dict):
     console.print("[yellow]No metadata found.[/yellow]")
     return
 
-  table = Table(title="File Metadata", show_header=True, header_style="bold magenta")
+  table = _table("File Metadata")
   table.add_column("Tag Name", style="dim", width=25)
   table.add_column("Value")
 
@@ -129,13 +188,14 @@ def display_metadata(metadata_dict):
   
   console.print(table)
 
-def display_logs(logs):
+def display_logs(logs, page=None):
   """Displays audit trail logs in a table."""
   if not logs:
     console.print("[yellow]No log entries found.[/yellow]")
     return
       
-  table = Table(title="Audit Trail", show_header=True, header_style="bold magenta")
+  title = "Audit Trail" if page is None else f"Audit Trail (page {page})"
+  table = _table(title)
   table.add_column("Log ID", style="dim", width=8)
   table.add_column("Timestamp")
   table.add_column("Original File")
@@ -160,18 +220,78 @@ def display_log_details(log):
   profile_name = log.profile_used.name if log.profile_used else "Manual Scrub"
   console.print(f"  [cyan]Profile Used[/cyan]: {profile_name}")
 
-  if not log.scrubbed_tags:
+  removed_tags = log.removed_tags
+  if not removed_tags:
     console.print("[yellow]  No tags were scrubbed for this entry.[/yellow]")
     return
 
-  table = Table(title="Scrubbed Tags", show_header=True, header_style="bold magenta")
+  table = _table("Scrubbed Tags")
   table.add_column("Tag Name", style="dim", width=25)
   table.add_column("Original Value")
 
-  for tag in log.scrubbed_tags:
-    value_str = tag.tag_value
+  for tag_name, tag_value in removed_tags.items():
+    value_str = str(tag_value)
     if len(value_str) > 75:
       value_str = f"{value_str[:75]}..."
-    table.add_row(tag.tag_name, value_str)
+    table.add_row(tag_name, value_str)
   
-  console.print(table)
\ No newline at end of file
+  console.print(table)
+def display_census(census, top=25):
+  """Displays the outcome of a census: tag and group counts, and what a scrub would change."""
+  summary = census.to_dict()
+  console.print(
+    f"\n[bold]Census of {summary['files']} file(s)[/bold]: "
+    f"{summary['with_metadata']} carry metadata, {summary['errors']} could not be read."
+  )
+  if summary['groups']:
+    table = _table("Files per Group")
+    table.add_column("Group", style="dim", width=25)
+    table.add_column("Files", justify="right")
+    for group, count in summary['groups'].items():
+      table.add_row(group, str(count))
+    console.print(table)
+
+  if summary['tags']:
+    table = _table(f"Most Common Tags (top {top})")
+    table.add_column("Tag Name", style="dim", width=25)
+    table.add_column("Files", justify="right")
+    if summary['planned']:
+      table.add_column("Would Remove", justify="right")
+    for tag, count in list(summary['tags'].items())[:top]:
+      row = [tag, str(count)]
+      if summary['planned']:
+        row.append(str(summary['removed'].get(tag, 0)))
+      table.add_row(*row)
+    console.print(table)
+
+  if not summary['planned']:
+    return
+  console.print(
+    f"A scrub would change [green]{summary['would_change']}[/green] file(s) "
+    f"and save {summary['bytes_saved']:,} of {summary['bytes_total']:,} byte(s)."
+  )
+  if summary['unknown']:
+    console.print(f"[yellow]{summary['unknown']} file(s) can only be checked by scrubbing them.[/yellow]")
+
+def display_metrics(metrics, target=None):
+  """Displays per-stage timings and event counters of a scrub, slowest stages first."""
+  target = target or console
+  summary = metrics.to_dict()
+  if summary['stages']:
+    table = _table("Time per Stage")
+    table.add_column("Stage", style="dim", width=25)
+    table.add_column("Calls", justify="right")
+    table.add_column("Total s", justify="right")
+    table.add_column("Mean ms", justify="right")
+    table.add_column("Max ms", justify="right")
+    for name, timer in summary['stages'].items():
+      table.add_row(name, str(timer['calls']), f"{timer['seconds']:.3f}", f"{timer['mean_ms']:.2f}", f"{timer['max_ms']:.2f}")
+    target.print(table)
+
+  if summary['counters']:
+    table = _table("Counters")
+    table.add_column("Event", style="dim", width=25)
+    table.add_column("Count", justify="right")
+    for name, value in summary['counters'].items():
+      table.add_row(name, f"{value:,}")
+    target.print(table)
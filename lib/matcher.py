@@ -0,0 +1,175 @@
+import functools
+from fnmatch import fnmatchcase
+from types import MappingProxyType
+
+from . import exif
+from .tagnames import GPSTAGS, TAGS
+
+#name -> tag id lookups, built once per process
+NAME_TO_ID = {name: tag_id for tag_id, name in TAGS.items()}
+GPS_NAME_TO_ID = {name: tag_id for tag_id, name in GPSTAGS.items()}
+
+#IFDs searched for regular (non-GPS) tag names
+TAG_IFDS = ('0th', 'Exif', '1st')
+
+#named groups usable in profiles as "all <group>", e.g. "all GPS"
+GROUPS = {
+  'gps': ('GPSInfo',),
+  'makernote': ('MakerNote',),
+  'camera': (
+    'Make', 'Model', 'BodySerialNumber', 'CameraOwnerName', 'LensMake',
+    'LensModel', 'LensSerialNumber', 'LensSpecification', 'ImageUniqueID',
+  ),
+  'dates': (
+    'DateTime', 'DateTimeOriginal', 'DateTimeDigitized', 'SubsecTime',
+    'SubsecTimeOriginal', 'SubsecTimeDigitized', 'OffsetTime',
+    'OffsetTimeOriginal', 'OffsetTimeDigitized',
+  ),
+  'author': ('Artist', 'Copyright', 'XPAuthor', 'CameraOwnerName', 'ImageDescription', 'UserComment', 'XPComment'),
+  'software': ('Software', 'ProcessingSoftware', 'HostComputer'),
+  'serials': ('BodySerialNumber', 'LensSerialNumber', 'CameraSerialNumber', 'ImageUniqueID'),
+}
+
+
+class TagMatcher:
+  """
+  An immutable, precompiled set of tags to remove.
+  Tag names are resolved to ids per IFD once, so matching a file is a set
+  intersection per IFD. Iterating a matcher yields the names it was compiled from.
+  """
+  __slots__ = ('source', 'remove_gps_ifd', 'ids')
+
+  def __init__(self, source, remove_gps_ifd, ids):
+    object.__setattr__(self, 'source', tuple(source))
+    object.__setattr__(self, 'remove_gps_ifd', remove_gps_ifd)
+    object.__setattr__(self, 'ids', MappingProxyType({ifd_name: frozenset(tag_ids) for ifd_name, tag_ids in ids.items()}))
+
+  def __setattr__(self, name, value):
+    raise AttributeError("TagMatcher is immutable.")
+
+  def __reduce__(self):
+    return (TagMatcher, (self.source, self.remove_gps_ifd, dict(self.ids)))
+
+  def __iter__(self):
+    return iter(self.source)
+
+  def __len__(self):
+    return len(self.source)
+
+  def __repr__(self):
+    return f"<TagMatcher({', '.join(self.source)})>"
+
+  def match(self, exif_dict):
+    """
+    Deletes the matching tags from an exif dictionary laid out like piexif.load
+    ({'0th': {...}, 'Exif': {...}, 'GPS': {...}, '1st': {...}}).
+    Returns a dictionary of the removed data and the removed tag ids grouped by IFD.
+    """
+    removed_data = {}
+    removed_ids = {}
+
+    #removes the entire GPS IFD when requested.
+    if self.remove_gps_ifd and isinstance(exif_dict.get('GPS'), dict) and exif_dict['GPS']:
+      removed_data['GPSInfo'] = exif_dict['GPS']
+      exif_dict['GPS'] = {}
+      removed_ids['0th'] = {exif.GPS_POINTER}
+
+    for ifd_name, tag_ids in self.ids.items():
+      ifd = exif_dict.get(ifd_name)
+      #some IFD entries may be None instead of dicts
+      if not isinstance(ifd, dict) or not ifd:
+        continue
+      hits = tag_ids.intersection(ifd)
+      if not hits:
+        continue
+      names = GPSTAGS if ifd_name == 'GPS' else TAGS
+      for tag_id in hits:
+        removed_data[names.get(tag_id, tag_id)] = ifd.pop(tag_id)
+      removed_ids.setdefault(ifd_name, set()).update(hits)
+
+    return removed_data, removed_ids
+
+
+def _expand(name):
+  """Resolves one profile entry into (remove_gps_ifd, {ifd_name: tag ids})."""
+  ids = {}
+  lowered = name.lower()
+  if lowered.startswith('all '):
+    group = GROUPS.get(lowered[4:].strip())
+    if group is None:
+      return False, ids
+    remove_gps = False
+    for member in group:
+      member_gps, member_ids = _expand(member)
+      remove_gps = remove_gps or member_gps
+      for ifd_name, tag_ids in member_ids.items():
+        ids.setdefault(ifd_name, set()).update(tag_ids)
+    return remove_gps, ids
+
+  if name == 'GPSInfo' or name == 'GPS*':
+    return True, ids
+
+  if any(ch in name for ch in '*?['):
+    #wildcards match regular and GPS tag names alike
+    tag_ids = {tag_id for tag_name, tag_id in NAME_TO_ID.items() if fnmatchcase(tag_name, name)}
+    gps_ids = {tag_id for tag_name, tag_id in GPS_NAME_TO_ID.items() if fnmatchcase(tag_name, name)}
+  else:
+    tag_ids = {NAME_TO_ID[name]} if name in NAME_TO_ID else set()
+    gps_ids = {GPS_NAME_TO_ID[name]} if name in GPS_NAME_TO_ID else set()
+
+  #the GPSInfo pointer is handled as a whole-IFD removal above
+  tag_ids.discard(exif.GPS_POINTER)
+  for ifd_name in TAG_IFDS:
+    if tag_ids:
+      ids[ifd_name] = set(tag_ids)
+  if gps_ids:
+    ids['GPS'] = gps_ids
+  return False, ids
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(names):
+  remove_gps_ifd = False
+  ids = {}
+  for name in names:
+    name_gps, name_ids = _expand(name)
+    remove_gps_ifd = remove_gps_ifd or name_gps
+    for ifd_name, tag_ids in name_ids.items():
+      ids.setdefault(ifd_name, set()).update(tag_ids)
+  return TagMatcher(names, remove_gps_ifd, ids)
+
+
+def compile_tags(tags_to_remove):
+  """
+  Returns a TagMatcher for a list of tag names (or the matcher itself).
+  Besides exact Exif and GPS tag names, entries may be wildcards ("Date*",
+  "GPS*") or groups ("all GPS", "all MakerNote", "all camera"). Unknown names
+  are ignored. Compiled matchers are cached by their tag list.
+  """
+  if isinstance(tags_to_remove, TagMatcher):
+    return tags_to_remove
+  names = tuple(tag.strip() for tag in (tags_to_remove or []) if tag and tag.strip())
+  return _compile(names)
+
+
+#compiled matchers of saved profiles, keyed by profile id
+_profile_matchers = {}
+
+
+def matcher_for_profile(profile):
+  """
+  Returns the compiled matcher of a profile, compiling it on first use.
+  The profile's tag rows are only loaded on a cache miss; the name is kept
+  alongside so a profile recreated under a reused id is not confused with the old one.
+  """
+  cached = _profile_matchers.get(profile.id)
+  if cached is not None and cached[0] == profile.name:
+    return cached[1]
+  matcher = compile_tags([tag.tag_name for tag in profile.tags_to_remove])
+  _profile_matchers[profile.id] = (profile.name, matcher)
+  return matcher
+
+
+def invalidate_profile(profile_id):
+  """Drops the cached matcher of a profile that was changed or deleted."""
+  _profile_matchers.pop(profile_id, None)
@@ -0,0 +1,177 @@
+import json
+import os
+import time
+from collections import Counter
+
+#set to 1 to collect metrics; enable() sets it too, so worker processes started
+#afterwards (forked or spawned) collect as well
+ENV_VAR = 'PRIVACY_GUARD_METRICS'
+
+enabled = os.environ.get(ENV_VAR) == '1'
+
+
+class Metrics:
+  """
+  Per-stage timers (calls, total and longest seconds) and event counters
+  (bytes read and written, retries, fallbacks, ...) of one process.
+  """
+
+  def __init__(self):
+    self.timers = {}
+    self.counters = Counter()
+
+  def add_time(self, name, seconds):
+    timer = self.timers.get(name)
+    if timer is None:
+      self.timers[name] = [1, seconds, seconds]
+    else:
+      timer[0] += 1
+      timer[1] += seconds
+      if seconds > timer[2]:
+        timer[2] = seconds
+
+  def merge(self, snapshot):
+    """Adds a snapshot taken in another process (see snapshot())."""
+    for name, (calls, seconds, longest) in snapshot['timers'].items():
+      timer = self.timers.get(name)
+      if timer is None:
+        self.timers[name] = [calls, seconds, longest]
+      else:
+        timer[0] += calls
+        timer[1] += seconds
+        timer[2] = max(timer[2], longest)
+    self.counters.update(snapshot['counters'])
+
+  def snapshot(self):
+    """Returns the raw timers and counters as plain, picklable data."""
+    return {'timers': {name: list(timer) for name, timer in self.timers.items()}, 'counters': dict(self.counters)}
+
+  def reset(self):
+    self.timers = {}
+    self.counters = Counter()
+
+  def __bool__(self):
+    return bool(self.timers or self.counters)
+
+  def to_dict(self):
+    """Returns the metrics as a JSON-friendly summary, slowest stages first."""
+    timers = sorted(self.timers.items(), key=lambda item: item[1][1], reverse=True)
+    return {
+      'stages': {
+        name: {
+          'calls': calls,
+          'seconds': round(seconds, 6),
+          'mean_ms': round(seconds * 1000 / calls, 3),
+          'max_ms': round(longest * 1000, 3),
+        }
+        for name, (calls, seconds, longest) in timers
+      },
+      'counters': dict(sorted(self.counters.items())),
+    }
+
+  def to_prometheus(self, prefix='privacy_guard'):
+    """Returns the metrics in the Prometheus text exposition format."""
+    lines = [
+      f"# HELP {prefix}_stage_seconds_total Time spent in each stage of the scrub pipeline.",
+      f"# TYPE {prefix}_stage_seconds_total counter",
+    ]
+    lines += [f'{prefix}_stage_seconds_total{{stage="{name}"}} {timer[1]:.6f}' for name, timer in sorted(self.timers.items())]
+    lines += [
+      f"# HELP {prefix}_stage_calls_total Number of times each stage ran.",
+      f"# TYPE {prefix}_stage_calls_total counter",
+    ]
+    lines += [f'{prefix}_stage_calls_total{{stage="{name}"}} {timer[0]}' for name, timer in sorted(self.timers.items())]
+    lines += [
+      f"# HELP {prefix}_stage_max_seconds Longest single run of each stage.",
+      f"# TYPE {prefix}_stage_max_seconds gauge",
+    ]
+    lines += [f'{prefix}_stage_max_seconds{{stage="{name}"}} {timer[2]:.6f}' for name, timer in sorted(self.timers.items())]
+    lines += [
+      f"# HELP {prefix}_events_total Counted events (bytes, retries, fallbacks, unchanged copies).",
+      f"# TYPE {prefix}_events_total counter",
+    ]
+    lines += [f'{prefix}_events_total{{event="{name}"}} {value}' for name, value in sorted(self.counters.items())]
+    return "\n".join(lines) + "\n"
+
+
+class _Stage:
+  """Times the block it wraps into a stage of the registry."""
+  __slots__ = ('name', 'start')
+
+  def __init__(self, name):
+    self.name = name
+
+  def __enter__(self):
+    self.start = time.perf_counter()
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    registry.add_time(self.name, time.perf_counter() - self.start)
+    return False
+
+
+class _NoStage:
+  """What stage() hands out while metrics are off: entering and leaving do nothing."""
+  __slots__ = ()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    return False
+
+
+_NO_STAGE = _NoStage()
+
+#the metrics of this process
+registry = Metrics()
+
+
+def enable():
+  """Turns collection on, here and in worker processes started from now on."""
+  global enabled
+  enabled = True
+  os.environ[ENV_VAR] = '1'
+
+
+def disable():
+  global enabled
+  enabled = False
+  os.environ.pop(ENV_VAR, None)
+
+
+def stage(name):
+  """
+  Returns a context manager timing a stage, e.g. `with metrics.stage('pillow.save'):`.
+  While metrics are off it is a shared object that does nothing.
+  """
+  return _Stage(name) if enabled else _NO_STAGE
+
+
+def count(name, value=1):
+  """Adds to an event counter; does nothing while metrics are off."""
+  if enabled:
+    registry.counters[name] += value
+
+
+def collect():
+  """
+  Returns a snapshot of this process's metrics and starts afresh, or None when
+  off or empty. Workers attach it to each result so the batch can merge them.
+  """
+  if not enabled or not registry:
+    return None
+  snapshot = registry.snapshot()
+  registry.reset()
+  return snapshot
+
+
+def write(path, metrics=None):
+  """Writes metrics to a file: JSON for *.json, the Prometheus text format otherwise."""
+  metrics = metrics or registry
+  with open(path, 'w') as f:
+    if path.endswith('.json'):
+      json.dump(metrics.to_dict(), f, indent=2)
+      f.write("\n")
+    else:
+      f.write(metrics.to_prometheus())
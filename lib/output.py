@@ -0,0 +1,167 @@
+import errno
+import os
+import stat
+import sys
+import tempfile
+
+from . import metrics
+
+#how scrubbed files are made durable; set with set_fsync_policy:
+#  none  - nothing is fsynced, the OS writes files back when it likes
+#  file  - a file's data is fsynced before it replaces the target, so a crash
+#          leaves the old file or the new one, never a torn one
+#  batch - as `file`, and the directories are fsynced once each by whoever runs
+#          the batch (see sync_dirs), so the renames survive a crash as well
+#  full  - as `file`, with the directory fsynced after every single rename
+FSYNC_POLICIES = ('none', 'file', 'batch', 'full')
+
+#inherited by worker processes, like the metrics switch
+ENV_VAR = 'PRIVACY_GUARD_FSYNC'
+
+fsync_policy = os.environ.get(ENV_VAR) if os.environ.get(ENV_VAR) in FSYNC_POLICIES else 'batch'
+
+#write buffer of rewritten files: big enough that Pillow's many small writes
+#reach the kernel as one
+BUFFER_SIZE = 1024 * 1024
+
+#ioctl cloning a whole file on copy-on-write file systems (Btrfs, XFS, bcachefs)
+FICLONE = 0x40049409
+
+#errors meaning "this file system (pair) can't do that", not that the copy failed
+_UNSUPPORTED = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF, errno.EPERM}
+
+
+def set_fsync_policy(policy):
+  """Sets the fsync policy here and in worker processes started from now on."""
+  global fsync_policy
+  if policy not in FSYNC_POLICIES:
+    raise ValueError(f"Unknown fsync policy: {policy!r}")
+  fsync_policy = policy
+  os.environ[ENV_VAR] = policy
+
+
+def sync_dir(directory):
+  """Fsyncs a directory, making the renames and new files in it durable."""
+  #Windows can't open directories; its renames are journaled by NTFS
+  if sys.platform == 'win32':
+    return
+  fd = os.open(directory or '.', os.O_RDONLY)
+  try:
+    with metrics.stage('output.sync_dir'):
+      os.fsync(fd)
+  finally:
+    os.close(fd)
+
+
+def sync_dirs(directories):
+  """Fsyncs each directory once, e.g. those a batch wrote to under the `batch` policy."""
+  for directory in sorted(set(directories)):
+    sync_dir(directory)
+
+
+def clone_file(src_fd, dst_fd):
+  """
+  Copies the whole of one open file into another, empty one, cheapest first:
+  a copy-on-write clone (FICLONE) shares the blocks without copying them,
+  copy_file_range copies inside the kernel (or server side on NFS and SMB),
+  and a plain read/write loop does the rest.
+  Returns how the file was copied: 'reflink', 'copy_file_range' or 'copy'.
+  """
+  if sys.platform.startswith('linux'):
+    import fcntl
+    try:
+      fcntl.ioctl(dst_fd, getattr(fcntl, 'FICLONE', FICLONE), src_fd)
+      return 'reflink'
+    except OSError as e:
+      if e.errno not in _UNSUPPORTED:
+        raise
+
+  os.lseek(src_fd, 0, os.SEEK_SET)
+  if hasattr(os, 'copy_file_range'):
+    try:
+      #without offsets both file positions advance, so a fallback carries on from there
+      while os.copy_file_range(src_fd, dst_fd, BUFFER_SIZE * 64):
+        pass
+      return 'copy_file_range'
+    except OSError as e:
+      if e.errno not in _UNSUPPORTED:
+        raise
+
+  while True:
+    block = os.read(src_fd, BUFFER_SIZE)
+    if not block:
+      return 'copy'
+    view = memoryview(block)
+    while view:
+      view = view[os.write(dst_fd, view):]
+
+
+class AtomicOutput:
+  """
+  Writes a file under a temporary name in the target's directory (so on the
+  same file system) and moves it over the target with os.replace once
+  `commit()` is called, fsyncing as the fsync policy says. Leaving the block
+  without committing, or with an error, removes the temporary file and leaves
+  the target as it was. `like` is a file whose permissions the output takes,
+  and with `keep_times` its access and modification times too.
+  """
+
+  def __init__(self, path, like=None, keep_times=False, policy=None):
+    self.path = path
+    self.like = like
+    self.keep_times = keep_times
+    self.policy = policy or fsync_policy
+    self.file = None
+    self._temp_path = None
+
+  def __enter__(self):
+    directory, name = os.path.split(self.path)
+    fd, self._temp_path = tempfile.mkstemp(dir=directory or '.', prefix=f".{name}.", suffix='.tmp')
+    self.file = os.fdopen(fd, 'wb', buffering=BUFFER_SIZE)
+    return self
+
+  def clone_from(self, src):
+    """Fills the output with the contents of the open file `src`. Returns how (see clone_file)."""
+    self.file.flush()
+    with metrics.stage('output.clone'):
+      method = clone_file(src.fileno(), self.file.fileno())
+    metrics.count(f'output.{method}')
+    return method
+
+  def commit(self):
+    """Makes the output durable as the policy says and moves it over the target."""
+    self.file.flush()
+    source = os.stat(self.like) if self.like is not None else None
+    if source is not None:
+      #mkstemp creates the file readable by its owner only
+      os.chmod(self._temp_path, stat.S_IMODE(source.st_mode))
+    if self.policy != 'none':
+      with metrics.stage('output.fsync'):
+        os.fsync(self.file.fileno())
+    self.file.close()
+    if source is not None and self.keep_times:
+      #after the last write, which would move the modification time again
+      os.utime(self._temp_path, ns=(source.st_atime_ns, source.st_mtime_ns))
+    with metrics.stage('replace'):
+      os.replace(self._temp_path, self.path)
+    self._temp_path = None
+    if self.policy == 'full':
+      sync_dir(os.path.dirname(self.path))
+
+  def __exit__(self, exc_type, exc, tb):
+    if not self.file.closed:
+      self.file.close()
+    if self._temp_path is not None:
+      try:
+        os.remove(self._temp_path)
+      except OSError:
+        pass
+    return False
+
+
+def copy_file(src_path, dst_path, like=None):
+  """Atomically copies a file (see AtomicOutput), cloning it where the file system can."""
+  with open(src_path, 'rb') as src, AtomicOutput(dst_path, like=like) as output:
+    output.clone_from(src)
+    output.commit()
+
@@ -0,0 +1,122 @@
+import os
+import threading
+from collections import deque
+
+from . import metrics
+
+#bytes of page cache filled ahead of the scrubber with files not yet handed to it
+DEFAULT_BUDGET = 64 * 1024 * 1024
+
+#reads in flight at once; a few are enough to keep a disk queue or a network mount busy
+DEFAULT_THREADS = 4
+
+#how much of a file is read when only its metadata is needed: the Exif block
+#sits in the first few KB of a JPEG and near the start of most other containers
+HEAD_BYTES = 64 * 1024
+
+READ_SIZE = 1024 * 1024
+
+_buffers = threading.local()
+
+
+def _read(file_path, limit):
+  """
+  Reads a file (or its first `limit` bytes) into a scratch buffer and throws
+  the bytes away: what is kept is the page cache the scrubber maps it from.
+  Returns the number of bytes read.
+  """
+  buf = getattr(_buffers, 'buf', None)
+  if buf is None:
+    buf = _buffers.buf = memoryview(bytearray(READ_SIZE))
+  total = 0
+  with open(file_path, 'rb', buffering=0) as f:
+    if hasattr(os, 'posix_fadvise'):
+      #lets the kernel read ahead aggressively while this thread catches up
+      os.posix_fadvise(f.fileno(), 0, limit or 0, os.POSIX_FADV_WILLNEED)
+    while limit is None or total < limit:
+      size = READ_SIZE if limit is None else min(READ_SIZE, limit - total)
+      read = f.readinto(buf[:size])
+      if not read:
+        break
+      total += read
+  return total
+
+
+def read_ahead(file_paths, work, budget=DEFAULT_BUDGET, threads=DEFAULT_THREADS, head=None):
+  """
+  Runs `work(file_path)` on a small thread pool for the files coming up next,
+  while the caller deals with the ones before them. Yields (file_path, future)
+  in the order the paths were given; the future holds what `work` returned or
+  raised. A file's bytes (its first `head` bytes, with `head`) count against
+  `budget` from when its work is started until it is yielded, whether or not
+  the work has finished by then: a finished read still sits in the page cache
+  waiting for the caller, so the budget bounds what was read ahead and not yet
+  taken, not the reads in flight. A file bigger than the budget runs on its
+  own. With no budget nothing runs ahead and the future is None, leaving the
+  work to the caller.
+  """
+  if not budget:
+    for file_path in file_paths:
+      yield file_path, None
+    return
+
+  #imported on first use, like the process pool
+  from concurrent.futures import ThreadPoolExecutor
+
+  file_paths = iter(file_paths)
+  #work started, oldest first, and the next file while it waits for room in the budget
+  pending = deque()
+  waiting = None
+  ahead = 0
+  with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='prefetch') as pool:
+    try:
+      while True:
+        #tops up the read-ahead until the budget is spent
+        while True:
+          if waiting is None:
+            file_path = next(file_paths, None)
+            if file_path is None:
+              break
+            try:
+              size = os.path.getsize(file_path)
+            except OSError:
+              size = 0
+            waiting = (file_path, size if head is None else min(size, head))
+          file_path, size = waiting
+          if ahead and ahead + size > budget:
+            break
+          pending.append((file_path, pool.submit(work, file_path), size))
+          ahead += size
+          metrics.count('prefetch.bytes', size)
+          waiting = None
+        if not pending:
+          return
+
+        file_path, future, size = pending.popleft()
+        if not future.done():
+          #the caller caught up with the reads; more threads or budget would help
+          metrics.count('prefetch.late')
+        #released once handed over rather than when the work finishes (see above)
+        ahead -= size
+        yield file_path, future
+    finally:
+      #stops work nobody will use if the caller gives up early
+      for file_path, future, size in pending:
+        future.cancel()
+
+
+def prefetch(file_paths, budget=DEFAULT_BUDGET, threads=DEFAULT_THREADS, head=None):
+  """
+  Read-ahead stage of the scrub pipeline. Yields `file_paths` unchanged and in
+  order, while the files coming up next are read (see read_ahead), so disk and
+  network reads overlap with scrubbing instead of the workers waiting on them.
+  The files go to the OS page cache, which the workers map them from, rather
+  than being copied into this process and sent on: `budget` bounds the page
+  cache filled with files read, or being read, and not yet handed on to the
+  workers, not memory this process holds.
+  With `head` only the first `head` bytes of each file are read, for runs
+  that only look at metadata. Paths that can't be read are passed on for the
+  scrubber to report.
+  """
+  for file_path, future in read_ahead(file_paths, lambda path: _read(path, head), budget, threads, head):
+    yield file_path
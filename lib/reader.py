@@ -0,0 +1,44 @@
+import mmap
+
+from . import formats
+from .formats import jpeg
+from .formats.base import metadata_from_tiff, tags_by_name
+
+
+class UnsupportedFormat(ValueError):
+  """Raised when the header reader does not handle a file's format."""
+
+
+def map_file(f):
+  """
+  Maps an open file read-only, so slices are read straight from the page cache
+  instead of being copied into a Python buffer up front. Returns None for empty files.
+  """
+  try:
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  except ValueError:
+    return None
+
+
+def read_metadata(filepath):
+  """
+  Reads the Exif metadata of an image from its header only.
+  JPEGs are read marker by marker up to the Exif segment (typically the first
+  few KB). Other formats known to the format registry are memory-mapped and
+  their Exif block located by walking chunk/box headers, so only the pages
+  holding headers, IFDs and tag values are ever read.
+  Returns {tag_name: value}, empty when the file has no Exif block.
+  Raises UnsupportedFormat, exif.ExifError or formats.FormatError when it can't.
+  """
+  with open(filepath, 'rb') as f:
+    head = f.read(16)
+    f.seek(0)
+    if jpeg.is_jpeg(head):
+      tiff_bytes = jpeg.read_exif_payload(f)
+      return metadata_from_tiff(tiff_bytes) if tiff_bytes else {}
+    backend = formats.backend_for(head)
+    if backend is None:
+      raise UnsupportedFormat("No header reader for this format.")
+    with map_file(f) as mapped:
+      tiff_bytes = backend.exif_block(mapped)
+      return metadata_from_tiff(tiff_bytes) if tiff_bytes else {}
@@ -1,156 +1,321 @@
+import io
+import mmap
 import os
-import piexif
-import tempfile
-import re
-import shutil
-from PIL import Image
-from PIL.ExifTags import TAGS
+
+from . import exif, formats, metrics, output, reader
+from .matcher import compile_tags
 
 def get_metadata(filepath):
   """Extracts Exif metadata from an image file."""
   try:
-    with Image.open(filepath) as img:
-      exif_data = img._getexif()
-      if not exif_data:
-        return {}, "No EXIF metadata found."
-
-      metadata = {}
-      for tag_id, value in exif_data.items():
-        tag_name = TAGS.get(tag_id, tag_id)
-        metadata[tag_name] = value
-      return metadata, None
+    with metrics.stage('metadata'):
+      try:
+        #reads just the file header, no image decoding
+        metadata = reader.read_metadata(filepath)
+      except (reader.UnsupportedFormat, exif.ExifError, formats.FormatError):
+        metrics.count('metadata.pillow_fallback')
+        from PIL import Image
+        with Image.open(filepath) as img:
+          metadata = _image_metadata(img)
+    if not metadata:
+      return {}, "No EXIF metadata found."
+    return metadata, None
   except Exception as e:
       return None, f"Error reading metadata: {e}"
 
 
+def _image_metadata(img):
+  """Extracts Exif metadata from an already opened Pillow image."""
+  #only JPEG-style plugins have _getexif; TIFFs expose their tags through getexif
+  getexif = getattr(img, '_getexif', None)
+  exif_data = getexif() if getexif else dict(img.getexif())
+  if not exif_data:
+    return {}
+  return reader.tags_by_name(exif_data)
+
+
+def scrubbed_path(filepath):
+  """Returns the path of the scrubbed copy of a file (e.g. photo.jpg -> photo_scrubbed.jpg)."""
+  dir_name, file_name = os.path.split(filepath)
+  name, ext = os.path.splitext(file_name)
+  return os.path.join(dir_name, f"{name}_scrubbed{ext}")
+
+
+NO_OPTION = "No scrubbing option selected. File was copied without changes."
+
+#messages of files copied without changes, by the counter they are tallied under
+UNCHANGED = {
+  formats.base.NO_METADATA: 'unchanged.no_metadata',
+  formats.base.INVALID_EXIF: 'unchanged.invalid_exif',
+  NO_OPTION: 'unchanged.no_option',
+}
+
+#most platforms cap a single writev call at 1024 buffers
+IOV_MAX = 1024
+
+
+def _write_chunks(out, chunks):
+  """
+  Writes byte chunks to a file object. Real files get them with vectored
+  writes (os.writev), so slices of a mapped input go to the kernel without
+  being joined or copied first; anything else falls back to writelines.
+  """
+  try:
+    fd = out.fileno()
+  except (AttributeError, OSError, io.UnsupportedOperation):
+    fd = None
+  if fd is None or not hasattr(os, 'writev'):
+    out.writelines(chunks)
+    return
+
+  out.flush()
+  pending = [memoryview(chunk) for chunk in chunks if len(chunk)]
+  try:
+    while pending:
+      written = os.writev(fd, pending[:IOV_MAX])
+      #drops fully written chunks and trims a partially written one
+      while written and written >= len(pending[0]):
+        written -= len(pending.pop(0))
+      if written:
+        pending[0] = pending[0][written:]
+  finally:
+    for view in pending:
+      view.release()
+
+
+def _as_buffer(data):
+  """Returns a buffer the container parsers can search; memoryviews are copied once."""
+  if isinstance(data, memoryview):
+    return data.tobytes()
+  return data
+
+
+def _unmap(data):
+  """Closes a mapped input; left to the garbage collector while views of it are still alive."""
+  if isinstance(data, mmap.mmap):
+    try:
+      data.close()
+    except BufferError:
+      pass
+
+
+def _open_image(data):
+  """
+  Opens an in-memory image with Pillow. Mapped files are copied first: Pillow
+  seeks wherever a broken IFD points, which an mmap refuses past its end, and
+  this path decodes the whole image anyway.
+  Pillow is imported here, so runs that only touch known containers never load it.
+  """
+  from PIL import Image
+  return Image.open(io.BytesIO(data))
+
+
+def _unchanged(chunks, data):
+  """Whether a backend's output is its input, untouched: the input itself or one view over all of it."""
+  if len(chunks) != 1:
+    return False
+  chunk = chunks[0]
+  return chunk is data or (isinstance(chunk, memoryview) and chunk.obj is data and len(chunk) == len(data))
+
+
+def _scrub_image_ifd(img, save, matcher, remove_all):
+  """
+  Scrubs an image whose tags Pillow keeps in the image IFD rather than in an
+  Exif block: TIFFs the TIFF backend can't edit, such as BigTIFFs. As in the
+  backend, a full scrub removes formats.tiff.METADATA_TAGS and a selective one
+  never touches the structural tags; the image is re-saved only when a tag goes.
+  Returns what _scrub_data does.
+  """
+  tags = img.getexif()
+  #tags Pillow copies from the original into every TIFF it saves (XMP, IPTC, ...)
+  kept = getattr(img, 'tag_v2', {})
+
+  if remove_all:
+    tag_ids = formats.tiff.METADATA_TAGS.intersection(tags)
+    if not tag_ids:
+      return None, {}, formats.base.NO_METADATA
+    removed = {tag_id: tags[tag_id] for tag_id in tag_ids - {exif.EXIF_POINTER, exif.GPS_POINTER}}
+    removed.update(tags.get_ifd(exif.EXIF_POINTER))
+    if tags.get_ifd(exif.GPS_POINTER):
+      removed[exif.GPS_POINTER] = dict(tags.get_ifd(exif.GPS_POINTER))
+    for tag_id in tag_ids.intersection(kept):
+      del kept[tag_id]
+    #a plain save writes the image and its structural tags only
+    return save(), formats.base.tags_by_name(removed), None
+
+  structural = formats.tiff.STRUCTURAL_TAGS | {exif.EXIF_POINTER, exif.GPS_POINTER}
+  exif_dict = {
+    '0th': {tag_id: value for tag_id, value in tags.items() if tag_id not in structural},
+    'Exif': dict(tags.get_ifd(exif.EXIF_POINTER)),
+    'GPS': dict(tags.get_ifd(exif.GPS_POINTER)),
+  }
+  if not any(exif_dict.values()):
+    return None, {}, formats.base.NO_METADATA
+  if not matcher:
+    return None, {}, NO_OPTION
+
+  removed_data, removed_ids = matcher.match(exif_dict)
+  if not removed_ids:
+    return None, removed_data, None
+  for tag_id in removed_ids.get('0th', ()):
+    tags.pop(tag_id, None)
+    kept.pop(tag_id, None)
+  for ifd_name, pointer in (('Exif', exif.EXIF_POINTER), ('GPS', exif.GPS_POINTER)):
+    ifd = tags.get_ifd(pointer)
+    for tag_id in removed_ids.get(ifd_name, ()):
+      ifd.pop(tag_id, None)
+    if not ifd:
+      tags.pop(pointer, None)
+  #Pillow works the layout out again for the pixels it writes
+  for tag_id in formats.tiff.STRUCTURAL_TAGS:
+    tags.pop(tag_id, None)
+  return save(exif=tags), removed_data, None
+
+
+def _scrub_data(data, matcher, remove_all=False):
+  """
+  Scrubs an image held in memory. This is the one code path behind scrub_file,
+  scrub_bytes and scrub_stream; what to do with the result is left to them.
+  Returns the byte chunks of the scrubbed file, or None when it is the input
+  unchanged (so it can be cloned instead of rewritten), a dictionary of the
+  data that was removed and any error message.
+  """
+  #known containers get only their metadata blocks rewritten, no pixel work.
+  backend = formats.backend_for(data[:16]) if (remove_all or matcher) else None
+  if backend is not None:
+    try:
+      with metrics.stage('backend.strip' if remove_all else 'backend.scrub_tags'):
+        if remove_all:
+          result = backend.strip(data)
+        else:
+          result = backend.scrub_tags(data, matcher)
+    except formats.FormatError:
+      #malformed container; let Pillow deal with it below.
+      result = None
+    if result is not None:
+      chunks, removed_data, error = result
+      if _unchanged(chunks, data):
+        chunks = None
+      if error:
+        return chunks, {}, error
+      return chunks, removed_data, None
+  metrics.count('fallback.pillow')
+
+  with metrics.stage('pillow.open'):
+    img = _open_image(data)
+  with img:
+    img_format = img.format
+
+    def save(**options):
+      #into memory, so the file gets the whole image in one write
+      out = io.BytesIO()
+      with metrics.stage('pillow.save'):
+        img.save(out, format=img_format, **options)
+      return [out.getbuffer()]
+
+    #TIFFs have no Exif block in img.info; their tags are in the image IFD
+    if 'exif' not in img.info:
+      return _scrub_image_ifd(img, save, matcher, remove_all)
+
+    if remove_all:
+      removed_data = _image_metadata(img)
+      return save(), removed_data, None
+
+    #selective and profile-based scrubbing.
+    if matcher:
+      try:
+        import piexif
+        with metrics.stage('piexif.load'):
+          exif_dict = piexif.load(img.info['exif'])
+      except Exception:
+        exif_dict = None
+      if exif_dict is None:
+        #if broken EXIF block; copy file without changes.
+        return None, {}, formats.base.INVALID_EXIF
+
+      removed_data, removed_ids = matcher.match(exif_dict)
+      with metrics.stage('piexif.dump'):
+        new_exif_bytes = formats.base.safe_dump(exif_dict, removed_data)
+      return save(exif=new_exif_bytes), removed_data, None
+
+    #when no scrubbing option is chosen.
+    return None, {}, NO_OPTION
+
+
+def _count_outcome(error, bytes_read, bytes_written):
+  """Counts the bytes of a scrubbed file and, when it was copied as is, why."""
+  metrics.count('bytes_read', bytes_read)
+  metrics.count('bytes_written', bytes_written)
+  if error:
+    metrics.count(UNCHANGED.get(error, 'unchanged.other'))
+
+
+def scrub_bytes(data, tags_to_remove=None, remove_all=False):
+  """
+  Scrubs an image held in memory (bytes, bytearray or memoryview) without touching disk.
+  Returns the scrubbed image as bytes, a dictionary of the data that was removed and any error message.
+  """
+  try:
+    data = _as_buffer(data)
+    chunks, removed_data, error = _scrub_data(data, compile_tags(tags_to_remove), remove_all)
+    output_bytes = bytes(data) if chunks is None else b''.join(chunks)
+    _count_outcome(error, len(data), len(output_bytes))
+    return output_bytes, removed_data, error
+  except Exception as e:
+    return None, None, f"Error processing data: {e}"
+
+
+def scrub_stream(src, dst, tags_to_remove=None, remove_all=False):
+  """
+  Scrubs an image read from the binary file object `src` and writes it to `dst`
+  (e.g. stdin to stdout). Nothing is written if the image can't be processed.
+  Returns a dictionary of the data that was removed and any error message.
+  """
+  output_bytes, removed_data, error = scrub_bytes(src.read(), tags_to_remove, remove_all)
+  if output_bytes is not None:
+    dst.write(output_bytes)
+    dst.flush()
+  return removed_data, error
+
+
 def scrub_file(filepath, tags_to_remove=None, remove_all=False, in_place=False):
   """
   Scrubs metadata from a file, with options for selective, full, and in-place scrubbing.
+  The output is written under a temporary name next to its target and moved over it
+  once complete (see output.AtomicOutput), keeping the original's permissions, and in
+  place its timestamps too. Files that come out unchanged are cloned rather than
+  rewritten, and in place are not touched at all.
   Returns a dictionary of the data that was removed and any error message.
   """
   try:
-    if in_place:
-      temp_fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(filepath))
-      os.close(temp_fd)
-      output_path = temp_path
-    else:
-      dir_name, file_name = os.path.split(filepath)
-      name, ext = os.path.splitext(file_name)
-      output_path = os.path.join(dir_name, f"{name}_scrubbed{ext}")
-
-    with Image.open(filepath) as img:
-      img_format = img.format
-      original_metadata, error = get_metadata(filepath)
-      removed_data = {}
-      
-      #if no raw EXIF bytes, nothing to scrub.
-      if 'exif' not in img.info:
-        img.save(output_path, format=img_format)
-        if in_place and os.path.exists(temp_path):
-          os.remove(temp_path)
-        return {}, "No EXIF metadata found. File was copied without changes."
-
-      if remove_all:
-        removed_data = original_metadata
-        img.save(output_path, format=img_format)
-
-      #selective and profile-based scrubbing.
-      elif tags_to_remove:
-        exif_bytes = img.info.get('exif')
-        try:
-          exif_dict = piexif.load(exif_bytes)
-        except Exception:
-          #if broken EXIF block; copy file without changes.
-          img.save(output_path, format=img_format)
-          if in_place and os.path.exists(temp_path):
-              os.remove(temp_path)
-          return {}, "Image contains invalid EXIF data. File was copied without changes."
-
-        if exif_dict is None:
-          img.save(output_path, format=img_format)
-          if in_place and os.path.exists(temp_path):
-              os.remove(temp_path)
-          return {}, "Image contains invalid EXIF data. File was copied without changes."
-
-        #creates a lookup table to find tag IDs from their names (e.g 'Make' -> 271)
-        name_to_id = {v: k for k, v in TAGS.items()}
-
-        #handles each tag from the profile list.
-        for tag_name in tags_to_remove:
-          #remove the entire GPS IFD when requested.
-          if tag_name == 'GPSInfo':
-            if 'GPS' in exif_dict and exif_dict['GPS']:
-              removed_data['GPSInfo'] = exif_dict['GPS']
-              exif_dict['GPS'] = {}
-            # move to next tag after handling GPSInfo
-            continue
-
-          # handle non-GPS tags by name -> numeric id lookup
-          tag_id = name_to_id.get(tag_name)
-          #skips unknown tag names.
-          if tag_id is None:
-            continue
-
-          #EXIF data is split into sections (IFDs). 
-          #removes the tag from any IFD it appears in.
-          for ifd_name in ('0th', 'Exif', 'GPS', '1st'):
-            if ifd_name in exif_dict and isinstance(exif_dict[ifd_name], dict) and tag_id in exif_dict[ifd_name]:
-              original_value = exif_dict[ifd_name][tag_id]
-              removed_data[tag_name] = original_value
-              del exif_dict[ifd_name][tag_id]
-
-        #ensures selective removal succeeds even on imperfect EXIF blocks.
-        def _safe_dump(edict):
-          """ 
-          Retry loop - remove offending tag ids reported by piexif
-          until dump succeeds or nothing left to remove.
-          """
-          attempts = 0
-          while True:
-            try:
-              return piexif.dump(edict)
-            except Exception as e:
-              attempts += 1
-              if attempts > 10:
-                  raise
-
-              msg = str(e)
-              #finds the first integer in the error message; piexif
-              m = re.search(r"(\d+)", msg)
-              if not m:
-                #if couldn't parse tag id from message, re-raise
-                raise
-              bad_id = int(m.group(1))
-
-              removed_any = False
-              for ifd_nm in ('0th', 'Exif', 'GPS', '1st', 'thumbnail'):
-                #some IFD entries may be None instead of dicts 
-                #record as removed due to invalid type
-                if ifd_nm in edict and isinstance(edict[ifd_nm], dict) and bad_id in edict[ifd_nm]:
-                  name = TAGS.get(bad_id, bad_id)
-                  if name not in removed_data:
-                      removed_data[name] = 'removed_due_to_invalid_type'
-                  edict[ifd_nm].pop(bad_id, None)
-                  removed_any = True
-
-              if not removed_any:
-                # if nothing removed can't recover
-                raise
-
-        new_exif_bytes = _safe_dump(exif_dict)
-        img.save(output_path, exif=new_exif_bytes, format=img_format)
-      
-      else:
-        #when no scrubbing option is chosen.
-        img.save(output_path, exif=img.info['exif'], format=img_format)
-        return {}, "No scrubbing option selected. File was copied without changes."
-
-      if in_place:
-        shutil.move(temp_path, filepath)
-
-      return removed_data, None
+    #tag names are resolved to ids once; a precompiled TagMatcher can be passed as well
+    matcher = compile_tags(tags_to_remove)
+    output_path = filepath if in_place else scrubbed_path(filepath)
+
+    with open(filepath, 'rb') as f:
+      #the input is mapped, not read: the JPEG path only slices the untouched ranges out of it
+      with metrics.stage('read'):
+        data = reader.map_file(f) or b''
+      try:
+        chunks, removed_data, error = _scrub_data(data, matcher, remove_all)
+        #the original is only replaced when it was actually scrubbed
+        if in_place and (error or chunks is None):
+          bytes_written = 0
+        else:
+          with output.AtomicOutput(output_path, like=filepath, keep_times=in_place) as out:
+            if chunks is None:
+              out.clone_from(f)
+              bytes_written = len(data)
+            else:
+              with metrics.stage('write'):
+                _write_chunks(out.file, chunks)
+              bytes_written = sum(len(chunk) for chunk in chunks)
+            out.commit()
+        _count_outcome(error, len(data), bytes_written)
+      finally:
+        chunks = None
+        _unmap(data)
+    return removed_data, error
 
   except Exception as e:
-    if in_place and 'temp_path' in locals() and os.path.exists(temp_path):
-      os.remove(temp_path)
-    return None, f"Error processing file: {e}"
\ No newline at end of file
+    return None, f"Error processing file: {e}"
@@ -0,0 +1,349 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from . import output
+from .batch import default_workers, scrub_one
+from .db.audit import AuditWriter
+from .db.database import get_db_session
+from .db.models import Profile
+from .matcher import compile_tags, matcher_for_profile
+from .scrubber import UNCHANGED, scrub_bytes
+
+#jobs waiting for a worker; requests beyond this are refused with 503
+QUEUE_SIZE = 64
+#largest request body accepted, in bytes
+MAX_BODY = 64 * 1024 * 1024
+#seconds between audit flushes while the service is idle
+AUDIT_FLUSH_INTERVAL = 2.0
+
+STATUS_TEXT = {
+  200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed',
+  411: 'Length Required', 413: 'Payload Too Large', 415: 'Unsupported Media Type',
+  500: 'Internal Server Error', 503: 'Service Unavailable',
+}
+
+
+class HTTPError(Exception):
+  """Raised while handling a request to answer it with an error status."""
+
+  def __init__(self, status, message, headers=None):
+    super().__init__(message)
+    self.status = status
+    self.message = message
+    self.headers = headers or {}
+
+
+def _warm_up():
+  """Runs once in every worker so the pool is started before the first job."""
+  return os.getpid()
+
+
+def _scrub_durably(file_path, tags_to_remove, remove_all, in_place):
+  """
+  Runs scrub_one in a worker. Each request is a batch of one, so under the
+  `batch` fsync policy the output's directory is synced here, before the
+  caller is told the file was scrubbed.
+  """
+  result = scrub_one(file_path, tags_to_remove, remove_all, in_place)
+  failed = result.error and result.error not in UNCHANGED
+  #in place, unchanged files are left alone; everything else was renamed into place
+  if output.fsync_policy == 'batch' and not failed and (result.removed_data or result.processed_path != file_path):
+    output.sync_dir(os.path.dirname(result.processed_path))
+  return result
+
+
+class ScrubService:
+  """
+  A long-running scrub server speaking a small HTTP/1.1 API over TCP or a Unix socket.
+
+    GET  /health             queue and pool status
+    POST /scrub              JSON {"path", "profile" | "tags" | "all", "in_place"}; scrubs a file on disk
+    POST /scrub/upload?...   raw image body, same options as query parameters; answers with the scrubbed bytes
+
+  /scrub only takes `Content-Type: application/json`, which a browser can't send
+  cross-origin without a preflight, and only files inside one of `roots`; with
+  no roots it scrubs no files on disk. Outputs follow the fsync policy of
+  lib.output, which the workers inherit; under `batch` each request is its own
+  batch. Jobs run on a warm process pool. Admission is bounded: once
+  `queue_size` jobs are waiting, new requests get 503 before their body is read. All database
+  work runs on a single thread that owns one session, so FileLog writes share
+  one pooled connection and are batched by an AuditWriter.
+  """
+
+  def __init__(self, workers=None, queue_size=QUEUE_SIZE, max_body=MAX_BODY, roots=()):
+    self.workers = workers or default_workers()
+    #directories /scrub may touch files in, symlinks resolved
+    self.roots = [os.path.realpath(root) for root in roots]
+    self.queue_size = queue_size
+    self.max_body = max_body
+    self.pool = None
+    self.db_executor = None
+    self.session = None
+    self.audit = None
+    self.queue = None
+    self._admission = None
+    self._tasks = []
+    self._servers = []
+
+  async def start(self, host='127.0.0.1', port=8765, unix_path=None):
+    """Starts the pools and worker tasks and begins listening."""
+    loop = asyncio.get_running_loop()
+    self.pool = ProcessPoolExecutor(max_workers=self.workers)
+    self.db_executor = ThreadPoolExecutor(max_workers=1)
+    self.session, self.audit = await loop.run_in_executor(self.db_executor, self._open_db)
+    await asyncio.gather(*[loop.run_in_executor(self.pool, _warm_up) for _ in range(self.workers)])
+
+    self.queue = asyncio.Queue(maxsize=self.queue_size)
+    #jobs waiting plus jobs running; checked before a request body is read
+    self._admission = asyncio.Semaphore(self.queue_size + self.workers)
+    self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+    self._tasks.append(asyncio.ensure_future(self._flush_audit_periodically()))
+
+    if unix_path:
+      if os.path.exists(unix_path):
+        os.remove(unix_path)
+      self._servers.append(await asyncio.start_unix_server(self._handle_connection, path=unix_path))
+    if port is not None and not unix_path:
+      self._servers.append(await asyncio.start_server(self._handle_connection, host, port))
+
+  def _open_db(self):
+    session = get_db_session()
+    return session, AuditWriter(session, flush_interval=AUDIT_FLUSH_INTERVAL)
+
+  async def serve_forever(self):
+    await asyncio.gather(*[server.serve_forever() for server in self._servers])
+
+  async def close(self):
+    """Stops listening, lets running jobs finish and flushes the audit trail."""
+    for server in self._servers:
+      server.close()
+      await server.wait_closed()
+    for task in self._tasks:
+      task.cancel()
+    await asyncio.gather(*self._tasks, return_exceptions=True)
+    if self.audit is not None:
+      loop = asyncio.get_running_loop()
+      await loop.run_in_executor(self.db_executor, self.audit.close)
+      await loop.run_in_executor(self.db_executor, self.session.close)
+    if self.pool is not None:
+      self.pool.shutdown(wait=True)
+    if self.db_executor is not None:
+      self.db_executor.shutdown(wait=True)
+
+  async def _db(self, func, *args):
+    """Runs a database call on the thread that owns the session."""
+    return await asyncio.get_running_loop().run_in_executor(self.db_executor, func, *args)
+
+  async def _flush_audit_periodically(self):
+    while True:
+      await asyncio.sleep(AUDIT_FLUSH_INTERVAL)
+      await self._db(self.audit.flush)
+
+  async def _worker(self):
+    """Takes jobs off the queue and runs them on the process pool."""
+    loop = asyncio.get_running_loop()
+    while True:
+      func, args, future = await self.queue.get()
+      try:
+        result = await loop.run_in_executor(self.pool, func, *args)
+        if not future.cancelled():
+          future.set_result(result)
+      except Exception as e:
+        if not future.cancelled():
+          future.set_exception(e)
+      finally:
+        self.queue.task_done()
+
+  async def submit(self, func, *args):
+    """Queues a job for the process pool and waits for its result."""
+    future = asyncio.get_running_loop().create_future()
+    await self.queue.put((func, args, future))
+    return await future
+
+  def _resolve_options(self, options):
+    """
+    Turns request options into (tags_to_remove, remove_all, profile_id).
+    Runs on the database thread since profiles are loaded from the session.
+    """
+    if options.get('profile'):
+      name_or_id = str(options['profile'])
+      if name_or_id.isdigit():
+        profile = Profile.find_by_id(self.session, int(name_or_id))
+      else:
+        profile = Profile.find_by_name(self.session, name_or_id)
+      if not profile:
+        raise HTTPError(404, f"Profile not found: {name_or_id}")
+      return matcher_for_profile(profile), False, profile.id
+    if options.get('all'):
+      return [], True, None
+    tags = options.get('tags')
+    if tags:
+      if isinstance(tags, str):
+        tags = tags.split(',')
+      return compile_tags(tags), False, None
+    raise HTTPError(400, "One of 'profile', 'all' or 'tags' is required.")
+
+  async def _handle_connection(self, reader, writer):
+    """Serves requests on one connection until the client closes it."""
+    try:
+      while True:
+        request_line = await reader.readline()
+        if not request_line:
+          break
+        keep_alive = await self._handle_request(request_line, reader, writer)
+        await writer.drain()
+        if not keep_alive:
+          break
+    except (ConnectionError, asyncio.IncompleteReadError):
+      pass
+    finally:
+      writer.close()
+
+  async def _handle_request(self, request_line, reader, writer):
+    """Reads one request and writes its response. Returns whether to keep the connection."""
+    try:
+      method, target, version = request_line.decode('latin-1').split()
+    except ValueError:
+      self._respond(writer, 400, {'error': "Malformed request line."}, keep_alive=False)
+      return False
+
+    headers = {}
+    while True:
+      line = await reader.readline()
+      if line in (b'\r\n', b'\n', b''):
+        break
+      name, _, value = line.decode('latin-1').partition(':')
+      headers[name.strip().lower()] = value.strip()
+    keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+    try:
+      status, body, extra = await self._dispatch(method, target, headers, reader)
+    except HTTPError as e:
+      #the unread body would be taken for the next request
+      if e.status in (411, 413, 503):
+        keep_alive = False
+      status, body, extra = e.status, {'error': e.message}, e.headers
+    except Exception as e:
+      status, body, extra = 500, {'error': f"Internal error: {e}"}, {}
+    self._respond(writer, status, body, extra, keep_alive)
+    return keep_alive
+
+  async def _dispatch(self, method, target, headers, reader):
+    url = urlsplit(target)
+    if url.path == '/health':
+      if method != 'GET':
+        raise HTTPError(405, "Use GET.")
+      return 200, {'status': 'ok', 'workers': self.workers, 'queued': self.queue.qsize()}, {}
+    if url.path not in ('/scrub', '/scrub/upload'):
+      raise HTTPError(404, f"No such endpoint: {url.path}")
+    if method != 'POST':
+      raise HTTPError(405, "Use POST.")
+
+    #backpressure: refuse before reading the body so a burst can't pile up in memory
+    if self._admission.locked():
+      raise HTTPError(503, "Too many jobs queued, retry later.", {'Retry-After': '1'})
+    async with self._admission:
+      body = await self._read_body(headers, reader)
+      if url.path == '/scrub':
+        return await self._scrub_path(body, headers)
+      return await self._scrub_upload(body, parse_qs(url.query), headers)
+
+  async def _read_body(self, headers, reader):
+    if 'content-length' not in headers:
+      raise HTTPError(411, "Content-Length is required.")
+    try:
+      length = int(headers['content-length'])
+    except ValueError:
+      raise HTTPError(400, "Invalid Content-Length.")
+    if length > self.max_body:
+      raise HTTPError(413, f"Request body is larger than {self.max_body} bytes.")
+    return await reader.readexactly(length)
+
+  def _allowed_path(self, file_path):
+    """Resolves a requested path; raises 403 unless it is inside one of the roots."""
+    real_path = os.path.realpath(file_path)
+    for root in self.roots:
+      if os.path.commonpath([root, real_path]) == root:
+        return real_path
+    if not self.roots:
+      raise HTTPError(403, "No roots are configured; start the service with --root to scrub files on disk.")
+    raise HTTPError(403, f"Path is outside the configured roots: {file_path}")
+
+  async def _scrub_path(self, body, headers):
+    #a simple cross-origin POST can't set this, so web pages can't drive the endpoint
+    if headers.get('content-type', '').split(';')[0].strip().lower() != 'application/json':
+      raise HTTPError(415, "Content-Type must be application/json.")
+    try:
+      options = json.loads(body or b'{}')
+    except ValueError:
+      raise HTTPError(400, "Request body is not valid JSON.")
+    file_path = options.get('path') if isinstance(options, dict) else None
+    if not file_path or not isinstance(file_path, str):
+      raise HTTPError(400, "'path' is required.")
+    real_path = self._allowed_path(file_path)
+    if not os.path.isfile(real_path):
+      raise HTTPError(404, f"File not found: {file_path}")
+
+    tags_to_remove, remove_all, profile_id = await self._db(self._resolve_options, options)
+    in_place = bool(options.get('in_place'))
+    result = await self.submit(_scrub_durably, real_path, tags_to_remove, remove_all, in_place)
+    #files copied without changes (no metadata, broken Exif) are not failures
+    if result.error and result.error not in UNCHANGED:
+      return 200, {'path': file_path, 'status': 'failed', 'error': result.error}, {}
+
+    if result.removed_data:
+      await self._db(self.audit.add, result.file_path, result.processed_path, result.removed_data, profile_id)
+    response = {
+      'path': file_path,
+      'status': 'scrubbed' if result.removed_data else 'unchanged',
+      'output': result.processed_path,
+      'removed': [str(name) for name in result.removed_data or {}],
+    }
+    if result.error:
+      response['note'] = result.error
+    return 200, response, {}
+
+  async def _scrub_upload(self, body, query, headers):
+    options = {name: values[-1] for name, values in query.items()}
+    name = options.get('name', 'upload')
+    tags_to_remove, remove_all, profile_id = await self._db(self._resolve_options, options)
+    #scrubbed in memory in the worker, the upload never touches disk
+    data, removed_data, error = await self.submit(scrub_bytes, body, tags_to_remove, remove_all)
+    #an image with nothing to remove comes back as it was sent
+    if error and error not in UNCHANGED:
+      raise HTTPError(400, error)
+
+    if removed_data:
+      await self._db(self.audit.add, f"upload:{name}", f"upload:{name}", removed_data, profile_id)
+    response_headers = {
+      'Content-Type': headers.get('content-type', 'application/octet-stream'),
+      'X-Removed-Tags': ','.join(str(tag_name) for tag_name in removed_data or {}),
+    }
+    if error:
+      response_headers['X-Scrub-Note'] = error
+    return 200, data, response_headers
+
+  def _respond(self, writer, status, body, headers=None, keep_alive=True):
+    headers = dict(headers or {})
+    if not isinstance(body, bytes):
+      body = json.dumps(body).encode()
+      headers.setdefault('Content-Type', 'application/json')
+    headers['Content-Length'] = str(len(body))
+    headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+    head = f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+    head += ''.join(f"{name}: {value}\r\n" for name, value in headers.items())
+    writer.write(head.encode('latin-1') + b'\r\n' + body)
+
+
+async def serve(host='127.0.0.1', port=8765, unix_path=None, workers=None, queue_size=QUEUE_SIZE, max_body=MAX_BODY,
+                roots=()):
+  """Runs a ScrubService until it is cancelled (e.g. by Ctrl-C)."""
+  service = ScrubService(workers=workers, queue_size=queue_size, max_body=max_body, roots=roots)
+  await service.start(host, port, unix_path)
+  try:
+    await service.serve_forever()
+  finally:
+    await service.close()
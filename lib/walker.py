@@ -0,0 +1,87 @@
+import os
+from fnmatch import fnmatch
+
+from . import formats
+
+#file name patterns picked up when walking a directory
+DEFAULT_INCLUDE = (
+  '*.jpg', '*.jpeg', '*.jpe', '*.png', '*.tif', '*.tiff', '*.webp', '*.heic', '*.heif', '*.avif',
+)
+
+#outputs of earlier runs are never fed back into the scrubber
+DEFAULT_EXCLUDE = ('*_scrubbed*',)
+
+
+def sniff_format(filepath):
+  """Returns the image format of a file from its magic bytes, or None if it isn't a supported image."""
+  try:
+    with open(filepath, 'rb') as f:
+      head = f.read(16)
+  except OSError:
+    return None
+  return format_from_bytes(head)
+
+
+def format_from_bytes(head):
+  """Returns the image format for the first bytes of a file, or None."""
+  backend = formats.backend_for(head)
+  return backend.name if backend else None
+
+
+def _matches(name, rel_path, patterns):
+  """Checks a file name or its path relative to the walk root against glob patterns."""
+  for pattern in patterns:
+    target = rel_path if '/' in pattern else name
+    if fnmatch(target.lower(), pattern.lower()):
+      return True
+  return False
+
+
+def iter_image_files(root, include=None, exclude=None, recursive=True, check_magic=True):
+  """
+  Lazily yields the paths of image files under `root`.
+  Directories are read with os.scandir one at a time, so memory stays flat no
+  matter how many entries the tree holds. Files must match an `include` glob,
+  must not match an `exclude` glob (excluded directories are not entered) and,
+  with `check_magic`, must start with the magic bytes of a supported format.
+  Symlinked directories are not followed.
+  """
+  include = tuple(include or DEFAULT_INCLUDE)
+  exclude = tuple(exclude or ()) + DEFAULT_EXCLUDE
+
+  #stack of open directory iterators; its depth is the depth of the tree, not its size
+  stack = [os.scandir(root)]
+  try:
+    while stack:
+      try:
+        entry = next(stack[-1])
+      except StopIteration:
+        stack.pop().close()
+        continue
+      except OSError:
+        #unreadable directory; skip the rest of it
+        stack.pop().close()
+        continue
+
+      rel_path = os.path.relpath(entry.path, root).replace(os.sep, '/')
+      if _matches(entry.name, rel_path, exclude):
+        continue
+
+      try:
+        if entry.is_dir(follow_symlinks=False):
+          if recursive:
+            stack.append(os.scandir(entry.path))
+          continue
+        if not entry.is_file():
+          continue
+      except OSError:
+        continue
+
+      if not _matches(entry.name, rel_path, include):
+        continue
+      if check_magic and sniff_format(entry.path) is None:
+        continue
+      yield entry.path
+  finally:
+    for it in stack:
+      it.close()
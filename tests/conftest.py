@@ -0,0 +1,55 @@
+import atexit
+import io
+import os
+import tempfile
+
+#the CLI and the service open the database named here; set before lib.db is imported
+os.environ['PRIVACY_GUARD_DB'] = os.path.join(tempfile.mkdtemp(prefix='privacy-guard-tests-'), 'audit.db')
+
+import pytest
+from PIL import Image
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+#models registers its tables on Base
+from lib.db import database, models  # noqa: F401
+from lib.db.migrations import ensure_schema
+
+
+def make_jpeg(exif_bytes=None, color=(200, 40, 90), size=(32, 24)):
+  """Returns a small JPEG, with an Exif block when given one (piexif.dump output)."""
+  out = io.BytesIO()
+  options = {'exif': exif_bytes} if exif_bytes else {}
+  Image.new('RGB', size, color).save(out, format='JPEG', quality=90, **options)
+  return out.getvalue()
+
+
+@pytest.fixture
+def engine(tmp_path):
+  """An engine on a new database of its own, tuned like the application's and with the schema created."""
+  #ids and the search table differ between databases; forget what the last one held
+  models.TagName._names.clear()
+  models.SearchIndex._available = None
+  engine = create_engine(f"sqlite:///{tmp_path / 'audit.db'}")
+  event.listen(engine, 'connect', database._apply_sqlite_pragmas)
+  ensure_schema(engine, database.Base.metadata)
+  yield engine
+  engine.dispose()
+
+
+@pytest.fixture
+def session(engine):
+  session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+  yield session
+  session.close()
+
+
+@pytest.fixture
+def app(session, monkeypatch):
+  """A headless Cli on the test's own database, scrubbing in one worker process."""
+  import cli
+  monkeypatch.setattr(database, 'get_db_session', lambda: session)
+  app = cli.Cli(workers=1, json_output=True)
+  yield app
+  app.audit.close()
+  atexit.unregister(app.audit.close)
@@ -0,0 +1,86 @@
+import pytest
+
+from lib.db.audit import AuditWriter
+from lib.db.models import FileLog, FileLogTag, Job, JobFile
+
+
+def logs(session):
+  return session.query(FileLog).order_by(FileLog.id).all()
+
+
+def test_logs_are_buffered_until_the_batch_is_full(session):
+  writer = AuditWriter(session, batch_size=2, flush_interval=3600)
+
+  writer.add('/in/a.jpg', '/in/a_scrubbed.jpg', {'Make': "Acme"})
+  assert len(writer) == 1
+  assert not logs(session)
+
+  writer.add('/in/b.jpg', '/in/b_scrubbed.jpg', {'Model': "Snapper"})
+  assert len(writer) == 0
+  assert [log.original_filepath for log in logs(session)] == ['/in/a.jpg', '/in/b.jpg']
+
+  writer.add('/in/c.jpg', '/in/c_scrubbed.jpg', {})
+  writer.close()
+  assert len(logs(session)) == 3
+
+
+def test_durable_writer_commits_every_file(session):
+  writer = AuditWriter(session, batch_size=500, durable=True)
+
+  writer.add('/in/a.jpg', '/in/a_scrubbed.jpg', {'Make': "Acme"})
+
+  assert len(writer) == 0
+  assert len(logs(session)) == 1
+
+
+def test_flush_writes_tags_links_and_checkpoints(session):
+  job = Job.create(session, ['/in'], {'remove_all': True})
+  writer = AuditWriter(session, flush_interval=3600)
+  writer.job_id = job.id
+  flushed = []
+  writer.before_flush = lambda: flushed.append(len(writer))
+
+  writer.add('/in/a.jpg', '/in/a_scrubbed.jpg', {'Make': "Acme", 'GPSInfo': {1: 'N', 2: (51.0, 30.0, 0.0)}})
+  writer.checkpoint('/in/b.jpg', 'failed')
+  assert writer.flush() == 1
+
+  assert flushed == [3]
+  log, = logs(session)
+  assert log.removed_tags == {'Make': "Acme", 'GPSInfo': {1: 'N', 2: (51.0, 30.0, 0.0)}}
+  assert session.query(FileLogTag).filter_by(file_log_id=log.id).count() == 2
+  assert [log.id for log in FileLog.find_by_tag(session, 'GPSInfo')] == [log.id]
+  statuses = dict(session.query(JobFile.file_path, JobFile.status).filter_by(job_id=job.id))
+  assert statuses == {'/in/a.jpg': 'scrubbed', '/in/b.jpg': 'failed'}
+
+
+def test_failed_flush_rolls_back_and_keeps_the_rows(session, monkeypatch):
+  job = Job.create(session, ['/in'], {'remove_all': True})
+  writer = AuditWriter(session, flush_interval=3600)
+  writer.job_id = job.id
+  writer.add('/in/a.jpg', '/in/a_scrubbed.jpg', {'Make': "Acme"})
+
+  def interrupted(session, rows):
+    raise KeyboardInterrupt
+  monkeypatch.setattr(JobFile, 'upsert_many', interrupted)
+  with pytest.raises(KeyboardInterrupt):
+    writer.flush()
+
+  #neither the log nor its tag links were committed without the checkpoint
+  assert not logs(session)
+  assert not session.query(FileLogTag).count()
+  assert len(writer) == 2
+
+  monkeypatch.undo()
+  writer.add('/in/b.jpg', '/in/b_scrubbed.jpg', {'Model': "Snapper"})
+  assert writer.flush() == 2
+  assert [log.original_filepath for log in logs(session)] == ['/in/a.jpg', '/in/b.jpg']
+  assert logs(session)[0].removed_tags == {'Make': "Acme"}
+  assert session.query(JobFile).filter_by(job_id=job.id).count() == 2
+
+
+def test_context_manager_flushes_on_exit(session):
+  with AuditWriter(session, flush_interval=3600) as writer:
+    writer.add('/in/a.jpg', '/in/a_scrubbed.jpg', {'Make': "Acme"})
+    assert not logs(session)
+
+  assert len(logs(session)) == 1
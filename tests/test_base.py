@@ -0,0 +1,112 @@
+import piexif
+import pytest
+
+from lib import exif
+from lib.formats import base
+from lib.matcher import compile_tags
+
+EXIF = {
+  '0th': {271: b"Acme", 272: b"Snapper 3000", 305: b"Darkroom 1.0"},
+  'Exif': {36867: b"2020:01:01 12:00:00", 37510: b"ASCII\x00\x00\x00a comment"},
+  'GPS': {1: b"N", 2: ((51, 1), (30, 1), (0, 1))},
+}
+
+
+def tiff_bytes():
+  """An Exif block as TIFF bytes, without the Exif header."""
+  return piexif.dump(EXIF)[len(base.EXIF_HEADER):]
+
+
+def test_remove_exif_tags_edits_the_block_in_place():
+  buf = bytearray(tiff_bytes())
+  size = len(buf)
+
+  removed_data, removed_ids = base.remove_exif_tags(buf, compile_tags(['Make', 'UserComment']))
+
+  assert set(removed_data) == {'Make', 'UserComment'}
+  assert removed_ids == {'0th': {271}, 'Exif': {37510}}
+  assert len(buf) == size
+  tags = exif.TiffBlock(buf).to_dict()
+  assert 271 not in tags['0th'] and tags['0th'][272] == "Snapper 3000"
+  assert 37510 not in tags['Exif'] and 36867 in tags['Exif']
+  assert tags['GPS']
+
+
+def test_remove_exif_tags_never_removes_kept_tags():
+  buf = bytearray(tiff_bytes())
+
+  removed_data, removed_ids = base.remove_exif_tags(buf, compile_tags(['Make', 'Model']), keep={'0th': {272}})
+
+  assert removed_ids == {'0th': {271}}
+  assert exif.TiffBlock(buf).to_dict()['0th'][272] == "Snapper 3000"
+
+
+def test_scrub_exif_block_returns_the_new_block():
+  block = tiff_bytes()
+
+  new_block, removed_data, error = base.scrub_exif_block(block, compile_tags(['all GPS']))
+
+  assert error is None
+  assert 'GPSInfo' in removed_data
+  assert len(new_block) == len(block)
+  assert not exif.TiffBlock(bytearray(new_block)).to_dict()['GPS']
+
+
+def test_scrub_exif_block_without_a_match_returns_no_block():
+  new_block, removed_data, error = base.scrub_exif_block(tiff_bytes(), compile_tags(['Artist']))
+
+  assert (new_block, removed_data, error) == (None, {}, None)
+
+
+def test_scrub_exif_block_rebuilds_blocks_it_cannot_edit_in_place(monkeypatch):
+  def refuse(buf, matcher, keep=None):
+    raise exif.ExifError("Cannot remove the Exif IFD pointer in place.")
+  monkeypatch.setattr(base, 'remove_exif_tags', refuse)
+
+  new_block, removed_data, error = base.scrub_exif_block(tiff_bytes(), compile_tags(['Make']))
+
+  assert error is None
+  assert set(removed_data) == {'Make'}
+  tags = piexif.load(base.EXIF_HEADER + new_block)
+  assert 271 not in tags['0th'] and tags['0th'][272] == b"Snapper 3000"
+
+
+def test_scrub_exif_block_reports_broken_blocks():
+  assert base.scrub_exif_block(b'XX\x00\x00garbage', compile_tags(['Make'])) == (None, {}, base.INVALID_EXIF)
+
+
+def test_patched_buffer_copies_only_the_pages_it_writes():
+  original = bytes(range(256)) * 64  #four pages
+  buf = base.PatchedBuffer(original)
+
+  buf[5000:5004] = b'ABCD'
+  buf[4094:4098] = b'wxyz'  #across the first page boundary
+
+  expected = bytearray(original)
+  expected[5000:5004] = b'ABCD'
+  expected[4094:4098] = b'wxyz'
+  assert len(buf) == len(original)
+  assert sorted(buf.pages) == [0, 1]
+  assert buf[4090:5010] == bytes(expected[4090:5010])
+  assert buf[4094] == ord('w')
+  assert b''.join(buf.chunks()) == bytes(expected)
+  assert isinstance(buf.chunks()[-1], memoryview)
+
+
+def test_patched_buffer_refuses_writes_that_change_its_length():
+  buf = base.PatchedBuffer(b'\x00' * 100)
+
+  with pytest.raises(ValueError):
+    buf[10:12] = b'abc'
+  assert not buf.pages
+
+
+def test_remove_exif_tags_through_a_patched_buffer():
+  block = tiff_bytes()
+  edited = bytearray(block)
+  base.remove_exif_tags(edited, compile_tags(['Make', 'all GPS']))
+
+  buf = base.PatchedBuffer(block)
+  base.remove_exif_tags(buf, compile_tags(['Make', 'all GPS']))
+
+  assert b''.join(buf.chunks()) == bytes(edited)
@@ -0,0 +1,100 @@
+import os
+import shutil
+
+import pytest
+
+from lib.db.models import FileLog
+from lib.scrubber import scrubbed_path
+from tests.conftest import make_jpeg
+
+BRIDGE = 'test_images/bridge.jpg'
+
+
+@pytest.fixture
+def photos(tmp_path):
+  shutil.copy(BRIDGE, tmp_path / 'a.jpg')
+  return tmp_path
+
+
+def scrub(app, paths, tags=(), remove_all=True, use_cache=True):
+  return app.scrub_batch(iter([str(path) for path in paths]), list(tags), remove_all, False, use_cache=use_cache)
+
+
+def test_an_unchanged_file_is_skipped_on_the_next_run(app, photos):
+  path = photos / 'a.jpg'
+  assert scrub(app, [path])['scrubbed'] == 1
+  output = os.stat(scrubbed_path(str(path)))
+
+  counts = scrub(app, [path])
+
+  assert (counts['scrubbed'], counts['skipped']) == (0, 1)
+  #the output was not written again
+  assert os.stat(scrubbed_path(str(path))).st_mtime_ns == output.st_mtime_ns
+
+
+def test_a_clean_file_is_skipped_on_the_next_run(app, tmp_path):
+  path = tmp_path / 'clean.jpg'
+  path.write_bytes(make_jpeg())
+  assert scrub(app, [path])['unchanged'] == 1
+
+  assert scrub(app, [path])['skipped'] == 1
+
+
+@pytest.mark.parametrize('change', ['source', 'output', 'options', 'no_cache'])
+def test_a_file_is_scrubbed_again_when_anything_changed(app, photos, change):
+  path = photos / 'a.jpg'
+  scrub(app, [path])
+  tags, remove_all, use_cache = (), True, True
+  if change == 'source':
+    shutil.copy(BRIDGE, path)
+    os.utime(path, ns=(0, 0))
+  elif change == 'output':
+    os.remove(scrubbed_path(str(path)))
+  elif change == 'options':
+    tags, remove_all = ['Make'], False
+  else:
+    use_cache = False
+
+  counts = scrub(app, [path], tags, remove_all, use_cache)
+
+  assert (counts['scrubbed'], counts['skipped']) == (1, 0), counts
+
+
+def test_a_duplicate_reuses_the_earlier_output(app, photos):
+  shutil.copy(BRIDGE, photos / 'b.jpg')
+  scrub(app, [photos / 'a.jpg'])
+
+  counts = scrub(app, [photos / 'a.jpg', photos / 'b.jpg'])
+
+  assert (counts['skipped'], counts['reused'], counts['scrubbed']) == (1, 1, 0)
+  with open(scrubbed_path(str(photos / 'a.jpg')), 'rb') as a, open(scrubbed_path(str(photos / 'b.jpg')), 'rb') as b:
+    assert a.read() == b.read()
+  #the reused file is logged with what was removed from it, values keeping their types
+  log, = FileLog.find_by_tag(app.session, 'Make', limit=100)[:1]
+  assert log.original_filepath == str(photos / 'b.jpg')
+  assert log.removed_tags['Make'] == "Google"
+  assert isinstance(log.removed_tags['GPSInfo'], dict)
+
+
+@pytest.mark.parametrize('prefetch_bytes', [0, 64 * 1024 * 1024])
+def test_a_path_given_twice_is_scrubbed_without_crashing(app, photos, prefetch_bytes):
+  app.prefetch_bytes = prefetch_bytes
+  path = str(photos / 'a.jpg')
+  job = app.start_job([path, path], [], True, False)
+
+  counts = app.scrub_batch(iter([path, path]), [], True, False, job=job)
+
+  assert counts['failed'] == 0
+  assert counts['scrubbed'] + counts['unchanged'] == 2
+  app.session.refresh(job)
+  assert job.status == 'done'
+
+
+def test_a_directory_and_a_file_in_it(app, photos):
+  import cli
+  paths = list(cli.iter_input_paths([str(photos), str(photos / 'a.jpg')]))
+  assert paths == [str(photos / 'a.jpg')] * 2
+
+  counts = app.scrub_batch(iter(paths), [], True, False)
+
+  assert counts['failed'] == 0
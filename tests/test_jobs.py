@@ -0,0 +1,117 @@
+import os
+import shutil
+
+import pytest
+
+from lib.db.models import Job, JobFile
+from lib.scrubber import scrubbed_path
+from tests.conftest import make_jpeg
+
+BRIDGE = 'test_images/bridge.jpg'
+
+
+@pytest.fixture
+def photos(tmp_path):
+  """Five photos with metadata and one without, in a directory of their own."""
+  root = tmp_path / 'photos'
+  root.mkdir()
+  for name in 'abcde':
+    shutil.copy(BRIDGE, root / f'{name}.jpg')
+  (root / 'clean.jpg').write_bytes(make_jpeg())
+  return root
+
+
+def interrupt_after(app, monkeypatch, files):
+  """Makes the batch stop with a Ctrl-C once `files` results have been recorded."""
+  record_result = app.record_result
+  recorded = []
+
+  def record_and_interrupt(result, profile_id, reused=False):
+    if len(recorded) == files:
+      raise KeyboardInterrupt
+    recorded.append(result.file_path)
+    return record_result(result, profile_id, reused)
+  monkeypatch.setattr(app, 'record_result', record_and_interrupt)
+  return recorded
+
+
+def start(app, photos):
+  job = app.start_job([str(photos)], [], True, False)
+  return job, app.resume_job(job, use_cache=False)
+
+
+def test_an_interrupted_job_resumes_where_it_stopped(app, photos, monkeypatch):
+  recorded = interrupt_after(app, monkeypatch, 2)
+  with pytest.raises(KeyboardInterrupt):
+    start(app, photos)
+  monkeypatch.undo()
+  job, = Job.get_unfinished(app.session)
+  assert job.count_files(app.session) == 2
+  written = {path: os.stat(scrubbed_path(path)).st_mtime_ns for path in recorded}
+
+  counts = app.resume_job(job, use_cache=False)
+
+  assert counts['resumed'] == 2
+  assert counts['scrubbed'] + counts['unchanged'] == 4
+  app.session.refresh(job)
+  assert job.status == 'done'
+  assert job.count_files(app.session) == 0
+  #the files done before the interruption were not written again
+  assert {path: os.stat(scrubbed_path(path)).st_mtime_ns for path in recorded} == written
+
+
+def test_failed_files_are_retried_and_done_ones_are_not(app, photos):
+  job = app.start_job([str(photos)], [], True, False)
+  JobFile.upsert_many(app.session, [
+    {'job_id': job.id, 'file_path': str(photos / 'a.jpg'), 'status': 'scrubbed'},
+    {'job_id': job.id, 'file_path': str(photos / 'b.jpg'), 'status': 'failed'},
+    {'job_id': job.id, 'file_path': str(photos / 'clean.jpg'), 'status': 'unchanged'},
+  ])
+  app.session.commit()
+
+  counts = app.resume_job(job, use_cache=False)
+
+  assert counts['resumed'] == 2
+  assert counts['scrubbed'] == 4
+  assert not (photos / 'a_scrubbed.jpg').exists()
+  assert (photos / 'b_scrubbed.jpg').exists()
+
+
+def test_checkpoint_lookups_stream_in_batches(app, photos, monkeypatch):
+  monkeypatch.setattr(JobFile, 'LOOKUP_BATCH', 2)
+  job = app.start_job([str(photos)], [], True, False)
+  done = [str(photos / name) for name in ('a.jpg', 'c.jpg', 'e.jpg')]
+  JobFile.upsert_many(app.session, [{'job_id': job.id, 'file_path': path, 'status': 'scrubbed'} for path in done])
+  app.session.commit()
+  lookups = []
+  completed_among = JobFile.completed_among.__func__
+  monkeypatch.setattr(JobFile, 'completed_among', classmethod(
+    lambda cls, session, job_id, paths: lookups.append(list(paths)) or completed_among(cls, session, job_id, paths)
+  ))
+  scrubbed = []
+  record_result = app.record_result
+  monkeypatch.setattr(app, 'record_result', lambda result, *args, **kwargs: scrubbed.append(result.file_path) or record_result(result, *args, **kwargs))
+
+  counts = app.resume_job(job, use_cache=False)
+
+  assert counts['resumed'] == 3
+  assert [len(batch) for batch in lookups] == [2, 2, 2]
+  walked = [path for batch in lookups for path in batch]
+  assert scrubbed == [path for path in walked if path not in done]
+
+
+def test_completed_among_only_reports_done_paths(session):
+  job = Job.create(session, ['/in'], {'remove_all': True})
+  other = Job.create(session, ['/in'], {'remove_all': True})
+  JobFile.upsert_many(session, [
+    {'job_id': job.id, 'file_path': '/in/a.jpg', 'status': 'scrubbed'},
+    {'job_id': job.id, 'file_path': '/in/b.jpg', 'status': 'failed'},
+    {'job_id': job.id, 'file_path': '/in/c.jpg', 'status': 'skipped'},
+    {'job_id': other.id, 'file_path': '/in/d.jpg', 'status': 'scrubbed'},
+  ])
+  session.commit()
+
+  assert JobFile.completed_among(session, job.id, ['/in/a.jpg', '/in/b.jpg', '/in/d.jpg', '/in/e.jpg']) == {'/in/a.jpg'}
+  assert JobFile.completed_among(session, job.id, []) == set()
+  assert JobFile.has_completed(session, job.id)
+  assert not JobFile.has_completed(session, Job.create(session, ['/in'], {}).id)
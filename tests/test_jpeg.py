@@ -0,0 +1,141 @@
+import io
+import struct
+
+import piexif
+import pytest
+from PIL import Image
+
+from lib import formats, scrubber
+from lib.formats import jpeg
+from lib.scrubber import scrub_bytes
+from tests.conftest import make_jpeg
+
+EXIF = {
+  '0th': {271: b"Acme", 272: b"Snapper 3000", 305: b"Darkroom 1.0"},
+  'Exif': {36867: b"2020:01:01 12:00:00"},
+  'GPS': {1: b"N", 2: ((51, 1), (30, 1), (0, 1))},
+}
+
+
+def segment(marker, payload):
+  return struct.pack('>BBH', 0xFF, marker, len(payload) + 2) + payload
+
+
+def with_segments(data, *segments, trailer=b''):
+  """Inserts marker segments right after SOI and appends `trailer` after EOI."""
+  return data[:2] + b''.join(segments) + data[2:] + trailer
+
+
+def markers(data):
+  return [seg.marker for seg in jpeg.parse_segments(data)[0]]
+
+
+def pixels(data):
+  with Image.open(io.BytesIO(data)) as img:
+    return img.size, img.tobytes()
+
+
+@pytest.fixture
+def photo():
+  """A JPEG with Exif, XMP, IPTC and a comment, and a preview after EOI."""
+  return with_segments(
+    make_jpeg(piexif.dump(EXIF)),
+    segment(jpeg.APP1, jpeg.XMP_HEADER + b'<x:xmpmeta/>'),
+    segment(jpeg.APP13, jpeg.IPTC_HEADER + b'8BIM\x04\x04\x00\x00' + struct.pack('>I', 4) + b'\x1c\x02\x00\x00'),
+    segment(jpeg.COM, b"taken at home"),
+    trailer=b'\xff\xd8preview\xff\xd9',
+  )
+
+
+def test_strip_drops_metadata_segments_and_trailing_data(photo):
+  scrubbed, removed, error = scrub_bytes(photo, remove_all=True)
+
+  assert error is None
+  assert not {jpeg.APP1, jpeg.APP13, jpeg.COM} & set(markers(scrubbed))
+  assert jpeg.APP0 in markers(scrubbed)
+  assert scrubbed.endswith(b'\xff\xd9')
+  assert b'preview' not in scrubbed
+  assert {'Make', 'Model', 'Software', 'DateTimeOriginal', 'GPSInfo', 'XMP', 'IPTC'} <= set(removed)
+  assert removed['Comment'] == "taken at home"
+
+
+def test_strip_keeps_pixels_identical(photo):
+  scrubbed, removed, error = scrub_bytes(photo, remove_all=True)
+
+  assert error is None
+  assert pixels(scrubbed) == pixels(photo)
+
+
+def test_strip_keeps_every_other_segment_byte_for_byte():
+  data = make_jpeg(piexif.dump(EXIF))
+  exif = jpeg.find_exif(data, jpeg.parse_segments(data)[0])
+
+  chunks, removed, error = jpeg.strip(with_segments(data, segment(jpeg.COM, b"note"), trailer=b'junk'))
+
+  assert error is None
+  assert b''.join(chunks) == data[:exif.start] + data[exif.end:]
+
+
+def test_jpeg_without_metadata_is_copied_unchanged():
+  data = make_jpeg()
+
+  scrubbed, removed, error = scrub_bytes(data, remove_all=True)
+
+  assert error == formats.base.NO_METADATA
+  assert scrubbed == data
+
+
+def test_malformed_segments_go_to_the_pillow_fallback(photo, monkeypatch):
+  #junk bytes between two segments, which Pillow skips and the segment parser rejects
+  first = jpeg.parse_segments(photo)[0][1]
+  broken = photo[:first.end] + b'\x00\x00' + photo[first.end:]
+  with pytest.raises(jpeg.JPEGError):
+    jpeg.parse_segments(broken)
+  opened = []
+  open_image = scrubber._open_image
+  monkeypatch.setattr(scrubber, '_open_image', lambda data: opened.append(data) or open_image(data))
+
+  scrubbed, removed, error = scrub_bytes(broken, remove_all=True)
+
+  assert error is None
+  assert opened
+  assert {'Make', 'Model'} <= set(removed)
+  with Image.open(io.BytesIO(scrubbed)) as img:
+    assert img.size == (32, 24)
+    assert 'exif' not in img.info
+
+
+def test_selective_scrub_removes_only_matched_tags_in_place():
+  data = make_jpeg(piexif.dump(EXIF))
+
+  scrubbed, removed, error = scrub_bytes(data, ['Make', 'GPSInfo'])
+
+  assert error is None
+  assert set(removed) == {'Make', 'GPSInfo'}
+  #the Exif segment keeps its size, so nothing else in the file moves
+  assert len(scrubbed) == len(data)
+  assert pixels(scrubbed) == pixels(data)
+  tags = piexif.load(scrubbed)
+  assert 271 not in tags['0th']
+  assert tags['0th'][272] == b"Snapper 3000"
+  assert tags['Exif'][36867] == b"2020:01:01 12:00:00"
+  assert not tags['GPS']
+
+
+def test_selective_scrub_leaves_other_segments_alone(photo):
+  scrubbed, removed, error = scrub_bytes(photo, ['Software'])
+
+  assert error is None
+  assert set(removed) == {'Software'}
+  assert markers(scrubbed) == markers(photo)
+  assert scrubbed.endswith(b'preview\xff\xd9')
+
+
+def test_selective_scrub_without_a_match_copies_the_file():
+  data = make_jpeg(piexif.dump(EXIF))
+
+  scrubbed, removed, error = scrub_bytes(data, ['Artist'])
+
+  assert error is None
+  assert removed == {}
+  assert scrubbed == data
@@ -0,0 +1,93 @@
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.orm import sessionmaker
+
+from lib.db import database, models
+from lib.db.migrations import SCHEMA_VERSION, ensure_schema, schema_version
+from lib.db.search import SearchQuery, search_logs
+
+#the tables as the first release created them, before versioned schemas
+BASELINE = [
+  "CREATE TABLE profiles (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL UNIQUE, description VARCHAR)",
+  "CREATE TABLE profile_tags (id INTEGER PRIMARY KEY, tag_name VARCHAR NOT NULL, profile_id INTEGER REFERENCES profiles (id))",
+  "CREATE TABLE file_logs (id INTEGER PRIMARY KEY, original_filepath VARCHAR NOT NULL, "
+  "processed_filepath VARCHAR NOT NULL, timestamp DATETIME, profile_used_id INTEGER REFERENCES profiles (id))",
+  "CREATE TABLE scrubbed_tags (id INTEGER PRIMARY KEY, tag_name VARCHAR, tag_value VARCHAR, "
+  "file_log_id INTEGER REFERENCES file_logs (id))",
+]
+
+
+def baseline_engine(path):
+  models.TagName._names.clear()
+  models.SearchIndex._available = None
+  engine = create_engine(f"sqlite:///{path}")
+  event.listen(engine, 'connect', database._apply_sqlite_pragmas)
+  with engine.begin() as connection:
+    for statement in BASELINE:
+      connection.execute(text(statement))
+    connection.execute(text("INSERT INTO profiles (id, name, description) VALUES (1, 'Travel', 'no location')"))
+    connection.execute(
+      text("INSERT INTO file_logs VALUES (:id, :original, :processed, :timestamp, :profile)"),
+      [
+        {'id': 1, 'original': '/trip/beach.jpg', 'processed': '/trip/beach_scrubbed.jpg',
+         'timestamp': '2023-05-01 10:00:00.000000', 'profile': 1},
+        {'id': 2, 'original': '/home/cat.jpg', 'processed': '/home/cat_scrubbed.jpg',
+         'timestamp': '2023-05-02 10:00:00.000000', 'profile': None},
+        {'id': 3, 'original': '/home/clean.jpg', 'processed': '/home/clean_scrubbed.jpg',
+         'timestamp': '2023-05-03 10:00:00.000000', 'profile': None},
+      ]
+    )
+    connection.execute(
+      text("INSERT INTO scrubbed_tags (tag_name, tag_value, file_log_id) VALUES (:name, :value, :log_id)"),
+      [
+        {'name': 'GPSInfo', 'value': "{1: 'N'}", 'log_id': 1},
+        {'name': 'Make', 'value': 'Acme', 'log_id': 1},
+        {'name': 'Make', 'value': 'Snapper', 'log_id': 2},
+        {'name': None, 'value': 'orphan', 'log_id': 2},
+      ]
+    )
+  return engine
+
+
+def test_baseline_database_is_migrated_to_the_current_schema(tmp_path):
+  engine = baseline_engine(tmp_path / 'old.db')
+
+  assert ensure_schema(engine, database.Base.metadata)
+
+  with engine.connect() as connection:
+    assert schema_version(connection) == SCHEMA_VERSION
+  tables = set(inspect(engine).get_table_names())
+  assert 'scrubbed_tags' not in tables
+  assert {'tag_names', 'file_log_tags', 'scrub_cache', 'jobs', 'job_files'} <= tables
+  #a second open costs only the version check
+  assert not ensure_schema(engine, database.Base.metadata)
+  engine.dispose()
+
+
+def test_scrubbed_tags_are_packed_with_interned_names(tmp_path):
+  engine = baseline_engine(tmp_path / 'old.db')
+  ensure_schema(engine, database.Base.metadata)
+  session = sessionmaker(bind=engine)()
+
+  beach, cat, clean = session.query(models.FileLog).order_by(models.FileLog.id).all()
+
+  #the old values were saved as strings and stay strings
+  assert beach.removed_tags == {'GPSInfo': "{1: 'N'}", 'Make': 'Acme'}
+  assert cat.removed_tags == {'Make': 'Snapper'}
+  assert clean.removed_tags == {}
+  assert session.query(models.TagName).count() == 2
+  assert [log.id for log in models.FileLog.find_by_tag(session, 'Make')] == [2, 1]
+  session.close()
+  engine.dispose()
+
+
+def test_existing_logs_are_backfilled_into_the_search_index(tmp_path):
+  engine = baseline_engine(tmp_path / 'old.db')
+  ensure_schema(engine, database.Base.metadata)
+  session = sessionmaker(bind=engine)()
+
+  assert models.SearchIndex.available(session)
+  assert session.execute(text("SELECT count(*) FROM file_log_search")).scalar() == 3
+  assert [log.id for log in search_logs(session, SearchQuery(text='gps')).logs] == [1]
+  assert [log.id for log in search_logs(session, SearchQuery(text='home scrubbed')).logs] == [3, 2]
+  session.close()
+  engine.dispose()
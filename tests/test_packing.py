@@ -0,0 +1,54 @@
+import math
+
+import pytest
+from PIL.TiffImagePlugin import IFDRational
+
+from lib.db import packing
+from lib.exif import Rational
+
+
+@pytest.mark.parametrize('value', [
+  None, True, 0, -7, "Acme", "",
+  b"\x00\xffraw", bytearray(b"MakerNote"),
+  1.5, (51.0, 30.0, 14.78), [1, 2, 3], ((1, 2), (3, 4)),
+  {1: 'N', 2: (51.0, 30.0, 0.0), 27: b"ASCII\x00\x00\x00GPS"},
+  {'Exif': {36867: "2020:01:01"}, 'GPS': {}},
+])
+def test_values_keep_their_type(value):
+  blob = packing.pack_tags([(3, value)])
+
+  (tag_id, restored), = packing.unpack_tags(blob)
+
+  assert tag_id == 3
+  assert restored == (bytes(value) if isinstance(value, bytearray) else value)
+  assert type(restored) is (bytes if isinstance(value, bytearray) else type(value))
+
+
+def test_rationals_come_back_as_floats():
+  pairs = [(1, Rational(1, 3)), (2, IFDRational(72, 1)), (3, (Rational(51, 1), IFDRational(1478, 100)))]
+
+  restored = packing.unpack_tags(packing.pack_tags(pairs))
+
+  assert restored[0] == (1, pytest.approx(1 / 3))
+  assert restored[1] == (2, 72.0)
+  assert restored[2] == (3, (51.0, 14.78))
+
+
+def test_non_finite_floats_survive():
+  (nan_id, nan), (inf_id, inf) = packing.unpack_tags(packing.pack_tags([(1, Rational(0, 0)), (2, float('inf'))]))
+
+  assert math.isnan(nan)
+  assert inf == float('inf')
+
+
+def test_a_record_keeps_every_pair_in_order():
+  pairs = [(9, "b"), (2, b"a"), (5, {0: (1, 2)})]
+
+  assert packing.unpack_tags(packing.pack_tags(pairs)) == pairs
+
+
+def test_empty_and_unknown_records():
+  assert packing.unpack_tags(None) == []
+  assert packing.unpack_tags(packing.pack_tags([])) == []
+  with pytest.raises(ValueError):
+    packing.unpack_tags(b'\x09' + packing.pack_tags([])[1:])
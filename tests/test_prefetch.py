@@ -0,0 +1,132 @@
+import os
+import random
+import threading
+import time
+
+import pytest
+
+from lib.prefetch import prefetch, read_ahead
+
+
+@pytest.fixture
+def files(tmp_path):
+  """Twenty files of 4 to 20 KB, named in walk order."""
+  paths = []
+  for index in range(20):
+    path = tmp_path / f'{index:02d}.bin'
+    path.write_bytes(b'x' * 1024 * (index % 5 + 1) * 4)
+    paths.append(str(path))
+  return paths
+
+
+def sizes(paths):
+  return {path: os.path.getsize(path) for path in paths}
+
+
+def test_results_come_back_in_input_order(files):
+  def work(path):
+    #later files often finish first
+    time.sleep(random.random() / 200)
+    return path
+
+  results = [(path, future.result()) for path, future in read_ahead(files, work, budget=64 * 1024, threads=4)]
+
+  assert results == [(path, path) for path in files]
+
+
+def test_files_started_and_not_yet_taken_stay_within_the_budget(files):
+  budget = 30 * 1024
+  size_of = sizes(files)
+  lock = threading.Lock()
+  started, taken, peaks = set(), set(), []
+
+  def work(path):
+    with lock:
+      started.add(path)
+      peaks.append(sum(size_of[p] for p in started - taken))
+    if path == files[0]:
+      #holds the caller up so the files behind it get started
+      time.sleep(0.05)
+    return path
+
+  for path, future in read_ahead(files, work, budget=budget, threads=4):
+    future.result()
+    with lock:
+      taken.add(path)
+
+  assert started == set(files)
+  assert max(peaks) <= budget
+  #the budget was actually used to run ahead
+  assert max(peaks) > max(size_of.values())
+
+
+def test_a_file_bigger_than_the_budget_runs_on_its_own(files):
+  running = []
+
+  def work(path):
+    running.append(path)
+    return len(running)
+
+  for path, future in read_ahead(files, work, budget=1024):
+    assert future.result() == len(running)
+    assert running[-1] == path
+    running.clear()
+
+
+def test_head_limits_what_counts_against_the_budget(files):
+  lock = threading.Lock()
+  started, taken, peaks = set(), set(), []
+
+  def work(path):
+    with lock:
+      started.add(path)
+      peaks.append(len(started - taken))
+    if path == files[0]:
+      time.sleep(0.05)
+
+  for path, future in read_ahead(files, work, budget=8 * 1024, threads=4, head=1024):
+    future.result()
+    with lock:
+      taken.add(path)
+
+  #up to eight 1 KB heads fit where only one or two whole files would
+  assert 2 < max(peaks) <= 8
+
+
+def test_no_budget_leaves_the_work_to_the_caller(files):
+  assert list(read_ahead(files, lambda path: pytest.fail("ran ahead"), budget=0)) == [(path, None) for path in files]
+
+
+def test_errors_stay_in_their_future(files):
+  def work(path):
+    if path == files[3]:
+      raise OSError("unreadable")
+    return path
+
+  outcomes = [future.exception() for path, future in read_ahead(files[:6], work)]
+
+  assert [error is None for error in outcomes] == [True, True, True, False, True, True]
+
+
+def test_stopping_early_cancels_the_rest(files):
+  ran = []
+  gate = threading.Event()
+
+  def work(path):
+    gate.wait(5)
+    ran.append(path)
+
+  reads = read_ahead(files, work, budget=10 ** 9, threads=1)
+  first, future = next(reads)
+  #lets the one running read finish while the generator shuts its pool down
+  threading.Timer(0.05, gate.set).start()
+  reads.close()
+
+  assert first == files[0]
+  assert len(ran) < len(files)
+
+
+def test_prefetch_yields_every_path_in_order(files, tmp_path):
+  missing = str(tmp_path / 'missing.jpg')
+
+  assert list(prefetch(files[:3] + [missing] + files[3:], budget=16 * 1024)) == files[:3] + [missing] + files[3:]
@@ -0,0 +1,94 @@
+import datetime
+import gzip
+import json
+import os
+
+import pytest
+from sqlalchemy import text
+
+from lib.db.models import FileLog, FileLogTag, get_current_time_eat
+from lib.db.retention import RetentionPolicy, prune
+
+
+@pytest.fixture
+def trail(session):
+  """Six logs a day apart, the oldest first, each with two removed tags."""
+  now = get_current_time_eat()
+  for day in range(6):
+    log = FileLog.create(session, f'/in/{day}.jpg', f'/in/{day}_scrubbed.jpg', {'Make': f"Acme {day}", 'Model': "Snapper"})
+    log.timestamp = now - datetime.timedelta(days=5 - day)
+  session.commit()
+  return session
+
+
+def remaining(session):
+  return [log.original_filepath for log in session.query(FileLog).order_by(FileLog.timestamp)]
+
+
+def read_archives(paths):
+  records = []
+  for path in paths:
+    with gzip.open(path, 'rt') as f:
+      records += [json.loads(line) for line in f]
+  return records
+
+
+def keep_three(session, limit):
+  """A policy with one limit that keeps the newest three logs of the trail."""
+  if limit == 'max_age':
+    return RetentionPolicy(max_age=datetime.timedelta(days=2, hours=12))
+  if limit == 'max_logs':
+    return RetentionPolicy(max_logs=3)
+  newest = session.query(FileLog).order_by(FileLog.timestamp.desc()).limit(3).all()
+  kept = sum(len(log.tags_blob) + len(log.original_filepath) + len(log.processed_filepath) for log in newest)
+  return RetentionPolicy(max_bytes=kept)
+
+
+LIMITS = ['max_age', 'max_logs', 'max_bytes']
+
+
+@pytest.mark.parametrize('limit', LIMITS)
+def test_prune_keeps_the_newest_logs(trail, limit):
+  result = prune(trail, keep_three(trail, limit), batch_size=2)
+
+  assert (result.expired, result.deleted, result.archives) == (3, 3, [])
+  assert remaining(trail) == ['/in/3.jpg', '/in/4.jpg', '/in/5.jpg']
+  #tag links and index rows go with their logs
+  assert trail.query(FileLogTag).count() == 6
+  assert trail.execute(text("SELECT count(*) FROM file_log_search")).scalar() == 3
+
+
+@pytest.mark.parametrize('limit', LIMITS)
+def test_prune_archives_the_expired_logs_first(trail, limit, tmp_path):
+  archive_dir = tmp_path / 'archive'
+
+  result = prune(trail, keep_three(trail, limit), archive_dir=str(archive_dir), batch_size=2)
+
+  assert result.deleted == 3
+  assert len(result.archives) == 1
+  assert os.listdir(archive_dir) == [os.path.basename(result.archives[0])]
+  records = read_archives(result.archives)
+  assert [record['original_path'] for record in records] == ['/in/0.jpg', '/in/1.jpg', '/in/2.jpg']
+  assert records[0]['scrubbed_tags'] == {'Make': "Acme 0", 'Model': "Snapper"}
+
+
+def test_the_strictest_limit_wins(trail):
+  result = prune(trail, RetentionPolicy(max_age=datetime.timedelta(days=30), max_logs=1))
+
+  assert result.deleted == 5
+  assert remaining(trail) == ['/in/5.jpg']
+
+
+def test_prune_within_the_policy_deletes_nothing(trail, tmp_path):
+  result = prune(trail, RetentionPolicy(max_logs=10, max_bytes=10 ** 6), archive_dir=str(tmp_path / 'archive'))
+
+  assert result == (0, 0, [])
+  assert len(remaining(trail)) == 6
+  assert not (tmp_path / 'archive').exists()
+
+
+def test_dry_run_only_counts(trail):
+  result = prune(trail, RetentionPolicy(max_logs=2), dry_run=True)
+
+  assert (result.expired, result.deleted) == (4, 0)
+  assert len(remaining(trail)) == 6
@@ -0,0 +1,90 @@
+import io
+
+from PIL import Image, TiffImagePlugin
+
+from lib import formats
+from lib.scrubber import scrub_bytes, scrub_file, scrubbed_path
+
+
+def make_bigtiff(tags=None, compression=None):
+  """Returns a small BigTIFF, which the TIFF backend leaves to the Pillow fallback."""
+  info = TiffImagePlugin.ImageFileDirectory_v2()
+  for tag_id, value in (tags or {}).items():
+    info[tag_id] = value
+  out = io.BytesIO()
+  Image.new('RGB', (16, 8), (10, 120, 240)).save(
+    out, format='TIFF', tiffinfo=info, big_tiff=True, compression=compression
+  )
+  return out.getvalue()
+
+
+DESCRIPTIVE = {271: "Acme", 272: "Snapper 3000", 305: "Darkroom 1.0"}
+
+
+def tags_of(data):
+  with Image.open(io.BytesIO(data)) as img:
+    img.load()
+    assert img.getpixel((0, 0)) == (10, 120, 240)
+    return dict(img.getexif())
+
+
+def test_bigtiff_goes_to_the_pillow_fallback():
+  assert formats.backend_for(make_bigtiff()[:16]) is None
+
+
+def test_full_scrub_of_bigtiff_removes_its_tags():
+  scrubbed, removed, error = scrub_bytes(make_bigtiff(DESCRIPTIVE), remove_all=True)
+
+  assert error is None
+  assert {'Make', 'Model', 'Software'} <= set(removed)
+  assert not {271, 272, 305} & set(tags_of(scrubbed))
+
+
+def test_full_scrub_of_compressed_bigtiff_removes_its_tags():
+  scrubbed, removed, error = scrub_bytes(make_bigtiff(DESCRIPTIVE, compression='tiff_deflate'), remove_all=True)
+
+  assert error is None
+  assert not {271, 272, 305} & set(tags_of(scrubbed))
+
+
+def test_selective_scrub_of_bigtiff_removes_only_matched_tags():
+  scrubbed, removed, error = scrub_bytes(make_bigtiff(DESCRIPTIVE), ['Make', 'Image*'])
+
+  assert error is None
+  assert set(removed) == {'Make'}
+  tags = tags_of(scrubbed)
+  assert 271 not in tags
+  assert tags[272] == "Snapper 3000"
+
+
+def test_bigtiff_without_metadata_is_copied_unchanged():
+  data = make_bigtiff()
+
+  scrubbed, removed, error = scrub_bytes(data, remove_all=True)
+
+  assert error == formats.base.NO_METADATA
+  assert removed == {}
+  assert scrubbed == data
+
+
+def test_scrub_file_strips_bigtiff_in_place(tmp_path):
+  path = tmp_path / "scan.tif"
+  path.write_bytes(make_bigtiff(DESCRIPTIVE))
+
+  removed, error = scrub_file(str(path), remove_all=True, in_place=True)
+
+  assert error is None
+  assert 'Make' in removed
+  assert not {271, 272, 305} & set(tags_of(path.read_bytes()))
+  assert not (tmp_path / "scan_scrubbed.tif").exists()
+
+
+def test_scrub_file_copies_clean_bigtiff(tmp_path):
+  path = tmp_path / "clean.tif"
+  path.write_bytes(make_bigtiff())
+
+  removed, error = scrub_file(str(path), remove_all=True)
+
+  assert error == formats.base.NO_METADATA
+  with open(scrubbed_path(str(path)), 'rb') as f:
+    assert f.read() == path.read_bytes()
@@ -0,0 +1,97 @@
+import datetime
+
+import pytest
+
+from lib.db import models
+from lib.db.models import FileLog, Profile
+from lib.db.search import MANUAL, SearchQuery, fts_query, search_logs
+
+DAY = datetime.datetime(2024, 3, 10, 12, 0)
+
+#(original path, removed tags, profile, days before DAY)
+LOGS = [
+  ('/photos/trip/beach.jpg', {'GPSInfo': {1: 'N'}, 'Make': "Acme"}, 'Travel', 2),
+  ('/photos/trip/dunes.jpg', {'GPSInfo': {1: 'S'}, 'DateTimeOriginal': "2024:03:08"}, 'Travel', 1),
+  ('/photos/trip2/harbour.jpg', {'Make': "Acme"}, None, 1),
+  ('/photos/home/cat.jpg', {'Model': "Snapper"}, None, 0),
+]
+
+
+@pytest.fixture(params=['fts5', 'like'])
+def trail(request, session, monkeypatch):
+  """The logs above, searched through the FTS5 index or, without it, with LIKE scans."""
+  if request.param == 'like':
+    monkeypatch.setattr(models.SearchIndex, '_available', False)
+  travel = Profile.create(session, 'Travel', "no location", ['GPSInfo'])
+  for path, tags, profile, days_ago in LOGS:
+    log = FileLog.create(session, path, path.replace('.jpg', '_scrubbed.jpg'), tags, travel.id if profile else None)
+    log.timestamp = DAY - datetime.timedelta(days=days_ago)
+  session.commit()
+  return session
+
+
+def paths(result):
+  return [log.original_filepath for log in result.logs]
+
+
+def test_uses_the_expected_search_path(trail, request):
+  assert models.SearchIndex.available(trail) == (request.node.callspec.params['trail'] == 'fts5')
+
+
+def test_text_matches_paths_and_tag_names(trail):
+  assert paths(search_logs(trail, SearchQuery(text='beach'))) == ['/photos/trip/beach.jpg']
+  assert paths(search_logs(trail, SearchQuery(text='harb'))) == ['/photos/trip2/harbour.jpg']
+  assert paths(search_logs(trail, SearchQuery(text='datetime'))) == ['/photos/trip/dunes.jpg']
+  #every word has to match
+  assert paths(search_logs(trail, SearchQuery(text='trip make'))) == ['/photos/trip2/harbour.jpg', '/photos/trip/beach.jpg']
+  assert search_logs(trail, SearchQuery(text='nowhere')).total == 0
+
+
+def test_text_is_not_fts_syntax(trail):
+  assert fts_query('GPS* OR "x"') == '"GPS"* "OR"* "x"*'
+  assert search_logs(trail, SearchQuery(text='cat OR beach')).total == 0
+
+
+def test_under_matches_whole_directories(trail):
+  result = search_logs(trail, SearchQuery(under='/photos/trip/'))
+
+  assert paths(result) == ['/photos/trip/dunes.jpg', '/photos/trip/beach.jpg']
+  assert result.total == 2
+
+
+def test_tag_globs(trail):
+  assert paths(search_logs(trail, SearchQuery(with_tags=('GPS*',)))) == ['/photos/trip/dunes.jpg', '/photos/trip/beach.jpg']
+  assert paths(search_logs(trail, SearchQuery(with_tags=('GPS*', 'Make')))) == ['/photos/trip/beach.jpg']
+  assert paths(search_logs(trail, SearchQuery(under='/photos', without_tags=('GPS*', 'M?del')))) == ['/photos/trip2/harbour.jpg']
+  assert search_logs(trail, SearchQuery(with_tags=('Artist',))).total == 0
+
+
+def test_profile_manual_and_dates(trail):
+  assert search_logs(trail, SearchQuery(profile='Travel')).total == 2
+  assert paths(search_logs(trail, SearchQuery(manual=True))) == ['/photos/home/cat.jpg', '/photos/trip2/harbour.jpg']
+  since = DAY - datetime.timedelta(days=1, hours=1)
+  assert search_logs(trail, SearchQuery(since=since, until=DAY)).total == 2
+
+
+def test_limit_keeps_the_total(trail):
+  result = search_logs(trail, SearchQuery(under='/photos'), limit=1)
+
+  assert result.total == 4
+  assert paths(result) == ['/photos/home/cat.jpg']
+
+
+def test_facets_count_the_matching_logs(trail):
+  facets = search_logs(trail, SearchQuery(text='trip')).facets
+
+  assert facets['profiles'] == {'Travel': 2, MANUAL: 1}
+  assert facets['tags'] == {'GPSInfo': 2, 'Make': 2, 'DateTimeOriginal': 1}
+  assert facets['days'] == {'2024-03-09': 2, '2024-03-08': 1}
+
+
+def test_facets_of_the_whole_trail(trail):
+  result = search_logs(trail, SearchQuery(), with_facets=True, facet_limit=2)
+
+  assert result.total == 4
+  assert result.facets['profiles'] == {'Travel': 2, MANUAL: 2}
+  assert result.facets['tags'] == {'GPSInfo': 2, 'Make': 2}
+  assert list(result.facets['days']) == ['2024-03-10', '2024-03-09']
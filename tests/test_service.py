@@ -0,0 +1,59 @@
+import os
+import shutil
+
+import pytest
+
+from lib import output, service
+from tests.conftest import make_jpeg
+
+BRIDGE = 'test_images/bridge.jpg'
+
+
+@pytest.fixture
+def synced(monkeypatch):
+  """The directories fsynced while the test runs."""
+  directories = []
+  monkeypatch.setattr(output, 'sync_dir', directories.append)
+  return directories
+
+
+@pytest.mark.parametrize('in_place', [False, True])
+def test_batch_policy_syncs_the_output_directory_per_request(tmp_path, monkeypatch, synced, in_place):
+  monkeypatch.setattr(output, 'fsync_policy', 'batch')
+  shutil.copy(BRIDGE, tmp_path / 'a.jpg')
+
+  result = service._scrub_durably(str(tmp_path / 'a.jpg'), [], True, in_place)
+
+  assert result.removed_data
+  assert synced == [str(tmp_path)]
+
+
+def test_clean_files_scrubbed_in_place_are_not_synced(tmp_path, monkeypatch, synced):
+  monkeypatch.setattr(output, 'fsync_policy', 'batch')
+  (tmp_path / 'clean.jpg').write_bytes(make_jpeg())
+
+  service._scrub_durably(str(tmp_path / 'clean.jpg'), [], True, True)
+  assert synced == []
+  #a copy was still renamed into place
+  service._scrub_durably(str(tmp_path / 'clean.jpg'), [], True, False)
+  assert synced == [str(tmp_path)]
+
+
+@pytest.mark.parametrize('policy', ['none', 'file'])
+def test_other_policies_leave_the_directory_alone(tmp_path, monkeypatch, synced, policy):
+  monkeypatch.setattr(output, 'fsync_policy', policy)
+  shutil.copy(BRIDGE, tmp_path / 'a.jpg')
+
+  service._scrub_durably(str(tmp_path / 'a.jpg'), [], True, False)
+
+  assert synced == []
+  assert os.path.exists(tmp_path / 'a_scrubbed.jpg')
+
+
+def test_failed_scrubs_are_not_synced(tmp_path, monkeypatch, synced):
+  monkeypatch.setattr(output, 'fsync_policy', 'batch')
+
+  result = service._scrub_durably(str(tmp_path / 'missing.jpg'), [], True, False)
+
+  assert result.error
+  assert synced == []
@@ -0,0 +1,83 @@
+import io
+import os
+import subprocess
+import sys
+
+import piexif
+import pytest
+from PIL import Image
+
+from lib import formats
+from lib.scrubber import scrub_stream
+from tests.conftest import make_jpeg
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EXIF = piexif.dump({'0th': {271: b"Acme", 272: b"Snapper 3000"}})
+
+
+def run_cli(args, stdin, tmp_path):
+  """Runs cli.py on its own database, returning the exit code, stdout and stderr."""
+  env = dict(os.environ, PRIVACY_GUARD_DB=str(tmp_path / 'audit.db'))
+  proc = subprocess.run(
+    [sys.executable, os.path.join(ROOT, 'cli.py')] + args, input=stdin, capture_output=True, env=env, cwd=str(tmp_path)
+  )
+  return proc.returncode, proc.stdout, proc.stderr.decode()
+
+
+def test_scrub_stream_writes_the_scrubbed_image():
+  dst = io.BytesIO()
+
+  removed, error = scrub_stream(io.BytesIO(make_jpeg(EXIF)), dst, ['Make'])
+
+  assert error is None
+  assert set(removed) == {'Make'}
+  tags = piexif.load(dst.getvalue())['0th']
+  assert 271 not in tags and tags[272] == b"Snapper 3000"
+
+
+def test_scrub_stream_passes_a_clean_image_through():
+  data = make_jpeg()
+  dst = io.BytesIO()
+
+  removed, error = scrub_stream(io.BytesIO(data), dst, remove_all=True)
+
+  assert error == formats.base.NO_METADATA
+  assert dst.getvalue() == data
+
+
+def test_scrub_stream_writes_nothing_for_a_broken_image():
+  dst = io.BytesIO()
+
+  removed, error = scrub_stream(io.BytesIO(b"not an image"), dst, remove_all=True)
+
+  assert error.startswith("Error processing data")
+  assert dst.getvalue() == b''
+
+
+@pytest.mark.parametrize('option', [['--all'], ['--tags', 'Make,Model']])
+def test_cli_scrubs_stdin_to_stdout(tmp_path, option):
+  code, out, err = run_cli(['scrub', '-'] + option, make_jpeg(EXIF), tmp_path)
+
+  assert code == 0
+  assert "Removed 2 tag(s)." in err
+  with Image.open(io.BytesIO(out)) as img:
+    assert img.size == (32, 24)
+    assert not {271, 272} & set(img.getexif())
+
+
+def test_cli_exits_0_when_the_piped_image_has_no_metadata(tmp_path):
+  data = make_jpeg()
+
+  code, out, err = run_cli(['scrub', '-', '--all'], data, tmp_path)
+
+  assert code == 0
+  assert out == data
+  assert formats.base.NO_METADATA in err
+
+
+def test_cli_exits_1_when_the_piped_data_is_not_an_image(tmp_path):
+  code, out, err = run_cli(['scrub', '-', '--all'], b"not an image", tmp_path)
+
+  assert code == 1
+  assert out == b''
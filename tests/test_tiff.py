@@ -0,0 +1,49 @@
+import io
+
+import pytest
+from PIL import Image, TiffImagePlugin
+
+from lib.formats import tiff
+from lib.scrubber import scrub_bytes
+
+
+def make_tiff(compression=None):
+  """Returns a small TIFF with a few descriptive tags next to its structural ones."""
+  info = TiffImagePlugin.ImageFileDirectory_v2()
+  info[271] = "Acme"         #Make
+  info[272] = "Snapper 3000"  #Model
+  info[305] = "Darkroom 1.0"  #Software
+  info[315] = "Someone"      #Artist
+  out = io.BytesIO()
+  Image.new('RGB', (32, 24), (200, 40, 90)).save(out, format='TIFF', tiffinfo=info, compression=compression)
+  return out.getvalue()
+
+
+@pytest.mark.parametrize('tags', [
+  ['*'],
+  ['Image*', 'Strip*', 'Bits*', 'Photometric*', 'Compression', 'SamplesPerPixel', 'RowsPerStrip'],
+  ['all camera', 'all software', 'all author', 'Image*'],
+])
+def test_wildcard_scrub_keeps_tiff_decodable(tags):
+  data = make_tiff()
+  assert tiff.is_tiff(data)
+
+  scrubbed, removed, error = scrub_bytes(data, tags)
+
+  assert error is None
+  assert not set(removed) & {'ImageWidth', 'ImageLength', 'StripOffsets', 'StripByteCounts', 'BitsPerSample'}
+  with Image.open(io.BytesIO(scrubbed)) as img:
+    img.load()
+    assert img.size == (32, 24)
+    assert img.getpixel((0, 0)) == (200, 40, 90)
+
+
+def test_wildcard_scrub_still_removes_descriptive_tags():
+  scrubbed, removed, error = scrub_bytes(make_tiff(), ['*'])
+
+  assert error is None
+  assert {'Make', 'Model', 'Software', 'Artist'} <= set(removed)
+  with Image.open(io.BytesIO(scrubbed)) as img:
+    tags = img.getexif()
+    assert not {271, 272, 305, 315} & set(tags)
+    assert tags[256] == 32
@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from lib.output import AtomicOutput
+from lib.walker import iter_image_files
+from tests.conftest import make_jpeg
+
+
+@pytest.fixture
+def tree(tmp_path):
+  """
+  root/a.jpg, root/B.JPG, root/notes.txt, root/fake.jpg (not an image),
+  root/a_scrubbed.jpg, root/raw/c.jpg, root/raw/deep/d.jpeg, root/cache/e.jpg
+  """
+  jpeg = make_jpeg()
+  for rel_path in ('a.jpg', 'B.JPG', 'a_scrubbed.jpg', 'raw/c.jpg', 'raw/deep/d.jpeg', 'cache/e.jpg'):
+    path = tmp_path / rel_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(jpeg)
+  (tmp_path / 'notes.txt').write_text("not an image")
+  (tmp_path / 'fake.jpg').write_text("not an image either")
+  return tmp_path
+
+
+def walk(root, **options):
+  return sorted(os.path.relpath(path, root).replace(os.sep, '/') for path in iter_image_files(str(root), **options))
+
+
+def test_default_walk_finds_images_recursively(tree):
+  assert walk(tree) == ['B.JPG', 'a.jpg', 'cache/e.jpg', 'raw/c.jpg', 'raw/deep/d.jpeg']
+
+
+def test_magic_bytes_are_checked_unless_told_not_to(tree):
+  assert 'fake.jpg' not in walk(tree)
+  assert 'fake.jpg' in walk(tree, check_magic=False)
+
+
+def test_walk_without_recursion(tree):
+  assert walk(tree, recursive=False) == ['B.JPG', 'a.jpg']
+
+
+def test_include_patterns(tree):
+  assert walk(tree, include=['*.jpeg']) == ['raw/deep/d.jpeg']
+  #patterns with a slash are matched against the path relative to the root
+  assert walk(tree, include=['raw/*.jpg']) == ['raw/c.jpg']
+  assert walk(tree, include=['*.txt']) == []
+  assert walk(tree, include=['*.txt'], check_magic=False) == ['notes.txt']
+
+
+def test_exclude_patterns(tree):
+  #an excluded directory is not entered at all
+  assert walk(tree, exclude=['cache']) == ['B.JPG', 'a.jpg', 'raw/c.jpg', 'raw/deep/d.jpeg']
+  assert walk(tree, exclude=['raw/deep', 'b.jpg']) == ['a.jpg', 'cache/e.jpg', 'raw/c.jpg']
+
+
+def test_scrubbed_outputs_are_always_excluded(tree):
+  assert 'a_scrubbed.jpg' not in walk(tree, exclude=['nothing'])
+  assert 'a_scrubbed.jpg' not in walk(tree, include=['*_scrubbed.jpg'])
+
+
+def test_outputs_being_written_are_not_picked_up(tree):
+  with AtomicOutput(str(tree / 'a_clean.jpg')) as output:
+    output.file.write(make_jpeg())
+    output.file.flush()
+    hidden = [name for name in os.listdir(tree) if name.startswith('.a_clean.jpg.')]
+    assert hidden
+
+    assert walk(tree, recursive=False) == ['B.JPG', 'a.jpg']
+    #the temporary name ends in .tmp, so not even its JPEG bytes get it in
+    assert walk(tree, recursive=False, check_magic=False) == ['B.JPG', 'a.jpg', 'fake.jpg']
+
+  assert not (tree / hidden[0]).exists()
+
+
+@pytest.mark.skipif(not hasattr(os, 'symlink'), reason="needs symlinks")
+def test_symlinked_directories_are_not_followed(tree, tmp_path_factory):
+  outside = tmp_path_factory.mktemp('outside')
+  (outside / 'x.jpg').write_bytes(make_jpeg())
+  os.symlink(outside, tree / 'link')
+
+  assert 'link/x.jpg' not in walk(tree)